@@ -0,0 +1,90 @@
+"""Per-request overhead of BitMEX.call_api against a local HTTP stub.
+
+Compares the lean prepared-request path with the previous one, which ran
+Session.prepare_request, encoded the body with default separators and
+signed every request with a new APIKeyAuthWithExpires.
+
+Run: python -m benchmarks.bench_call_api
+"""
+import json
+import logging
+import time
+
+import requests
+
+from supervisor.core import settings
+from supervisor.core.api import BitMEX
+from supervisor.core.auth import APIKeyAuthWithExpires
+from supervisor.core.rate_limit import RateLimiter
+from supervisor.core.utils import codec
+from tests.stub_server import BitMEXStub
+
+REQUESTS = 2000
+
+ORDER = {'symbol': 'XBTUSD', 'ordType': 'Limit', 'orderQty': 100, 'side': 'Buy', 'price': 10000.5,
+         'execInst': 'ParticipateDoNotInitiate'}
+
+
+def old_call_api(bitmex, path, postdict, verb):
+    """call_api request path as it was before the prepared-request fast path."""
+
+    auth = APIKeyAuthWithExpires(bitmex.api_key, bitmex.api_secret)
+    data = json.dumps(postdict)
+    bitmex.logger.info("sending req to %s: %s", bitmex.base_url + path, data)
+    req = requests.Request(verb, bitmex.base_url + path, data=data, auth=auth)
+    prepped = bitmex.session.prepare_request(req)
+    response = bitmex.session.send(prepped, timeout=bitmex.timeout)
+    response.raise_for_status()
+    result = codec.loads(response.content)
+    bitmex.logger.info('req has been sent, response: %s', result)
+    return result
+
+
+def old_prepare(bitmex, path, postdict, verb):
+    auth = APIKeyAuthWithExpires(bitmex.api_key, bitmex.api_secret)
+    data = json.dumps(postdict)
+    bitmex.logger.info("sending req to %s: %s", bitmex.base_url + path, data)
+    return bitmex.session.prepare_request(requests.Request(verb, bitmex.base_url + path, data=data, auth=auth))
+
+
+def new_prepare(bitmex, path, postdict, verb):
+    data = codec.dumps(postdict).encode('utf8')
+    if bitmex.logger.isEnabledFor(logging.DEBUG):
+        bitmex.logger.debug("sending req to %s: %s", bitmex.base_url + path, data)
+    return bitmex._prepare_request(verb, bitmex.base_url + path, None, data)
+
+
+def per_request(call):
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        call()
+    return (time.perf_counter() - start) / REQUESTS * 1e6
+
+
+def main():
+    stub = BitMEXStub().start()
+    # don't let the rate limit budget pace the benchmark
+    bitmex = BitMEX(test=False, symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                    api_secret=settings.TEST_API_SECRET, init_ws=False, rate_limiter=RateLimiter(limit=10 ** 9))
+    bitmex.base_url = stub.url
+    # log records go nowhere, but are still formatted at INFO as before
+    logging.getLogger('core').handlers = [logging.NullHandler()]
+
+    try:
+        for verb, path in (('PUT', '/order/bulk'), ('POST', '/order')):
+            postdict = {'orders': []} if path == '/order/bulk' else ORDER
+            old = per_request(lambda: old_call_api(bitmex, path, postdict, verb))
+            new = per_request(lambda: bitmex.call_api(path, postdict=postdict, verb=verb))
+            print(f'{verb} {path:<12} previous path: {old:>7.0f} us/request   call_api: {new:>7.0f} us/request')
+
+        print('Building a signed request only:')
+        old = per_request(lambda: old_prepare(bitmex, '/order', ORDER, 'POST'))
+        new = per_request(lambda: new_prepare(bitmex, '/order', ORDER, 'POST'))
+        print(f'POST /order       previous path: {old:>7.1f} us/request   call_api: {new:>7.1f} us/request')
+    finally:
+        bitmex.exit()
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
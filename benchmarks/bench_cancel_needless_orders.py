@@ -0,0 +1,53 @@
+"""Supervisor.cancel_needless_orders reconciliation cost.
+
+Every case has a quarter of the real orders matching exactly, a quarter
+to be moved and a half to be cancelled.
+
+Run: python -m benchmarks.bench_cancel_needless_orders
+"""
+import logging
+import time
+from unittest.mock import Mock
+
+from supervisor import Supervisor
+from supervisor.core.orders import Order
+
+SIZES = [10, 100, 1000, 10000]
+
+
+def make_case(size):
+    needed = []
+    real = []
+    for i in range(size):
+        if i % 4 == 0:
+            needed.append(Order(order_type='Limit', qty=i + 1, price=1000 + i, side='Buy'))
+            real.append(Order(order_type='Limit', qty=i + 1, price=1000 + i, side='Buy'))
+        elif i % 4 == 1:
+            needed.append(Order(order_type='Limit', qty=i + 1, price=1000 + i, side='Sell'))
+            real.append(Order(order_type='Limit', qty=i + 1, price=999 + i, side='Sell'))
+        else:
+            real.append(Order(order_type='Stop', qty=i + 1, stop_px=500 + i, side='Sell'))
+    return needed, real
+
+
+def main():
+    exchange = Mock()
+    exchange.bulk_move_orders.side_effect = lambda orders: orders
+    supervisor = Supervisor(interface=exchange)
+    supervisor.logger.setLevel(logging.WARNING)
+
+    for size in SIZES:
+        supervisor.orders, real = make_case(size)
+        exchange.get_open_orders_ws.return_value = real
+        runs = max(1, 1000 // size)
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            supervisor.cancel_needless_orders()
+        elapsed = (time.perf_counter() - start) / runs
+
+        print(f'{size:>6} orders: {elapsed * 1000:>10.3f} ms per cycle')
+
+
+if __name__ == '__main__':
+    main()
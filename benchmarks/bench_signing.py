@@ -0,0 +1,56 @@
+"""Request signing throughput.
+
+Compares building the HMAC key per signature, as generate_signature does,
+with the Signer, which copies a keyed HMAC state prepared once.
+
+Run: python -m benchmarks.bench_signing
+"""
+import time
+
+import requests
+
+from supervisor.core import settings
+from supervisor.core.auth import APIKeyAuthWithExpires, Signer, generate_signature
+
+SIGNATURES = 100000
+
+URL = 'https://www.bitmex.com/api/v1/order'
+BODY = '{"symbol":"XBTUSD","orderQty":100,"side":"Buy","price":10000.5,"ordType":"Limit","clOrdID":"sv_abc"}'
+
+
+def rate(sign, count):
+    start = time.perf_counter()
+    for i in range(count):
+        sign(i)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    secret = settings.TEST_API_SECRET
+    signer = Signer(settings.TEST_API_KEY, secret)
+    body = BODY.encode('utf8')
+
+    def old_sign(expires):
+        generate_signature(secret, 'POST', URL, expires, BODY)
+
+    def signer_sign_url(expires):
+        signer.sign_url('POST', URL, expires, body)
+
+    def signer_sign(expires):
+        signer.sign('POST', b'/api/v1/order', expires, body)
+
+    print(f'generate_signature:   {rate(old_sign, SIGNATURES):>10.0f} signatures/s')
+    print(f'Signer.sign_url:      {rate(signer_sign_url, SIGNATURES):>10.0f} signatures/s')
+    print(f'Signer.sign:          {rate(signer_sign, SIGNATURES):>10.0f} signatures/s')
+
+    request = requests.Request('POST', URL, data=BODY).prepare()
+    auth = APIKeyAuthWithExpires(settings.TEST_API_KEY, secret)
+
+    def auth_call(_):
+        auth(request)
+
+    print(f'APIKeyAuthWithExpires: {rate(auth_call, SIGNATURES):>9.0f} requests/s')
+
+
+if __name__ == '__main__':
+    main()
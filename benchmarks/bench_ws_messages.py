@@ -0,0 +1,72 @@
+"""Websocket message handling throughput.
+
+Compares the old per-message cost (stdlib decode plus re-serialising every
+frame for the debug log) with the codec path of BitMEXWebsocket.
+
+Run: python -m benchmarks.bench_ws_messages
+"""
+import json
+import logging
+import time
+
+from supervisor.core.utils import codec
+from supervisor.core.ws_thread import BitMEXWebsocket
+
+MESSAGES = 20000
+
+
+def make_messages(count):
+    instruments = [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10000, 'bidPrice': 9999.5,
+                    'askPrice': 10000.5, 'markPrice': 10000, 'timestamp': '2020-01-01T00:00:00.000Z'}]
+    book = [{'symbol': 'XBTUSD', 'id': i, 'side': 'Sell' if i < 25 else 'Buy', 'size': 100,
+             'price': 10000 + 25 - i} for i in range(50)]
+    messages = [
+        json.dumps({'table': 'instrument', 'action': 'partial', 'keys': ['symbol'], 'data': instruments}),
+        json.dumps({'table': 'orderBookL2_25', 'action': 'partial', 'keys': ['symbol', 'id', 'side'], 'data': book}),
+    ]
+    for i in range(count):
+        if i % 2:
+            messages.append(json.dumps({'table': 'instrument', 'action': 'update', 'data': [
+                {'symbol': 'XBTUSD', 'lastPrice': 10000 + i % 10, 'timestamp': '2020-01-01T00:00:00.000Z'}]}))
+        else:
+            messages.append(json.dumps({'table': 'orderBookL2_25', 'action': 'update', 'data': [
+                {'symbol': 'XBTUSD', 'id': i % 50, 'side': 'Sell' if i % 50 < 25 else 'Buy', 'size': i}]}))
+    return messages
+
+
+def rate(handler, messages):
+    start = time.perf_counter()
+    for message in messages:
+        handler(message)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    logging.getLogger('core').setLevel(logging.INFO)
+    messages = make_messages(MESSAGES)
+
+    def old_decode(message):
+        json.dumps(json.loads(message))
+
+    print(f'decode, stdlib json + debug re-serialisation: {rate(old_decode, messages):>10.0f} msg/s')
+    print(f'decode, codec ({codec.NAME}):{"":<21}{rate(codec.loads, messages):>10.0f} msg/s')
+
+    ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None)
+    print(f'BitMEXWebsocket message handler:{"":<13}{rate(ws._BitMEXWebsocket__on_message, messages):>10.0f} msg/s')
+
+    # instrument updates merged and applied on reads, one read per 10 messages
+    ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None, conflate={'instrument': 0})
+    handler = ws._BitMEXWebsocket__on_message
+
+    def conflated(message, counter=iter(range(len(messages) * 2))):
+        handler(message)
+        if next(counter) % 10 == 0:
+            ws.get_instrument('XBTUSD')
+
+    print(f'BitMEXWebsocket handler, conflated:{"":<10}{rate(conflated, messages):>10.0f} msg/s')
+    stats = ws.conflation_metrics()['instrument']
+    print(f'  instrument updates received/merged/applied: {stats["received"]}/{stats["merged"]}/{stats["applied"]}')
+
+
+if __name__ == '__main__':
+    main()
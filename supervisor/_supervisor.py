@@ -1,17 +1,22 @@
+from collections import defaultdict, deque
 from time import sleep
 from threading import Thread, Event
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, RequestException
 
-from supervisor.core.orders import Order
+from supervisor.core.orders import Order, new_clordid
 from supervisor.core.utils.math import to_nearest
 from supervisor.core.trailing_orders import TrailingShell
+from supervisor.core.utils.errors import MaxRetriesReachedError
 from supervisor.core.utils.log import setup_supervisor_logger
 
 
 class Supervisor:
     """Class with high-level trading features."""
 
-    def __init__(self, *, interface):
+    # websocket tables, changes of which trigger synchronization
+    SYNC_TABLES = ('order', 'position')
+
+    def __init__(self, *, interface, max_idle_interval: float = 0.25, bulk_chunk_size: int = 10):
         self.exchange = interface
 
         self.manage_orders = True
@@ -28,6 +33,15 @@ class Supervisor:
         self._run_thread = Event()  # when event is set, cycle is running
         self._stopped = Event()  # stop thread confirmation
 
+        # Cycle sleeps until a websocket table or supervised state changes,
+        # but not longer than max_idle_interval seconds.
+        self.max_idle_interval = max_idle_interval
+        self._wake_up = Event()
+        self.exchange.add_update_listener(self._on_exchange_update, tables=self.SYNC_TABLES)
+
+        # max number of orders placed with a single bulk request
+        self.bulk_chunk_size = bulk_chunk_size
+
     ###########################
     # Synchronization methods #
     ###########################
@@ -35,10 +49,11 @@ class Supervisor:
     def _synchronization_cycle(self):
         while True:
 
-            # keep ws connection open
+            # keep ws connection open, dropped connections are reopened by the websocket,
+            # so this happens only after a fatal error
             if not self.exchange.is_open():
                 self.logger.warning('Websocket connection unexpectedly closed, restarting...')
-                self.exchange.reinit_ws()
+                self.exchange.restart_ws()
                 continue
 
             # if exit Event were sent, exiting cycle
@@ -47,16 +62,33 @@ class Supervisor:
 
             # if all right, do the job)
             if self._run_thread.is_set():
-                # Synchronize all here
-                if self.manage_orders:
-                    self.sync_orders()
-                if self.manage_position:
-                    self.sync_position()
+                # changes made while synchronizing will wake up the next cycle
+                self._wake_up.clear()
+                # Synchronize all here, but not by data of a dropped connection,
+                # the resynced tables wake up the cycle
+                if not self.exchange.is_synced():
+                    self.logger.debug('Websocket tables are being resynced, skip synchronization.')
+                else:
+                    if self.manage_orders:
+                        self._run_sync_step(self.sync_orders)
+                    if self.manage_position:
+                        self._run_sync_step(self.sync_position)
             # if it`s not all right, enter the stopped condition
             else:
                 self._stopped.set()
                 self._run_thread.wait()
-            sleep(0.1)
+            self._wake_up.wait(self.max_idle_interval)
+
+    def _run_sync_step(self, step):
+        """Run a synchronization step, failed requests are logged and the step is repeated next cycle."""
+
+        try:
+            step()
+        except (MaxRetriesReachedError, RequestException) as e:
+            self.logger.warning(f'Synchronization failed, retrying in the next cycle: {e!r}')
+
+    def _on_exchange_update(self, table):
+        self._wake_up.set()
 
     def sync_position(self):
         pos_size = self.exchange.get_position_size_ws()
@@ -82,68 +114,188 @@ class Supervisor:
             - order is filled. We need not place it anymore, so just forget this order.
         """
 
+        # orders may be added or placed by other threads, so statuses are paired with one snapshot
         orders_to_place = []
-        for order in self.orders:
+        placed_orders = []
+        for order in self.orders.copy():
             if order.order_id is None:
                 orders_to_place.append(order)
             else:
-                status = self.exchange.get_order_status_ws(order)
-                if status in ['Filled', 'Triggered']:
-
-                    if order.is_trailing:
-                        order.tracker.exit()
-                    self.orders.remove(order)
-
-                    if order.side == 'Buy':
-                        self.position_size += order.qty
-                    else:
-                        self.position_size -= order.qty
-                    self.logger.info(f'Order filled: {order.order_id} {order.order_type} {order.side} {order.qty} by '
-                                     f'{order.price or order.stop_px}')
-                    order.on_fill()
-                elif status == 'Canceled':
-                    orders_to_place.append(order)
-                    self.logger.info(f'Order cancelled, trying to place it: '
-                                     f'{order.order_type} {order.side} {order.qty} by {order.price or order.stop_px}')
-                elif status == 'Rejected':
-                    self.orders.remove(order)
-                    self.logger.info(f'Order rejected: {order.order_id} {order.order_type} '
-                                     f'{order.side} {order.qty} by {order.price or order.stop_px}')
-                    order.on_reject()
+                placed_orders.append(order)
+
+        # look up statuses of all placed orders at once
+        statuses = self.exchange.get_order_statuses_ws(placed_orders) if placed_orders else []
+        for order, status in zip(placed_orders, statuses):
+            if status in ['Filled', 'Triggered']:
+
+                if order.is_trailing:
+                    order.tracker.exit()
+                self.orders.remove(order)
+
+                if order.side == 'Buy':
+                    self.position_size += order.qty
+                else:
+                    self.position_size -= order.qty
+                self.logger.info(f'Order filled: {order.order_id} {order.order_type} {order.side} {order.qty} by '
+                                 f'{order.price or order.stop_px}')
+                order.on_fill()
+            elif status == 'Canceled':
+                orders_to_place.append(order)
+                self.logger.info(f'Order cancelled, trying to place it: '
+                                 f'{order.order_type} {order.side} {order.qty} by {order.price or order.stop_px}')
+            elif status == 'Rejected':
+                self.orders.remove(order)
+                self.logger.info(f'Order rejected: {order.order_id} {order.order_type} '
+                                 f'{order.side} {order.qty} by {order.price or order.stop_px}')
+                order.on_reject()
         self.place_needed_orders(orders_to_place)
 
     def place_needed_orders(self, orders_to_place: list):
+        """Place orders, several ones with bulk requests of bulk_chunk_size orders.
+
+        If a bulk request is rejected, orders of its chunk are placed one by one,
+        so an invalid order doesn`t prevent placing the others. If it fails to get
+        a response, the next chunks are still placed and the chunk is tried again next cycle.
+        Every order gets a new clOrdID, so timed out requests may be retried safely.
+        """
+
+        for order in orders_to_place:
+            # a cancelled order is placed anew, its old clOrdID can't be used again
+            if order.clordid is None or order.order_id is not None:
+                order.clordid = new_clordid()
+
+        if len(orders_to_place) == 1:
+            self._place_single_order(orders_to_place[0])
+            return
+
+        for i in range(0, len(orders_to_place), self.bulk_chunk_size):
+            chunk = orders_to_place[i:i + self.bulk_chunk_size]
+            try:
+                self.exchange.bulk_place_orders(chunk)
+            except HTTPError as e:
+                self.logger.warning(f'Failed to place {len(chunk)} orders at once, placing them one by one: '
+                                    f'{e.response.text}')
+                for order in chunk:
+                    self._place_single_order(order)
+            except (MaxRetriesReachedError, RequestException) as e:
+                # the orders keep their clOrdIDs, so placing them again in the next cycle is safe
+                self.logger.warning(f'Failed to place {len(chunk)} orders at once, retrying in the next cycle: {e!r}')
+            else:
+                for order in chunk:
+                    self.logger.info(f'Place {order.order_type} order: '
+                                     f'{order.side} {order.qty} by {order.price or order.stop_px}.')
+
+    def move_orders(self, orders_to_move: list):
+        """Amend orders, several ones with bulk requests of bulk_chunk_size orders.
+
+        If a bulk request is rejected, orders of its chunk are amended one by one.
+        If it fails to get a response, the next chunks are still amended.
+        """
+
+        if len(orders_to_move) == 1:
+            self._move_single_order(orders_to_move[0])
+            return
+
+        for i in range(0, len(orders_to_move), self.bulk_chunk_size):
+            chunk = orders_to_move[i:i + self.bulk_chunk_size]
+            try:
+                moved_orders = self.exchange.bulk_move_orders(chunk)
+            except HTTPError as e:
+                self.logger.warning(f'Failed to move {len(chunk)} orders at once, moving them one by one: '
+                                    f'{e.response.text}')
+                for order in chunk:
+                    self._move_single_order(order)
+            except (MaxRetriesReachedError, RequestException) as e:
+                self.logger.warning(f'Failed to move {len(chunk)} orders at once, retrying in the next cycle: {e!r}')
+            else:
+                for o in moved_orders:
+                    self.logger.info(f'Moved {o.order_type} order with {o.qty} quantity.')
+
+    def _move_single_order(self, order):
         try:
-            for order in orders_to_place:
-                self.exchange.place_order(order)
-                self.logger.info(f'Place {order.order_type} order: '
-                                 f'{order.side} {order.qty} by {order.price or order.stop_px}.')
+            self.exchange.move_order(order=order)
+            self.logger.info(f'Moved {order.order_type} order with {order.qty} quantity.')
+        except HTTPError as e:
+            self.logger.warning(f'Failed to move {order.order_type} order with {order.qty} quantity: '
+                                f'{e.response.text}')
+        except (MaxRetriesReachedError, RequestException) as e:
+            self.logger.warning(f'Failed to move {order.order_type} order with {order.qty} quantity: {e!r}')
+
+    def _place_single_order(self, order):
+        try:
+            self.exchange.place_order(order)
+            self.logger.info(f'Place {order.order_type} order: '
+                             f'{order.side} {order.qty} by {order.price or order.stop_px}.')
         except HTTPError as e:
             if 'Order price is above the liquidation price of current' in e.response.text:
-                order = orders_to_place[0]
                 self.orders.remove(order)
                 self.logger.warning(f'Order price is above the liquidation price of current position: '
                                     f'{order.order_type} {order.side} {order.qty} by {order.price or order.stop_px}')
+            else:
+                self.logger.warning(f'Failed to place {order.order_type} order: '
+                                    f'{order.side} {order.qty} by {order.price or order.stop_px}: {e.response.text}')
+        except (MaxRetriesReachedError, RequestException) as e:
+            self.logger.warning(f'Failed to place {order.order_type} order: '
+                                f'{order.side} {order.qty} by {order.price or order.stop_px}: {e!r}')
 
     def cancel_needless_orders(self):
-        real_orders = self.exchange.get_open_orders_ws().copy()
-        needed_orders = self.orders.copy()
-
-        # difference of the lists with duplicates
-        for _ in range(len(real_orders)):
-            for o in real_orders:
-                if o in needed_orders:
-                    real_orders.remove(o)
-                    needed_orders.remove(o)
-
-        orders_to_cancel = real_orders
-
-        for o_to_c in orders_to_cancel:
-            for o in needed_orders:
-                if o.almost_equal(o_to_c):
-                    self.exchange.move_order(order=o)
-                    orders_to_cancel.remove(o_to_c)
-                    self.logger.info(f'Moved {o.order_type} order with {o.qty} quantity.')
+        """Cancel real orders, which are not needed, and amend ones that differ from needed only in price.
+
+        Real orders are matched to the needed orders placed as them by orderID, the rest are matched to unplaced
+        needed orders by their cached comparison keys in dicts, so the cost is linear in number of orders.
+        """
+
+        real_orders = self.exchange.get_open_orders_ws()
+
+        orders_to_move = []
+        orders_to_cancel = []
+
+        # real orders are matched to the needed orders placed as them first
+        needed_by_id = {order.order_id: order for order in self.orders if order.order_id is not None}
+        foreign_orders = []
+        for order in real_orders:
+            own_order = needed_by_id.pop(order.order_id, None) if order.order_id is not None else None
+            if own_order is None:
+                foreign_orders.append(order)
+            elif own_order.comparison_key != order.comparison_key:
+                if own_order.not_price_comparison_key == order.not_price_comparison_key:
+                    orders_to_move.append(own_order)
+                else:
+                    orders_to_cancel.append(order)
+
+        # unplaced needed orders may take the place of the rest, difference of the lists with duplicates
+        needed_by_params = defaultdict(deque)
+        for order in self.orders:
+            if order.order_id is None:
+                needed_by_params[order.comparison_key].append(order)
+
+        unmatched_orders = []
+        for order in foreign_orders:
+            same_needed_orders = needed_by_params.get(order.comparison_key)
+            if same_needed_orders:
+                same_needed_orders.popleft()
+            else:
+                unmatched_orders.append(order)
+
+        # needed orders without exact match may be moved instead of cancelling real ones
+        movable_orders = defaultdict(deque)
+        for orders in needed_by_params.values():
+            for order in orders:
+                movable_orders[order.not_price_comparison_key].append(order)
+
+        for order in unmatched_orders:
+            almost_equal_orders = movable_orders.get(order.not_price_comparison_key)
+            if almost_equal_orders:
+                o = almost_equal_orders.popleft()
+                # amend the real order to the needed price
+                if order.order_id is not None:
+                    o.order_id = order.order_id
+                    o.clordid = order.clordid
+                orders_to_move.append(o)
+            else:
+                orders_to_cancel.append(order)
+
+        self.move_orders(orders_to_move)
 
         if len(orders_to_cancel) > 0:
             self.exchange.bulk_cancel_orders(orders_to_cancel)
@@ -159,6 +311,7 @@ class Supervisor:
     def enter_by_market_order(self, qty: int) -> None:
         self.exchange.place_market_order(qty=qty)
         self.position_size += qty
+        self._wake_up.set()
         self.logger.info(f'Enter position by market order on {qty} contracts.')
 
     def enter_fb_method(self, qty: int, price_type: str, timeout: int, max_retry: int, deviation: int = None) -> None:
@@ -209,6 +362,7 @@ class Supervisor:
     def add_order(self, order: Order) -> None:
         if order.is_valid():
             self.orders.append(order)
+            self._wake_up.set()
             self.logger.info(f'New order: {order.order_type} {order.side} {order.qty} by '
                              f'{order.price or order.stop_px}')
         else:
@@ -224,14 +378,17 @@ class Supervisor:
         if order.is_valid():
             order.is_trailing = True
             tick_size = self.exchange.conn.get_tick_size()
-            test = 'testnet' in self.exchange.conn.base_url
-            order.tracker = TrailingShell(order=order, offset=offset, tick_size=tick_size, test=test)
+            # all trackers share the exchange websocket prices, moves wake up the cycle
+            order.tracker = TrailingShell(order=order, offset=offset, tick_size=tick_size,
+                                          price_feed=self.exchange.get_price_feed(), on_move=self._wake_up.set)
             order.tracker.start_trailing(initial_price=self.exchange.get_last_price_ws())
             self.orders.append(order)
+            self._wake_up.set()
 
     def remove_order(self, order: Order):
         if order in self.orders:
             self.orders.remove(order)
+            self._wake_up.set()
             self.logger.info(f'Forget the order: {order.order_type} {order.side} {order.qty} by '
                              f'{order.price or order.stop_px}')
 
@@ -252,15 +409,19 @@ class Supervisor:
     def stop_cycle(self):
         if self._run_thread.is_set():
             self._run_thread.clear()
+            self._wake_up.set()
             self._stopped.wait()
             self.logger.info(f'Supervisor cycle has been stopped.')
 
     def _continue_cycle(self):
         self._run_thread.set()
         self._stopped.clear()
+        self._wake_up.set()
         self.logger.info(f'Supervisor cycle has been continued.')
 
     def exit_cycle(self):
+        # the exchange may outlive this supervisor, don't leave the callback in its websocket
+        self.exchange.remove_update_listener(self._on_exchange_update)
         self._exit_sync_thread.set()
         # if cycle cannot reach exit_sync_thread check, release it
         if self._stopped:
@@ -274,3 +435,4 @@ class Supervisor:
     def reset(self):
         self.position_size = 0
         self.orders = []
+        self._wake_up.set()
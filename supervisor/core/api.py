@@ -1,48 +1,157 @@
 """BitMEX API Connector."""
 import requests
-import time
 import datetime
+import time
 import json
 import logging
-
-from supervisor.core.auth import APIKeyAuthWithExpires
+import threading
+from urllib.parse import urlencode
+
+from supervisor.core.auth import APIKeyAuthWithExpires, url_path
+from supervisor.core.http import PoolAdapter, connection_stats
+from supervisor.core.price_feed import PriceFeed
+from supervisor.core.rate_limit import RateLimiter
+from supervisor.core.retry import Retry, RetryPolicy
 from supervisor.core.ws_thread import BitMEXWebsocket
 from supervisor.core import settings
-from supervisor.core.utils import errors
+from supervisor.core.utils import codec, errors
 from supervisor.core.utils.log import setup_api_logger
+from supervisor.core.utils.stats import LatencyStats
 
 
 # https://www.bitmex.com/api/explorer/
 class BitMEX(object):
 
-    def __init__(self, test=True, symbol=None, api_key=None, api_secret=None, init_ws=True):
+    def __init__(self, test=True, symbol=None, api_key=None, api_secret=None, init_ws=True, ws_table_capacity=None,
+                 rate_limiter=None, retry_policy=None, timeout=7, pool_connections=4, pool_maxsize=20,
+                 pool_block=False, tcp_keepalive=True, warm_up=False, ws_connect_timeout=5, ws_partials_timeout=60,
+                 ws_ping_interval=5, ws_pong_timeout=5, ws_queue_size=10000, ws_overflow='block', ws_conflate=None):
+        """
+
+        :param pool_maxsize: max number of kept-alive connections to the host, threads over it open extra ones
+            or wait if pool_block is set
+        :param warm_up: open a connection to the REST API, while the websocket partials are loading
+        :param ws_connect_timeout: seconds to wait for the websocket to open
+        :param ws_partials_timeout: seconds to wait for the initial images of the subscribed tables
+        :param ws_ping_interval: seconds of websocket silence, after which a ping is sent
+        :param ws_pong_timeout: seconds to wait for the pong before the websocket is reconnected
+        :param ws_queue_size: max number of websocket frames waiting to be applied to tables
+        :param ws_overflow: what the websocket does when the queue is full, 'block' or 'resync',
+            see BitMEXWebsocket
+        :param ws_conflate: {table: seconds}, market data tables, whose updates are merged and applied
+            at most once in the given seconds, see BitMEXWebsocket
+        """
+
         self.logger = setup_api_logger('core', logging.INFO)
         self.base_url = settings.BASE_URL if not test else settings.BASE_TEST_URL
         self.symbol = symbol
         self.api_key = api_key
         self.api_secret = api_secret
+        # Auth: API Key/Secret, the keyed signer is built once and shared with the websocket
+        self.auth = APIKeyAuthWithExpires(api_key, api_secret) if api_secret is not None else None
 
         # Prepare HTTPS session
         self.session = requests.Session()
+        self.adapter = PoolAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   pool_block=pool_block, tcp_keepalive=tcp_keepalive)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.response_times = LatencyStats()  # time to the response headers
         # These headers are always sent
         self.session.headers.update({'content-type': 'application/json'})
         self.session.headers.update({'accept': 'application/json'})
+        # session headers merged once, every request starts from a copy of them
+        self._headers_template = self.session.headers.copy()
+        if self.auth is not None:
+            self._headers_template['api-key'] = self.auth.apiKey
+
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.timeout = timeout  # seconds to wait for a response
 
-        self.retries = 0  # initialize counter
+        # requests wait here for their share of the rate limit, cancels first
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
 
         self.init_ws = init_ws
+        self.ws_table_capacity = ws_table_capacity
+        self.ws_options = {'connect_timeout': ws_connect_timeout, 'partials_timeout': ws_partials_timeout,
+                           'ping_interval': ws_ping_interval, 'pong_timeout': ws_pong_timeout,
+                           'queue_size': ws_queue_size, 'overflow': ws_overflow, 'conflate': ws_conflate}
+        self.ws_listeners = []  # kept here to survive websocket re-initialization
+        self.price_feed = PriceFeed()
+
+        warm_up_thread = None
+        if warm_up:
+            # DNS, TCP and TLS setup happens here instead of on the first order
+            warm_up_thread = threading.Thread(target=self.warm_up, daemon=True)
+            warm_up_thread.start()
 
         if self.init_ws:
             # Create websocket for streaming data
-            self.ws = BitMEXWebsocket(self.base_url, api_key, api_secret)
+            self.ws = BitMEXWebsocket(self.base_url, api_key, api_secret, table_capacity=ws_table_capacity,
+                                      price_feed=self.price_feed, signer=self.signer, **self.ws_options)
             self.ws.connect(symbol=self.symbol, shouldAuth=True)
 
+        if warm_up_thread is not None:
+            warm_up_thread.join(self.timeout)
+
+    def warm_up(self):
+        """Open a pooled connection to the REST API, errors are ignored."""
+
+        started = time.perf_counter()
+        try:
+            # sent like API requests, so the connection lands in the same pool and takes a token of the budget
+            self.rate_limiter.acquire(RateLimiter.lane_for('HEAD'))
+            self.session.send(self._prepare_request('HEAD', self.base_url, None, b''), timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self.logger.warning('REST connection warm-up failed: %s', e)
+        else:
+            self.logger.info('REST connection warmed up in %.3fs.', time.perf_counter() - started)
+
     def reinit_ws(self):
         if self.init_ws:
             del self.ws
 
-            self.ws = BitMEXWebsocket(self.base_url, self.api_key, self.api_secret)
+            self.ws = BitMEXWebsocket(self.base_url, self.api_key, self.api_secret,
+                                      table_capacity=self.ws_table_capacity, price_feed=self.price_feed,
+                                      signer=self.signer, **self.ws_options)
+            self.ws.listeners = list(self.ws_listeners)
             self.ws.connect(symbol=self.symbol, shouldAuth=True)
+            self.logger.info('Websocket reconnected in %.3fs.', self.ws.startup_metrics['startup_time'])
+
+    def ws_startup_metrics(self):
+        """Seconds the websocket took to open and to get the partials of each table, None without websocket."""
+        return self.ws.startup_metrics if self.init_ws else None
+
+    @property
+    def signer(self):
+        return self.auth.signer if self.auth is not None else None
+
+    def rate_limit_metrics(self):
+        """Get usage of the REST rate limit budget."""
+        return self.rate_limiter.metrics()
+
+    def http_stats(self):
+        """Get connection reuse of pooled hosts and time to the first byte of REST responses, in seconds."""
+        return {
+            'pools': connection_stats(self.adapter),
+            'response_time': self.response_times.snapshot(),
+        }
+
+    def retry_metrics(self):
+        """Get number of REST request attempts, failures by reason and time spent waiting for retries."""
+        return self.retry_policy.metrics()
+
+    def add_ws_listener(self, callback, tables=None):
+        """Subscribe callback(table) to websocket table changes."""
+        self.ws_listeners.append((callback, set(tables) if tables is not None else None))
+        if self.init_ws:
+            self.ws.add_listener(callback, tables)
+
+    def remove_ws_listener(self, callback):
+        """Unsubscribe callback from websocket table changes."""
+        self.ws_listeners = [(c, t) for c, t in self.ws_listeners if c != callback]
+        if self.init_ws:
+            self.ws.remove_listener(callback)
 
     # Public methods ws
     def ticker_data(self):
@@ -64,6 +173,10 @@ class BitMEX(object):
         """Get orderbook."""
         return self.ws.get_order_book(depth=depth)
 
+    def l2_book(self):
+        """Get sorted L2 orderbook structure."""
+        return self.ws.get_order_book_l2()
+
     def recent_trades(self):
         """Get recent trades."""
         return self.ws.recent_trades()
@@ -127,11 +240,26 @@ class BitMEX(object):
         """Get all orders"""
         return self.ws.get_orders(symbol=self.symbol)
 
+    @authentication_required
+    def get_order_status(self, orderID=None, clOrdID=None):
+        """Get status of an order by its id or clOrdID."""
+        return self.ws.get_order_status(order_id=orderID, clordid=clOrdID)
+
+    @authentication_required
+    def get_order_statuses(self, identifiers):
+        """Get statuses of orders by list of (orderID, clOrdID) pairs."""
+        return self.ws.get_order_statuses(identifiers)
+
     @authentication_required
     def open_orders(self):
         """Get open orders."""
         return self.ws.open_orders()
 
+    @authentication_required
+    def open_order_objects(self):
+        """Get open orders as Order objects, reused until their rows change."""
+        return self.ws.open_order_objects()
+
     @authentication_required
     def filled_orders(self):
         """Get filled orders."""
@@ -681,7 +809,7 @@ class BitMEX(object):
 
     @authentication_required
     def order_bulk_edit(self, orders=None, postdict=None):
-        """Cancel order(s). Send multiple order IDs to cancel in bulk."""
+        """Amend multiple orders for the same symbol."""
         if postdict is None:
             postdict = {
                 'orders': orders if orders else '',
@@ -707,7 +835,7 @@ class BitMEX(object):
                 'timeout': timeout if timeout else 0,
             }
         path = "/order/cancelAllAfter"
-        return self.call_api(path=path, postdict=postdict, verb="POST")
+        return self.call_api(path=path, postdict=postdict, verb="POST", lane='cancel')
 
     @authentication_required
     def order_book_l2(self, symbol=None, depth=None, query=None):
@@ -1107,25 +1235,26 @@ class BitMEX(object):
         path = "/userEvent"
         return self.call_api(path=path, query=query, verb="GET")
 
-    def call_api(self, path, query=None, postdict=None, timeout=7, verb=None, rethrow_errors=True,
-                 max_retries=None):
-        """Send a request to BitMEX Servers."""
+    def call_api(self, path, query=None, postdict=None, timeout=None, verb=None, rethrow_errors=True,
+                 max_retries=None, lane=None):
+        """Send a request to BitMEX Servers.
+
+        The request waits for a token of its rate limit lane, by default chosen by verb.
+        """
         # Handle URL
         url = self.base_url + path
+        if timeout is None:
+            timeout = self.timeout
 
         # Default to POST if data is attached, GET otherwise
         if not verb:
             verb = 'POST' if postdict else 'GET'
 
-        # By default don't retry POST or PUT. Retrying GET/DELETE is okay because they are idempotent.
-        # In the future we could allow retrying PUT, so long as 'leavesQty' is not used (not idempotent),
-        # or you could change the clOrdID (set {"clOrdID": "new", "origClOrdID": "old"}) so that an amend
-        # can't erroneously be applied twice.
-        if max_retries is None:
-            max_retries = 0 if verb in ['POST', 'PUT'] else 3
-
-        # Auth: API Key/Secret
-        auth = APIKeyAuthWithExpires(self.api_key, self.api_secret)
+        # By default don't retry POST or PUT, see RetryPolicy. Retrying GET/DELETE is okay because they are
+        # idempotent. Orders and amends with a new clOrdID ({"clOrdID": "new", "origClOrdID": "old"} for amends)
+        # can't erroneously be applied twice, a repeated request is rejected as duplicate and recovered below.
+        if max_retries is None and verb in ('POST', 'PUT') and self._has_clordids(postdict):
+            max_retries = self.retry_policy.idempotent_retries
 
         def exit_or_throw(e):
             if rethrow_errors:
@@ -1133,21 +1262,24 @@ class BitMEX(object):
             else:
                 exit(1)
 
-        def retry():
-            if self.retries > max_retries:
-                raise errors.MaxRetriesReachedError("Max retries on %s (%s) hit, raising." % (path, json.dumps(postdict or '')))
-            return self.call_api(path, query, postdict, timeout, verb, rethrow_errors, max_retries)
+        return self.retry_policy.call(
+            lambda: self._call_api_once(url, path, query, postdict, timeout, verb, exit_or_throw, lane),
+            verb, max_retries=max_retries, description='%s %s' % (verb, path)
+        )
+
+    def _call_api_once(self, url, path, query, postdict, timeout, verb, exit_or_throw, lane):
+        """Make one attempt of a request, raise Retry if it may be repeated."""
 
-        # Make the request
         response = None
         try:
-            data = json.dumps(postdict)
-            if data == 'null':
-                data = ''
-            self.logger.info("sending req to %s: %s" % (url, data or query or ''))
-            req = requests.Request(verb, url, data=data, auth=auth, params=query, )
-            prepped = self.session.prepare_request(req)
+            data = codec.dumps(postdict).encode('utf8') if postdict is not None else b''
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("sending req to %s: %s", url, data or query or "")
+            self.rate_limiter.acquire(lane or RateLimiter.lane_for(verb))
+            prepped = self._prepare_request(verb, url, query, data)
             response = self.session.send(prepped, timeout=timeout)
+            self.response_times.record(response.elapsed.total_seconds())
+            self.rate_limiter.update(response.headers)
             # Make non-200s throw
             response.raise_for_status()
 
@@ -1167,58 +1299,41 @@ class BitMEX(object):
             # 404, can be thrown if order canceled or does not exist.
             elif response.status_code == 404:
                 if verb == 'DELETE':
-                    self.logger.error("Order not found: %s" % postdict['orderID'])
+                    self.logger.error("Order not found: %s" % (postdict.get('orderID') or postdict.get('clOrdID')))
                     return
                 self.logger.error("Unable to contact the BitMEX API (404). " +
                                   "Request: %s \n %s" % (url, json.dumps(postdict)))
                 exit_or_throw(e)
 
-            # 429, ratelimit; cancel orders & wait until X-RateLimit-Reset
+            # 429, ratelimit; hold all lanes until X-RateLimit-Reset
             elif response.status_code == 429:
-                self.logger.error("Ratelimited on current request. Sleeping, then trying again. Try fewer " +
+                self.logger.error("Ratelimited on current request. Waiting, then trying again. Try fewer " +
                                   "order pairs or contact support@bitmex.com to raise your limits. " +
                                   "Request: %s \n %s" % (url, json.dumps(postdict)))
                 # Figure out how long we need to wait.
                 ratelimit_reset = response.headers['X-RateLimit-Reset']
-                to_sleep = int(ratelimit_reset) - int(time.time())
                 reset_str = datetime.datetime.fromtimestamp(int(ratelimit_reset)).strftime('%X')
 
-                self.logger.error("Your ratelimit will reset at %s. Sleeping for %d seconds." % (reset_str, to_sleep))
-                time.sleep(to_sleep)
+                self.logger.error("Your ratelimit will reset at %s." % reset_str)
+                self.rate_limiter.throttle(int(ratelimit_reset))
 
-                # Retry the request.
-                return retry()
+                # Retry the request, it waits in its lane until the reset.
+                raise Retry('429', delay=0, processed=False)
 
             # 503 - BitMEX temporary downtime, likely due to a deploy. Try again
             elif response.status_code == 503:
                 self.logger.warning("Unable to contact the BitMEX API (503), retrying. " +
                                     "Request: %s \n %s" % (url, json.dumps(postdict)))
-                time.sleep(3)
-                return retry()
+                raise Retry('503', processed=False)
 
             elif response.status_code == 400:
-                error = response.json()['error']
+                error = codec.loads(response.content)['error']
                 message = error['message'].lower() if error else ''
 
-                # Duplicate clOrdID: that's fine, probably a deploy, go get the order(s) and return it
+                # Duplicate clOrdID: that's fine, probably a retry of a timed out request, go get the order(s)
+                # and return it
                 if 'duplicate clordid' in message:
-                    orders = postdict['orders'] if 'orders' in postdict else postdict
-
-                    ids = json.dumps({'clOrdID': [order['clOrdID'] for order in orders]})
-                    order_results = self.call_api('/order', query={'filter': ids}, verb='GET')
-
-                    for i, order in enumerate(order_results):
-                        if (
-                                order['orderQty'] != abs(postdict['orderQty']) or
-                                order['side'] != ('Buy' if postdict['orderQty'] > 0 else 'Sell') or
-                                order['price'] != postdict['price'] or
-                                order['symbol'] != postdict['symbol']):
-                            raise errors.DuplicateClordid('Attempted to recover from duplicate clOrdID, but order '
-                                                          'returned from API ' +
-                                                          'did not match POST.\nPOST data: %s\nReturned order: %s' % (
-                                                              json.dumps(orders[i]), json.dumps(order)))
-                    # All good
-                    return order_results
+                    return self._recover_duplicate_clordid(postdict)
 
                 elif 'insufficient available balance' in message:
                     self.logger.error('Account out of funds. The message: %s' % error['message'])
@@ -1232,20 +1347,89 @@ class BitMEX(object):
         except requests.exceptions.Timeout as e:
             # Timeout, re-run this request
             self.logger.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(postdict or '')))
-            return retry()
+            raise Retry('timeout')
 
         except requests.exceptions.ConnectionError as e:
             self.logger.warning("Unable to contact the BitMEX API (%s). Please check the URL. Retrying. " +
                                 "Request: %s %s \n %s" % (e, url, json.dumps(postdict)))
-            time.sleep(1)
-            return retry()
+            raise Retry('connection error')
 
-        # Reset retry counter on success
-        self.retries = 0
+        result = codec.loads(response.content)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('req has been sent, response: %s', result)
 
-        self.logger.info(f'req has been sent, response: {response.json()}')
+        return result
+
+    def _prepare_request(self, verb, url, query, data):
+        """Build a signed request without Session.prepare_request.
+
+        Headers come from the pre-merged template and the signature is made over the exact body bytes sent.
+        """
+
+        query_string = urlencode([(k, v) for k, v in query.items() if v is not None], doseq=True) if query else ''
+        if query_string:
+            url = url + '?' + query_string
+
+        prepped = requests.PreparedRequest()
+        prepped.method = verb
+        prepped.url = url
+        prepped.body = data or None
+        prepped.headers = self._headers_template.copy()
+        if data or verb not in ('GET', 'HEAD'):
+            prepped.headers['Content-Length'] = str(len(data))
+
+        if self.auth is not None:
+            # requests expire in 60s, a grace period for clock skew and network delays
+            expires = int(round(time.time()) + 60)
+            prepped.headers['api-expires'] = str(expires)
+            prepped.headers['api-signature'] = self.auth.signer.sign(verb, url_path(url), expires, data)
+        return prepped
+
+    # order fields, which must match the request when an order is recovered after duplicate clOrdID
+    DUPLICATE_CHECK_KEYS = ('symbol', 'ordType', 'price', 'stopPx')
+
+    @staticmethod
+    def _has_clordids(postdict):
+        if not isinstance(postdict, dict):
+            return False
+        orders = postdict['orders'] if 'orders' in postdict else [postdict]
+        return bool(orders) and all(isinstance(order, dict) and order.get('clOrdID') for order in orders)
+
+    def _recover_duplicate_clordid(self, postdict):
+        """Return orders already created or amended by a request with the same clOrdIDs.
+
+        :raise DuplicateClordid: if the orders found don't match the request.
+        """
 
-        return response.json()
+        orders = postdict['orders'] if 'orders' in postdict else [postdict]
+
+        ids = json.dumps({'clOrdID': [order['clOrdID'] for order in orders]})
+        order_results = self.call_api('/order', query={'filter': ids}, verb='GET')
+        results_by_clordid = {order['clOrdID']: order for order in order_results}
+
+        recovered = []
+        for order in orders:
+            result = results_by_clordid.get(order['clOrdID'])
+            if result is None or not self._same_order(order, result):
+                raise errors.DuplicateClordid('Attempted to recover from duplicate clOrdID, but order returned from '
+                                              'API did not match the request.\nRequest data: %s\nReturned order: %s'
+                                              % (json.dumps(order), json.dumps(result)))
+            recovered.append(result)
+        # All good
+        return recovered if 'orders' in postdict else recovered[0]
+
+    def _same_order(self, order, result):
+        for key in self.DUPLICATE_CHECK_KEYS:
+            if order.get(key) not in (None, '') and order[key] != result.get(key):
+                return False
+        qty = order.get('orderQty')
+        if qty:
+            if abs(qty) != result.get('orderQty'):
+                return False
+            side = order.get('side') or ('Buy' if qty > 0 else 'Sell')
+            if side != result.get('side'):
+                return False
+        return True
 
     def __del__(self):
         self.exit()
@@ -0,0 +1,73 @@
+"""Asyncio BitMEX API Connector."""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from supervisor.core.api import BitMEX
+
+
+class AsyncBitMEX:
+    """Awaitable sibling of BitMEX for issuing independent requests concurrently.
+
+    Requests are built, signed, rate limited and retried by a wrapped BitMEX
+    instance and are sent from a thread pool over its pooled session, so N
+    independent requests take about as long as the slowest of them. A token
+    of the shared RateLimiter is still taken for every request.
+
+    Usage:
+        async with AsyncBitMEX(symbol='XBTUSD', api_key=..., api_secret=...) as bitmex:
+            await asyncio.gather(bitmex.order_cancel(orderID=...), bitmex.order_create(...))
+    """
+
+    # blocking BitMEX endpoints exposed as coroutines
+    ENDPOINTS = (
+        'call_api', 'order', 'order_create', 'order_edit', 'order_cancel', 'order_cancel_all',
+        'order_bulk_create', 'order_bulk_edit', 'order_cancel_all_after', 'position', 'get_order_statuses',
+    )
+
+    def __init__(self, conn: BitMEX = None, max_concurrency: int = 10, **kwargs):
+        """
+
+        :param conn: BitMEX instance to share endpoints, signer and rate limits with,
+            a new one without websocket is created from kwargs if None
+        :param max_concurrency: max number of requests in flight, should not exceed the pool_maxsize of conn
+        """
+
+        if conn is None:
+            kwargs.setdefault('init_ws', False)
+            conn = BitMEX(**kwargs)
+        self.conn = conn
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='bitmex-async')
+
+    def __getattr__(self, name):
+        if name not in self.ENDPOINTS:
+            raise AttributeError(name)
+        method = getattr(self.conn, name)
+
+        @functools.wraps(method)
+        async def endpoint(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return endpoint
+
+    async def run(self, fn, *args, **kwargs):
+        """Run blocking fn(*args, **kwargs) in the request thread pool."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def gather(self, *calls, return_exceptions=False):
+        """Run blocking calls concurrently, each one is a (fn, *args) tuple or a coroutine."""
+
+        coroutines = [call if asyncio.iscoroutine(call) else self.run(*call) for call in calls]
+        return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
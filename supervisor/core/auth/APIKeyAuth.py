@@ -3,16 +3,18 @@ import time
 import hashlib
 import hmac
 from urllib.parse import urlparse
+from supervisor.core.auth.Signer import Signer
 
 
 class APIKeyAuth(AuthBase):
 
     """Attaches API Key Authentication to the given Request object."""
 
-    def __init__(self, apiKey, apiSecret):
-        """Init with Key & Secret."""
+    def __init__(self, apiKey, apiSecret, signer=None):
+        """Init with Key & Secret or with a Signer shared with other clients."""
         self.apiKey = apiKey
         self.apiSecret = apiSecret
+        self.signer = signer if signer is not None else Signer(apiKey, apiSecret)
 
     def __call__(self, r):
         """Called when forming a request - generates api key headers."""
@@ -20,7 +22,7 @@ class APIKeyAuth(AuthBase):
         nonce = generate_expires()
         r.headers['api-expires'] = str(nonce)
         r.headers['api-key'] = self.apiKey
-        r.headers['api-signature'] = generate_signature(self.apiSecret, r.method, r.url, nonce, r.body or '')
+        r.headers['api-signature'] = self.signer.sign_url(r.method, r.url, nonce, r.body or b'')
 
         return r
 
@@ -42,7 +44,10 @@ def generate_expires():
 # data={"symbol":"XBTZ14","quantity":1,"price":395.01}
 # signature = HEX(HMAC_SHA256(secret, 'POST/api/v1/order1416993995705{"symbol":"XBTZ14","quantity":1,"price":395.01}'))
 def generate_signature(secret, verb, url, nonce, data):
-    """Generate a request signature compatible with BitMEX."""
+    """Generate a request signature compatible with BitMEX.
+
+    Builds the HMAC key on every call, use Signer for repeated signing.
+    """
     # Parse the url so we can remove the base and extract just the path.
     parsedURL = urlparse(url)
     path = parsedURL.path
@@ -1,16 +1,17 @@
 import time
 from requests.auth import AuthBase
-from supervisor.core.auth import generate_signature
+from supervisor.core.auth import Signer
 
 
 class APIKeyAuthWithExpires(AuthBase):
 
     """Attaches API Key Authentication to the given Request object. This implementation uses `expires`."""
 
-    def __init__(self, apiKey, apiSecret):
-        """Init with Key & Secret."""
+    def __init__(self, apiKey, apiSecret, signer=None):
+        """Init with Key & Secret or with a Signer shared with other clients."""
         self.apiKey = apiKey
         self.apiSecret = apiSecret
+        self.signer = signer if signer is not None else Signer(apiKey, apiSecret)
 
     def __call__(self, r):
         """
@@ -19,9 +20,9 @@ class APIKeyAuthWithExpires(AuthBase):
         For more details, see https://www.bitmex.com/app/apiKeys
         """
         # modify and return the request
-        expires = int(round(time.time()) + 60)  # 5s grace period in case of clock skew
+        expires = int(round(time.time()) + 60)  # 60s grace period in case of clock skew
         r.headers['api-expires'] = str(expires)
         r.headers['api-key'] = self.apiKey
-        r.headers['api-signature'] = generate_signature(self.apiSecret, r.method, r.url, expires, r.body or '')
+        r.headers['api-signature'] = self.signer.sign_url(r.method, r.url, expires, r.body or b'')
 
         return r
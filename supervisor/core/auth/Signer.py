@@ -0,0 +1,49 @@
+import hashlib
+import hmac
+
+
+class Signer:
+
+    """Signs BitMEX requests with a keyed HMAC prepared once.
+
+    The HMAC state keyed with the secret is built in the constructor and
+    only copied for every signature, so the secret isn't re-encoded and the
+    key isn't re-hashed per request. One Signer may be shared by REST and
+    websocket clients of the same key.
+    """
+
+    def __init__(self, apiKey, apiSecret):
+        self.apiKey = apiKey
+        self._hmac = hmac.new(apiSecret.encode('utf8'), digestmod=hashlib.sha256)
+
+    def sign(self, verb, path, expires, data=b''):
+        """Return HEX(HMAC_SHA256(secret, verb + path + expires + data)).
+
+        :param verb: uppercased HTTP verb, str
+        :param path: path with query relative to the host, bytes or str
+        :param expires: int, nonce or expiration unix time
+        :param data: request body, bytes or str
+        """
+
+        if not isinstance(path, bytes):
+            path = path.encode('utf8')
+        if not isinstance(data, bytes):
+            data = data.encode('utf8')
+
+        signature = self._hmac.copy()
+        # one update is cheaper than one per part
+        signature.update(b'%s%s%d%s' % (verb.encode('ascii'), path, expires, data))
+        return signature.hexdigest()
+
+    def sign_url(self, verb, url, expires, data=b''):
+        """Sign a request by its absolute URL."""
+
+        return self.sign(verb, url_path(url), expires, data)
+
+
+def url_path(url):
+    """Return path with query of an absolute URL, e.g. '/api/v1/order?symbol=XBTUSD'."""
+
+    host_start = url.find('//')
+    path_start = url.find('/', host_start + 2 if host_start != -1 else 0)
+    return url[path_start:] if path_start != -1 else '/'
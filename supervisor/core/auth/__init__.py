@@ -1,3 +1,4 @@
+from supervisor.core.auth.Signer import *
 from supervisor.core.auth.APIKeyAuth import *
 from supervisor.core.auth.AccessTokenAuth import *
 from supervisor.core.auth.APIKeyAuthWithExpires import *
@@ -0,0 +1,41 @@
+import socket
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+
+class PoolAdapter(HTTPAdapter):
+    """HTTPAdapter with tunable pool sizing and TCP keep-alive of pooled connections.
+
+    :param tcp_keepalive: enable SO_KEEPALIVE, so idle pooled connections aren't dropped silently
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=20, pool_block=False, tcp_keepalive=True):
+        self.tcp_keepalive = tcp_keepalive
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block,
+                         max_retries=0)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.tcp_keepalive:
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+def connection_stats(adapter):
+    """Return number of opened connections and of requests sent over them for every pooled host."""
+
+    pools = adapter.poolmanager.pools
+    stats = {}
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        stats['%s://%s:%s' % (pool.scheme, pool.host, pool.port)] = {
+            'connections': pool.num_connections,
+            'requests': pool.num_requests,
+            # requests which went over an already open connection
+            'reused': pool.num_requests - pool.num_connections,
+        }
+    return stats
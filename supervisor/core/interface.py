@@ -1,5 +1,6 @@
 from supervisor.core.api import BitMEX
-from supervisor.core.orders import Order
+from supervisor.core.orders import Order, new_clordid
+from supervisor.core.utils.errors import MarketEmptyError
 
 
 class Exchange:
@@ -8,17 +9,85 @@ class Exchange:
     Operates with Order objects
     """
 
-    def __init__(self, symbol, api_key, api_secret, test=False, connect_ws=True):
+    def __init__(self, symbol, api_key, api_secret, test=False, connect_ws=True, **http_options):
+        """
+
+        :param http_options: REST client options, e.g. pool_maxsize or warm_up, see BitMEX
+        """
+
         self.symbol = symbol
-        self.conn = BitMEX(symbol=symbol, api_key=api_key, api_secret=api_secret, test=test, init_ws=connect_ws)
+        self.conn = BitMEX(symbol=symbol, api_key=api_key, api_secret=api_secret, test=test, init_ws=connect_ws,
+                           **http_options)
 
     def restart_ws(self):
         self.conn.reinit_ws()
 
-    def is_open(self):
-        """Check that websockets are still open."""
+    def is_open(self, max_silence=None):
+        """Check that websockets are still open, a dropped connection is reopened by the websocket itself.
+
+        :param max_silence: seconds, consider the websocket closed if no message has come for so long,
+            e.g. while reconnects keep failing
+        """
+
+        ws = self.conn.ws
+        if ws.exited:
+            return False
+        return max_silence is None or ws.silence() <= max_silence
+
+    def is_synced(self):
+        """Check that no websocket table keeps data of a dropped connection and the last ping hasn't timed out."""
+
+        return not self.conn.ws.is_stale()
+
+    def get_ws_heartbeat_metrics(self):
+        """Return websocket ping round trip percentiles and seconds since the last update of every table."""
+
+        return self.conn.ws.heartbeat_metrics()
+
+    def get_ws_reconnect_metrics(self):
+        """Return number of websocket reconnects, downtime of the last one and tables still being resynced."""
+
+        return self.conn.ws.reconnect_metrics()
+
+    def get_ws_queue_metrics(self):
+        """Return depth of the websocket frame queue, blocked and dropped frames and the processing lag."""
+
+        return self.conn.ws.queue_metrics()
+
+    def get_ws_conflation_metrics(self):
+        """Return numbers of received, merged, applied and pending updates of every conflated websocket table."""
+
+        return self.conn.ws.conflation_metrics()
+
+    def get_rate_limit_metrics(self):
+        """Return usage of the REST rate limit budget: tokens left, acquired and delayed requests per lane."""
+
+        return self.conn.rate_limit_metrics()
+
+    def get_ws_startup_metrics(self):
+        """Return seconds the websocket took to connect and to load the initial table images."""
 
-        return not self.conn.ws.exited
+        return self.conn.ws_startup_metrics()
+
+    def get_http_stats(self):
+        """Return connection reuse and time to the first byte of REST responses."""
+
+        return self.conn.http_stats()
+
+    def get_retry_metrics(self):
+        """Return number of REST request attempts, failures by reason and time spent waiting for retries."""
+
+        return self.conn.retry_metrics()
+
+    def add_update_listener(self, callback, tables=None):
+        """Call callback(table) from the websocket thread when one of the tables changes."""
+
+        self.conn.add_ws_listener(callback, tables)
+
+    def remove_update_listener(self, callback):
+        """Stop calling callback on websocket table changes."""
+
+        self.conn.remove_ws_listener(callback)
 
     #
     # Price-related methods
@@ -34,15 +103,25 @@ class Exchange:
     def get_last_price_ws(self):
         return self.get_ticker_ws()['last']
 
+    def get_price_feed(self):
+        """Return PriceFeed with last prices of the websocket instrument stream."""
+
+        return self.conn.price_feed
+
     def get_first_orderbook_price_ws(self, bid):
-        # first list element for bid and last for ask
-        index = 0 if bid else -1
-        return self.conn.order_book(depth=1)[index]['price']
+        return self._get_orderbook_price_ws(bid, level=1)
 
     def get_third_orderbook_price_ws(self, bid):
-        # first list element for bid and last for ask
-        index = 0 if bid else -1
-        return self.conn.order_book(depth=3)[index]['price']
+        return self._get_orderbook_price_ws(bid, level=3)
+
+    def _get_orderbook_price_ws(self, bid, level):
+        """Price of the level-th best bid or ask, or of the deepest one if the side is shorter."""
+
+        book = self.conn.l2_book()
+        levels = book.bids(level) if bid else book.asks(level)
+        if not levels:
+            raise MarketEmptyError('Orderbook side is empty.')
+        return levels[-1]['price']
 
     #
     # Position-related methods
@@ -74,7 +153,9 @@ class Exchange:
     #
 
     def get_open_orders_ws(self):
-        return [Order.from_dict(o) for o in self.conn.open_orders()]
+        """Return open orders, Order objects are cached by the websocket order table and must not be modified."""
+
+        return self.conn.open_order_objects()
 
     def get_filled_orders_ws(self):
         return [Order.from_dict(o) for o in self.conn.filled_orders()]
@@ -87,12 +168,12 @@ class Exchange:
         return None
 
     def get_order_status_ws(self, order):
-        orders = self.conn.get_orders()
-        orders = list(filter(lambda x: x.get('orderID', None) == order.order_id, orders))
-        if len(orders) == 1:
-            return orders[0].get('ordStatus')
-        elif len(orders) == 0:
-            return None
+        return self.conn.get_order_status(orderID=order.order_id, clOrdID=order.clordid)
+
+    def get_order_statuses_ws(self, orders):
+        """Return list of statuses of the orders, None for unknown ones."""
+
+        return self.conn.get_order_statuses([(order.order_id, order.clordid) for order in orders])
 
     def get_order_executions_ws(self, clordid):
         return self.conn.get_executions(clordid=clordid)
@@ -100,14 +181,56 @@ class Exchange:
     def move_order(self, order, to: float = None):
         if to is not None:
             order.move(to=to)
-        self.conn.order_edit(**order.as_dict())
+        amend_dict = self._amend_dict(order)
+        self.conn.order_edit(**amend_dict)
+        if 'clOrdID' in amend_dict:
+            order.clordid = amend_dict['clOrdID']
+
+    def bulk_move_orders(self, orders):
+        """Amend several orders with one request and return the orders confirmed by the exchange."""
+
+        amend_dicts = [self._amend_dict(order) for order in orders]
+
+        response = self.conn.order_bulk_edit(amend_dicts)
+        orders_by_id = {}
+        for order, amend_dict in zip(orders, amend_dicts):
+            if order.order_id is not None:
+                orders_by_id[('orderID', order.order_id)] = order, amend_dict
+            else:
+                orders_by_id[('clOrdID', amend_dict['clOrdID'])] = order, amend_dict
+
+        moved_orders = []
+        for order_dict in response:
+            order, amend_dict = orders_by_id.get(('orderID', order_dict.get('orderID')), None) or \
+                orders_by_id.get(('clOrdID', order_dict.get('clOrdID')), (None, None))
+            if order is not None:
+                if 'clOrdID' in amend_dict:
+                    order.clordid = amend_dict['clOrdID']
+                moved_orders.append(order)
+        return moved_orders
+
+    @staticmethod
+    def _amend_dict(order):
+        """Amend request of the order.
+
+        An order with clOrdID gets a new one, so the exchange rejects the amend if it's repeated.
+        The exchange requires origClOrdID with a new clOrdID, even if the order is identified by orderID.
+        """
+
+        order_dict = order.as_dict()
+        amend_dict = {key: order_dict[key] for key in ('orderID', 'orderQty', 'price', 'stopPx') if key in order_dict}
+        if order.clordid is not None:
+            amend_dict['origClOrdID'] = order.clordid
+            amend_dict['clOrdID'] = new_clordid()
+        return amend_dict
 
     def place_order(self, order):
         new_order = self.conn.order_create(**order.as_dict())
         order.order_id = new_order.get('orderID', '')
 
     def place_market_order(self, qty: int) -> dict:
-        return self.conn.order_create(ordType='Market', orderQty=qty)
+        # clOrdID makes the order safe to retry
+        return self.conn.order_create(ordType='Market', orderQty=qty, clOrdID=new_clordid())
 
     def bulk_place_orders(self, orders):
         order_dicts = [order.as_dict() for order in orders]
@@ -125,8 +248,9 @@ class Exchange:
             raise ValueError('clordid or order id must be given.')
 
     def bulk_cancel_orders(self, orders):
-        clordid_list = [o.clordid for o in orders if o.clordid is not None]
+        # every order is cancelled by one of its ids, orderID if it's known
         order_id_list = [o.order_id for o in orders if o.order_id is not None]
+        clordid_list = [o.clordid for o in orders if o.order_id is None and o.clordid is not None]
         self.conn.order_cancel(orderID=order_id_list, clOrdID=clordid_list)
 
     def cancel_all_orders(self):
@@ -1,3 +1,5 @@
+import base64
+import uuid
 from typing import Callable
 
 
@@ -11,8 +13,28 @@ ORDER_SIDE_TYPES = [
     'Sell'
 ]
 
+CLORDID_PREFIX = 'sv_'
+
+
+def new_clordid() -> str:
+    """Generate unique clOrdID.
+
+    The exchange rejects a repeated order with the same clOrdID, so requests with it may be retried safely.
+    """
+
+    return CLORDID_PREFIX + base64.urlsafe_b64encode(uuid.uuid4().bytes).decode('utf8').rstrip('=')
+
 
 class Order:
+    __slots__ = (
+        'symbol', 'order_id', 'order_type', 'clordid', 'qty', 'side', 'price', 'stop_px', 'hidden', 'close',
+        'reduce_only', 'passive', 'is_trailing', 'tracker', '_on_reject', '_on_fill', '_key', '_not_price_key',
+        '__weakref__',
+    )
+
+    # changing one of these attributes resets the cached comparison keys
+    KEY_ATTRIBUTES = frozenset(('symbol', 'order_type', 'qty', 'side', 'price', 'stop_px'))
+
     def __init__(self,
                  symbol: str = 'XBTUSD',
                  order_type: str = None,
@@ -26,6 +48,9 @@ class Order:
                  reduce_only: bool = False,
                  passive: bool = False):
 
+        self._key = None
+        self._not_price_key = None
+
         self.symbol = symbol
         self.order_id = None
         self.order_type = order_type
@@ -40,25 +65,61 @@ class Order:
         self.passive = passive
 
         self.is_trailing = False
+        self.tracker = None
 
         # DO NOT USE Supervisor.stop_cycle() in callbacks!!!
         # It causes 100% deadlock
         self._on_reject: Callable = None
         self._on_fill: Callable = None
 
+    def __setattr__(self, name, value):
+        if name in self.KEY_ATTRIBUTES:
+            object.__setattr__(self, '_key', None)
+            if name != 'price' and name != 'stop_px':
+                object.__setattr__(self, '_not_price_key', None)
+        object.__setattr__(self, name, value)
+
     def __eq__(self, other):
         """Custom == for use 'order in orders' expressions."""
 
-        if self.get_comparison_params() == other.get_comparison_params():
-            return True
-        return False
+        if not isinstance(other, Order):
+            return NotImplemented
+        return self.comparison_key == other.comparison_key
+
+    def __hash__(self):
+        """Hash of the fields, which don`t change when the order is moved, so equal orders have equal hashes.
+
+        Orders are compared by value, so the hash can`t be the order identity. Don`t change symbol,
+        order_type, qty or side of an order while it is in a set or is a dict key, remove it first
+        and add it back after the change. Moving the order is fine.
+        """
+
+        return hash(self.not_price_comparison_key)
 
     def almost_equal(self, other):
         """If orders are same at all except price or stop_ps."""
 
-        if self.get_not_price_comparison_params() == other.get_not_price_comparison_params():
-            return True
-        return False
+        return self.not_price_comparison_key == other.not_price_comparison_key
+
+    @property
+    def comparison_key(self) -> tuple:
+        """Cached tuple of get_comparison_params(), reset when any of them changes."""
+
+        key = self._key
+        if key is None:
+            key = (self.symbol, self.order_type, self.qty, self.side, self.price, self.stop_px)
+            object.__setattr__(self, '_key', key)
+        return key
+
+    @property
+    def not_price_comparison_key(self) -> tuple:
+        """Cached tuple of get_not_price_comparison_params()."""
+
+        key = self._not_price_key
+        if key is None:
+            key = (self.symbol, self.order_type, self.qty, self.side)
+            object.__setattr__(self, '_not_price_key', key)
+        return key
 
     def on_reject(self, *args, **kwargs) -> None:
         if self._on_reject is not None:
@@ -118,26 +179,12 @@ class Order:
     def get_comparison_params(self) -> list:
         """Get essential parameters, that are used to distinguish orders."""
 
-        parameters = [
-            self.symbol,
-            self.order_type,
-            self.qty,
-            self.side,
-            self.price,
-            self.stop_px,
-        ]
-        return parameters
+        return list(self.comparison_key)
 
     def get_not_price_comparison_params(self) -> list:
         """Get several comparison parameters, that are used to move orders."""
 
-        parameters = [
-            self.symbol,
-            self.order_type,
-            self.qty,
-            self.side
-        ]
-        return parameters
+        return list(self.not_price_comparison_key)
 
     def as_dict(self, include_empty=False) -> dict:
         """This order representation is made to be similar to BitMEX API order objects."""
@@ -186,6 +233,7 @@ class Order:
         new_order = Order()
         new_order.symbol = order_dict.get('symbol', 'XBTUSD')
         new_order.order_id = order_dict.get('orderID', None)
+        new_order.clordid = order_dict.get('clOrdID') or None
         new_order.order_type = order_dict.get('ordType', None)
         new_order.qty = order_dict.get('orderQty', None)
         new_order.side = order_dict.get('side', None)
@@ -200,9 +248,10 @@ class Order:
 
         new_order.hidden = order_dict.get('displayQty', 1) == 0
 
-        new_order.close = 'Close' in order_dict.get('execInst', '')
-        new_order.reduce_only = 'ReduceOnly' in order_dict.get('execInst', '')
-        new_order.passive = 'ParticipateDoNotInitiate' in order_dict.get('execInst', '')
+        exec_inst = (order_dict.get('execInst') or '').split(',')
+        new_order.close = 'Close' in exec_inst
+        new_order.reduce_only = 'ReduceOnly' in exec_inst
+        new_order.passive = 'ParticipateDoNotInitiate' in exec_inst
 
         return new_order
 
@@ -0,0 +1,48 @@
+import logging
+import threading
+import traceback
+
+
+class PriceFeed:
+    """Fans out last price changes of instruments to subscribed callbacks.
+
+    One feed is fed by the BitMEXWebsocket instrument stream and shared by all
+    trailing orders, so trackers need no own socket or instrument table.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('core')
+        self._subscribers = {}  # symbol -> tuple of callbacks
+        self._last_prices = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbol, callback):
+        """Call callback(last_price) on every last price change of the symbol."""
+
+        with self._lock:
+            self._subscribers[symbol] = self._subscribers.get(symbol, ()) + (callback,)
+
+    def unsubscribe(self, symbol, callback):
+        with self._lock:
+            callbacks = tuple(c for c in self._subscribers.get(symbol, ()) if c != callback)
+            if callbacks:
+                self._subscribers[symbol] = callbacks
+            else:
+                self._subscribers.pop(symbol, None)
+
+    def subscribers(self, symbol):
+        return len(self._subscribers.get(symbol, ()))
+
+    def last_price(self, symbol):
+        return self._last_prices.get(symbol)
+
+    def publish(self, symbol, last_price):
+        if last_price is None or self._last_prices.get(symbol) == last_price:
+            return
+        self._last_prices[symbol] = last_price
+
+        for callback in self._subscribers.get(symbol, ()):
+            try:
+                callback(last_price)
+            except Exception:
+                self.logger.error(traceback.format_exc())
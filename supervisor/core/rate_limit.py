@@ -0,0 +1,163 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Local token budget for REST requests with priority lanes.
+
+    The bucket refills at ``limit`` tokens per ``window`` seconds, like the
+    BitMEX limit does, and is corrected by the X-RateLimit-* headers of every
+    response. Each lane keeps ``reserves[lane]`` tokens untouched for the lanes
+    above it, and a lane never takes a token while a higher lane is waiting,
+    so cancels are not stuck behind placements when the budget runs low.
+    """
+
+    # lanes from the highest priority to the lowest
+    LANES = ('cancel', 'amend', 'place', 'read')
+    RESERVES = {'cancel': 0, 'amend': 1, 'place': 3, 'read': 6}
+
+    VERB_LANES = {
+        'DELETE': 'cancel',
+        'PUT': 'amend',
+        'POST': 'place',
+        'GET': 'read',
+    }
+
+    def __init__(self, limit: int = 60, window: float = 60.0, reserves: dict = None, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.reserves = dict(self.RESERVES, **(reserves or {}))
+        self._clock = clock
+
+        self._tokens = float(limit)
+        self._updated = clock()
+        self._blocked_until = 0.0  # set when the exchange throttles us
+        self._server_remaining = None
+
+        self._waiting = {lane: 0 for lane in self.LANES}
+        self._acquired = {lane: 0 for lane in self.LANES}
+        self._delayed = {lane: 0 for lane in self.LANES}
+        self._wait_time = {lane: 0.0 for lane in self.LANES}
+        self._throttled = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def lane_for(cls, verb: str) -> str:
+        return cls.VERB_LANES.get(verb, 'read')
+
+    def try_acquire(self, lane: str) -> bool:
+        """Take a token without waiting."""
+
+        with self._condition:
+            self._refill()
+            if self._can_take(lane):
+                self._take(lane)
+                return True
+            return False
+
+    def acquire(self, lane: str, timeout: float = None) -> bool:
+        """Take a token, waiting until the lane may have one or timeout expires.
+
+        :return: False if timed out.
+        """
+
+        started = self._clock()
+        with self._condition:
+            self._refill()
+            if self._can_take(lane):
+                self._take(lane)
+                return True
+
+            self._waiting[lane] += 1
+            self._delayed[lane] += 1
+            try:
+                while True:
+                    to_wait = self._time_to_token(lane)
+                    if timeout is not None:
+                        left = timeout - (self._clock() - started)
+                        if left <= 0:
+                            return False
+                        to_wait = min(to_wait, left)
+                    self._condition.wait(to_wait)
+                    self._refill()
+                    if self._can_take(lane, waiting=True):
+                        self._take(lane)
+                        return True
+            finally:
+                self._waiting[lane] -= 1
+                self._wait_time[lane] += self._clock() - started
+                self._condition.notify_all()
+
+    def update(self, headers) -> None:
+        """Correct the budget by X-RateLimit-Limit and X-RateLimit-Remaining response headers."""
+
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        with self._condition:
+            self._refill()
+            if limit is not None:
+                self.limit = int(limit)
+            if remaining is not None:
+                self._server_remaining = int(remaining)
+                self._tokens = min(self._tokens, float(remaining))
+            self._tokens = min(self._tokens, float(self.limit))
+            self._condition.notify_all()
+
+    def throttle(self, reset_timestamp: float) -> None:
+        """Empty the budget until X-RateLimit-Reset (unix time) after a 429 response."""
+
+        with self._condition:
+            self._throttled += 1
+            self._tokens = 0.0
+            self._server_remaining = 0
+            self._updated = self._clock()
+            self._blocked_until = self._clock() + max(reset_timestamp - time.time(), 0)
+            self._condition.notify_all()
+
+    def metrics(self) -> dict:
+        """Snapshot of budget usage."""
+
+        with self._condition:
+            self._refill()
+            return {
+                'tokens': self._tokens,
+                'limit': self.limit,
+                'server_remaining': self._server_remaining,
+                'throttled': self._throttled,
+                'waiting': dict(self._waiting),
+                'acquired': dict(self._acquired),
+                'delayed': dict(self._delayed),
+                'wait_time': dict(self._wait_time),
+            }
+
+    def _refill(self):
+        now = self._clock()
+        if now < self._blocked_until:
+            self._updated = now
+            return
+        elapsed = now - max(self._updated, self._blocked_until)
+        self._tokens = min(float(self.limit), self._tokens + elapsed * self.limit / self.window)
+        self._updated = now
+
+    def _can_take(self, lane, waiting=False):
+        if self._clock() < self._blocked_until:
+            return False
+        for higher_lane in self.LANES[:self.LANES.index(lane)]:
+            if self._waiting[higher_lane]:
+                return False
+        # a lane waits behind its own earlier waiters
+        if not waiting and self._waiting[lane]:
+            return False
+        return self._tokens >= 1 + self.reserves[lane]
+
+    def _take(self, lane):
+        self._tokens -= 1
+        self._acquired[lane] += 1
+
+    def _time_to_token(self, lane):
+        now = self._clock()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        missing = 1 + self.reserves[lane] - self._tokens
+        # the token may be already there and the lane waits for a higher one
+        return max(missing * self.window / self.limit, 0.01)
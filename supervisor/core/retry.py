@@ -0,0 +1,129 @@
+import logging
+import random
+import threading
+import time
+
+from supervisor.core.utils.errors import MaxRetriesReachedError
+
+
+class Retry(Exception):
+    """Raised by an attempt which may be repeated.
+
+    :param reason: short name of the failure, e.g. 'timeout' or '503'
+    :param delay: seconds to wait before the next attempt, backoff of the policy is used if None
+    :param processed: False if the server surely rejected the request without processing it,
+        then it may be repeated whatever the verb is
+    """
+
+    def __init__(self, reason, delay=None, processed=True):
+        super().__init__(reason)
+        self.reason = reason
+        self.delay = delay
+        self.processed = processed
+
+
+class RetryPolicy:
+    """Repeats failed attempts in a loop with capped exponential backoff and jitter.
+
+    Number of retries depends on the request verb: POST and PUT are not
+    idempotent, so they are retried only if the server hasn`t processed them.
+    No attempt is started after ``deadline`` seconds since the first one.
+    """
+
+    RETRIES = {'GET': 3, 'DELETE': 3, 'POST': 0, 'PUT': 0}
+
+    def __init__(self, retries: dict = None, unprocessed_retries: int = 3, idempotent_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 10.0, jitter: float = 0.5, deadline: float = 60.0,
+                 on_attempt=None, sleep=time.sleep, clock=time.monotonic):
+        """
+
+        :param retries: max retries by verb, overrides RETRIES
+        :param unprocessed_retries: max retries of requests which the server rejected without processing
+        :param idempotent_retries: max retries of POST and PUT requests, which are safe to repeat,
+            e.g. orders with clOrdID
+        :param jitter: part of the backoff delay which is randomized, from 0 to 1
+        :param on_attempt: callable, called as on_attempt(verb, attempt, elapsed, outcome) after every attempt,
+            outcome is 'ok' or the Retry reason
+        """
+
+        self.retries = dict(self.RETRIES, **(retries or {}))
+        self.unprocessed_retries = unprocessed_retries
+        self.idempotent_retries = idempotent_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.on_attempt = on_attempt
+        self._sleep = sleep
+        self._clock = clock
+
+        self.logger = logging.getLogger('core')
+        self._lock = threading.Lock()
+        self._attempts = 0
+        self._failures = {}  # reason -> count
+        self._exhausted = 0
+        self._retry_time = 0.0
+
+    def retries_for(self, verb: str) -> int:
+        return self.retries.get(verb, 0)
+
+    def backoff(self, retry_number: int) -> float:
+        """Delay before the retry_number-th retry, counting from 0."""
+
+        delay = min(self.max_delay, self.base_delay * 2 ** retry_number)
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, attempt, verb: str, max_retries: int = None, description: str = ''):
+        """Call attempt() until it returns without raising Retry.
+
+        :raise MaxRetriesReachedError: if retries or the deadline are exhausted.
+        """
+
+        if max_retries is None:
+            max_retries = self.retries_for(verb)
+
+        started = self._clock()
+        retry_number = 0
+        while True:
+            attempt_started = self._clock()
+            try:
+                result = attempt()
+            except Retry as e:
+                self._record(verb, retry_number, attempt_started, e.reason)
+
+                delay = e.delay if e.delay is not None else self.backoff(retry_number)
+                elapsed = self._clock() - started
+                allowed_retries = max_retries if e.processed else max(max_retries, self.unprocessed_retries)
+                if retry_number >= allowed_retries or elapsed + delay > self.deadline:
+                    with self._lock:
+                        self._exhausted += 1
+                    raise MaxRetriesReachedError('Max retries on %s hit after %d attempts (%s), raising.' %
+                                                 (description, retry_number + 1, e.reason)) from e
+
+                self.logger.debug('Retrying %s in %.2fs after %s, retry %d of %d.',
+                                  description, delay, e.reason, retry_number + 1, allowed_retries)
+                with self._lock:
+                    self._retry_time += delay
+                if delay > 0:
+                    self._sleep(delay)
+                retry_number += 1
+            else:
+                self._record(verb, retry_number, attempt_started, 'ok')
+                return result
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                'attempts': self._attempts,
+                'failures': dict(self._failures),
+                'exhausted': self._exhausted,
+                'retry_time': self._retry_time,
+            }
+
+    def _record(self, verb, retry_number, attempt_started, outcome):
+        with self._lock:
+            self._attempts += 1
+            if outcome != 'ok':
+                self._failures[outcome] = self._failures.get(outcome, 0) + 1
+        if self.on_attempt is not None:
+            self.on_attempt(verb, retry_number, self._clock() - attempt_started, outcome)
@@ -0,0 +1,418 @@
+from bisect import bisect_left, insort
+from collections import deque
+from itertools import count
+
+from supervisor.core.orders import Order
+from supervisor.core.utils.math import tick_log
+
+
+class KeyedTable:
+    """Store for a single websocket table.
+
+    Rows are kept in insertion order in a dict indexed by the values of the
+    ``keys`` sent with the table's ``partial``, so finding, updating and deleting
+    a row is O(1) instead of a scan over the whole table.
+
+    Iteration, ``len()`` and indexing work like on the plain list of dicts used
+    before, so readers may keep treating the table as a list. Iteration walks
+    a snapshot, it is safe while the websocket thread keeps writing.
+    """
+
+    def __init__(self, keys=None):
+        self.keys = list(keys or [])
+        self._rows = {}
+        # rows of tables without keys can't be looked up, give them unique ids
+        self._row_ids = count()
+
+    def key_of(self, row):
+        """Return the index key of a row or of an update/delete message item."""
+
+        return tuple(row.get(key) for key in self.keys)
+
+    def set_keys(self, keys):
+        """Set the keys sent with the partial and re-index the rows we already have."""
+
+        self.keys = list(keys or [])
+        rows = list(self._rows.values())
+        self._rows = {}
+        self.insert(rows)
+
+    def insert(self, rows):
+        for row in rows:
+            key = self.key_of(row) if self.keys else next(self._row_ids)
+            self._rows[key] = row
+
+    def find(self, match_data):
+        """Return the row identified by the keys in match_data or None."""
+
+        if not self.keys:
+            return None
+        return self._rows.get(self.key_of(match_data))
+
+    def get(self, *key_values):
+        """Return the row by values of the table keys, in the keys order."""
+
+        return self._rows.get(key_values)
+
+    def update(self, item, update_data):
+        """Apply an update to a row found by find()."""
+
+        item.update(update_data)
+
+    def delete(self, match_data):
+        """Remove the row identified by the keys in match_data and return it."""
+
+        if not self.keys:
+            return None
+        return self._rows.pop(self.key_of(match_data), None)
+
+    def trim(self, number):
+        """Drop the oldest rows."""
+
+        for key in list(self._rows)[:number]:
+            del self._rows[key]
+
+    def clear(self):
+        self._rows.clear()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __bool__(self):
+        return bool(self._rows)
+
+    def __iter__(self):
+        return iter(list(self._rows.values()))
+
+    def __getitem__(self, index):
+        if index == 0 and self._rows:
+            return next(iter(self._rows.values()))
+        return list(self._rows.values())[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (KeyedTable, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(keys={self.keys}, rows={list(self)})'
+
+
+class RingTable(KeyedTable):
+    """Table which keeps only the last ``capacity`` rows.
+
+    Rows live in a ring buffer: appending is O(1) and every insert past the
+    capacity evicts just the oldest row. Rows are still indexed by the table
+    keys if the partial sent any.
+    """
+
+    def __init__(self, capacity, keys=None):
+        self.capacity = capacity
+        self._ring = deque(maxlen=capacity)
+        super().__init__(keys)
+
+    def set_keys(self, keys):
+        self.keys = list(keys or [])
+        self._rows = {self.key_of(row): row for row in self._ring} if self.keys else {}
+
+    def insert(self, rows):
+        for row in rows:
+            if len(self._ring) == self.capacity:
+                self._unindex(self._ring[0])
+            self._ring.append(row)
+            if self.keys:
+                self._rows[self.key_of(row)] = row
+
+    def delete(self, match_data):
+        row = super().delete(match_data)
+        if row is not None:
+            # deque.remove() compares rows by value, an equal row of another key may come first
+            for index, ring_row in enumerate(self._ring):
+                if ring_row is row:
+                    del self._ring[index]
+                    break
+        return row
+
+    def trim(self, number):
+        for _ in range(min(number, len(self._ring))):
+            self._unindex(self._ring.popleft())
+
+    def clear(self):
+        self._ring.clear()
+        self._rows.clear()
+
+    def _unindex(self, row):
+        if self.keys:
+            key = self.key_of(row)
+            if self._rows.get(key) is row:
+                del self._rows[key]
+
+    def __len__(self):
+        return len(self._ring)
+
+    def __bool__(self):
+        return bool(self._ring)
+
+    def __iter__(self):
+        return iter(list(self._ring))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self._ring)[index]
+        return self._ring[index]
+
+
+class InstrumentTable(KeyedTable):
+    """Instrument table indexed by symbol.
+
+    The 'tickLog' of every instrument is computed once, when the instrument
+    arrives or its 'tickSize' changes, instead of on every read.
+    """
+
+    def insert(self, rows):
+        for row in rows:
+            if row.get('tickSize') is not None:
+                row['tickLog'] = tick_log(row['tickSize'])
+        super().insert(rows)
+
+    def update(self, item, update_data):
+        item.update(update_data)
+        if update_data.get('tickSize') is not None:
+            item['tickLog'] = tick_log(item['tickSize'])
+
+    def by_symbol(self, symbol):
+        return self.find({'symbol': symbol})
+
+
+class OrderTable(KeyedTable):
+    """Order table indexed by orderID and by clOrdID.
+
+    Statuses of orders are looked up in O(1) however many orders the session has seen.
+    Open orders (leavesQty > 0) are tracked as rows change, and the Order object
+    built from a row is cached until the row is updated, so reading open orders
+    every cycle doesn't rebuild them.
+    """
+
+    def __init__(self, keys=None):
+        self._by_clordid = {}
+        self._open = {}  # key -> row with leavesQty > 0
+        self._versions = {}  # key -> version of the row, bumped on every change
+        self._orders = {}  # key -> (version, Order)
+        self._version_counter = count()
+        super().__init__(keys)
+
+    def set_keys(self, keys):
+        self._by_clordid.clear()
+        self._open.clear()
+        self._versions.clear()
+        self._orders.clear()
+        super().set_keys(keys)
+
+    def insert(self, rows):
+        super().insert(rows)
+        for row in rows:
+            if row.get('clOrdID'):
+                self._by_clordid[row['clOrdID']] = row
+            if self.keys:
+                self._changed(self.key_of(row), row)
+
+    def update(self, item, update_data):
+        old_clordid = item.get('clOrdID')
+        item.update(update_data)
+        if item.get('clOrdID') != old_clordid:
+            self._by_clordid.pop(old_clordid, None)
+            if item.get('clOrdID'):
+                self._by_clordid[item['clOrdID']] = item
+        self._changed(self.key_of(item), item)
+
+    def delete(self, match_data):
+        row = super().delete(match_data)
+        if row is not None:
+            if self._by_clordid.get(row.get('clOrdID')) is row:
+                del self._by_clordid[row['clOrdID']]
+            key = self.key_of(row)
+            self._open.pop(key, None)
+            self._versions.pop(key, None)
+            self._orders.pop(key, None)
+        return row
+
+    def clear(self):
+        self._by_clordid.clear()
+        self._open.clear()
+        self._versions.clear()
+        self._orders.clear()
+        super().clear()
+
+    def by_order_id(self, order_id):
+        return self.find({'orderID': order_id})
+
+    def by_clordid(self, clordid):
+        return self._by_clordid.get(clordid)
+
+    def status(self, order_id=None, clordid=None):
+        """Return ordStatus of the order found by orderID or, if not found, by clOrdID."""
+
+        row = None
+        if order_id is not None:
+            row = self.by_order_id(order_id)
+        if row is None and clordid:
+            row = self.by_clordid(clordid)
+        return row.get('ordStatus') if row is not None else None
+
+    def open_rows(self):
+        """Return rows of the open orders, in order of arrival of the open ones."""
+
+        return list(self._open.values())
+
+    def open_orders(self):
+        """Return Order objects of the open orders.
+
+        Objects are shared between calls, callers must not modify them.
+        """
+
+        orders = []
+        for key, row in list(self._open.items()):
+            version = self._versions.get(key)
+            cached = self._orders.get(key)
+            if cached is None or cached[0] != version:
+                # the version is read before the row, so a concurrent update makes the next call rebuild it
+                cached = (version, Order.from_dict(row))
+                self._orders[key] = cached
+            orders.append(cached[1])
+        return orders
+
+    def _changed(self, key, row):
+        self._versions[key] = next(self._version_counter)
+        if (row.get('leavesQty') or 0) > 0:
+            self._open[key] = row
+        else:
+            self._open.pop(key, None)
+            self._orders.pop(key, None)
+
+
+class OrderBook(KeyedTable):
+    """L2 order book table with both sides kept sorted by price.
+
+    Price levels are placed with bisect as insert/update/delete deltas arrive,
+    so best prices, top levels, mid, spread and depth are read without sorting.
+    """
+
+    def __init__(self, keys=None):
+        # ascending prices of each side and the level row at each price
+        self._prices = {'Buy': [], 'Sell': []}
+        self._levels = {'Buy': {}, 'Sell': {}}
+        super().__init__(keys)
+
+    def set_keys(self, keys):
+        self._clear_levels()
+        super().set_keys(keys)
+
+    def insert(self, rows):
+        for row in rows:
+            old_row = self.find(row)
+            if old_row is not None:
+                self._remove_level(old_row)
+        super().insert(rows)
+        for row in rows:
+            self._add_level(row)
+
+    def update(self, item, update_data):
+        if 'price' in update_data and update_data['price'] != item['price']:
+            self._remove_level(item)
+            item.update(update_data)
+            self._add_level(item)
+        else:
+            item.update(update_data)
+
+    def delete(self, match_data):
+        row = super().delete(match_data)
+        if row is not None:
+            self._remove_level(row)
+        return row
+
+    def clear(self):
+        self._clear_levels()
+        super().clear()
+
+    def _clear_levels(self):
+        for side in self._prices:
+            self._prices[side].clear()
+            self._levels[side].clear()
+
+    def _add_level(self, row):
+        prices = self._prices[row['side']]
+        levels = self._levels[row['side']]
+        if row['price'] not in levels:
+            insort(prices, row['price'])
+        levels[row['price']] = row
+
+    def _remove_level(self, row):
+        prices = self._prices[row['side']]
+        levels = self._levels[row['side']]
+        if levels.get(row['price']) is row:
+            del levels[row['price']]
+            index = bisect_left(prices, row['price'])
+            if index < len(prices) and prices[index] == row['price']:
+                del prices[index]
+
+    #
+    # Read methods
+    #
+
+    def bids(self, depth=None):
+        """Bid levels, the best one first."""
+
+        if depth == 0:
+            return []
+        prices = self._prices['Buy'][-depth:] if depth else self._prices['Buy'][:]
+        return self._rows_at('Buy', reversed(prices))
+
+    def asks(self, depth=None):
+        """Ask levels, the best one first."""
+
+        if depth == 0:
+            return []
+        prices = self._prices['Sell'][:depth]
+        return self._rows_at('Sell', prices)
+
+    def best_bid(self):
+        bids = self.bids(1)
+        return bids[0] if bids else None
+
+    def best_ask(self):
+        asks = self.asks(1)
+        return asks[0] if asks else None
+
+    def mid_price(self):
+        best_bid, best_ask = self.best_bid(), self.best_ask()
+        if best_bid is None or best_ask is None:
+            return None
+        return (best_bid['price'] + best_ask['price']) / 2
+
+    def spread(self):
+        best_bid, best_ask = self.best_bid(), self.best_ask()
+        if best_bid is None or best_ask is None:
+            return None
+        return best_ask['price'] - best_bid['price']
+
+    def cumulative_depth(self, side, depth=None):
+        """List of (price, cumulative size) pairs from the best level of a side ('Buy' or 'Sell')."""
+
+        levels = self.bids(depth) if side == 'Buy' else self.asks(depth)
+        result = []
+        total = 0
+        for level in levels:
+            total += level['size']
+            result.append((level['price'], total))
+        return result
+
+    def levels(self, depth):
+        """Top levels of both sides sorted by price: bids from the deepest one, then asks from the best one."""
+
+        return list(reversed(self.bids(depth))) + self.asks(depth)
+
+    def _rows_at(self, side, prices):
+        levels = self._levels[side]
+        # the level may be deleted by the websocket thread while we read
+        rows = (levels.get(price) for price in prices)
+        return [row for row in rows if row is not None]
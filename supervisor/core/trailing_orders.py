@@ -1,26 +1,29 @@
-import json
-import decimal
 import threading
 import websocket
-from time import sleep
+from supervisor.core.tables import InstrumentTable, RingTable
+from supervisor.core.utils import codec
 from supervisor.core.utils.math import to_nearest
 
 
-def find_item_by_keys(keys, table, match_data):
-    for item in table:
-        matched = True
-        for key in keys:
-            if item[key] != match_data[key]:
-                matched = False
-        if matched:
-            return item
-
-
 class TrailingShell:
     # Don't grow a table larger than this amount. Helps cap memory usage.
     MAX_TABLE_LEN = 200
 
-    def __init__(self, order, offset: int, tick_size: float, test=True, init_ws=True):
+    # seconds to wait for the own websocket to open and for the instrument partial
+    CONNECT_TIMEOUT = 5
+    PARTIALS_TIMEOUT = 30
+    # the socket is pinged after PING_INTERVAL seconds and closed if no pong comes in PING_TIMEOUT seconds
+    PING_INTERVAL = 10
+    PING_TIMEOUT = 5
+
+    def __init__(self, order, offset: int, tick_size: float, test=True, init_ws=True, price_feed=None,
+                 on_move=None):
+        """
+
+        :param price_feed: shared PriceFeed to take last prices from, no own websocket is opened if given
+        :param on_move: callable, called after the order has been moved
+        """
+
         self.tick_size = tick_size
         self.exited = False
         self.test = test
@@ -36,10 +39,14 @@ class TrailingShell:
 
         self.tracking = False
         self.ws = None
+        self.price_feed = price_feed
+        self.on_move = on_move
 
         self.__reset()
 
-        if init_ws:
+        if self.price_feed is not None:
+            self.price_feed.subscribe(self.order.symbol, self.update_price)
+        elif init_ws:
             self.connect()
 
     def __del__(self):
@@ -47,26 +54,28 @@ class TrailingShell:
 
     def exit(self):
         self.exited = True
+        # wake up connect() if it's waiting
+        self._opened.set()
+        self._instrument_loaded.set()
         if self.ws is not None:
             self.ws.close()
+        if self.price_feed is not None:
+            self.price_feed.unsubscribe(self.order.symbol, self.update_price)
 
     def __reset(self):
         self.data = {}
-        self.keys = {}
         self.exited = False
         self._error = None
+        self._opened = threading.Event()
+        self._instrument_loaded = threading.Event()
 
     def get_instrument(self, symbol):
         instruments = self.data.get('instrument', None)
         if instruments is None:
             return None
-        matching_instruments = [i for i in instruments if i['symbol'] == symbol]
-        if len(matching_instruments) == 0:
+        instrument = instruments.by_symbol(symbol)
+        if instrument is None:
             raise Exception("Unable to find instrument or index with symbol: " + symbol)
-        instrument = matching_instruments[0]
-        # Turn the 'tickSize' into 'tickLog' for use in rounding
-        # http://stackoverflow.com/a/6190291/832202
-        instrument['tickLog'] = decimal.Decimal(str(instrument['tickSize'])).as_tuple().exponent * -1
         return instrument
 
     def calculate_new_price(self, extremum) -> float:
@@ -87,6 +96,8 @@ class TrailingShell:
         if value < self.initial_price:
             new_price = self.calculate_new_price(value)
             self.order.move(to=new_price)
+            if self.on_move is not None:
+                self.on_move()
         self._min_price = value
 
     @property
@@ -98,6 +109,8 @@ class TrailingShell:
         if value > self.initial_price:
             new_price = self.calculate_new_price(value)
             self.order.move(to=new_price)
+            if self.on_move is not None:
+                self.on_move()
         self._max_price = value
 
     def stop_trailing(self):
@@ -139,27 +152,23 @@ class TrailingShell:
                                          on_error=self.__on_error,
                                          header=[])
 
-        self.wst = threading.Thread(target=lambda: self.ws.run_forever())
+        self.wst = threading.Thread(target=lambda: self.ws.run_forever(ping_interval=self.PING_INTERVAL,
+                                                                         ping_timeout=self.PING_TIMEOUT))
         self.wst.daemon = True
         self.wst.start()
 
-        # Wait for connect before continuing
-        conn_timeout = 5
-        while (not self.ws.sock or not self.ws.sock.connected) and conn_timeout and not self._error:
-            sleep(1)
-            conn_timeout -= 1
-
-        if not conn_timeout or self._error:
+        # Wait for connect before continuing, __on_open or an error wakes us up
+        if not self._opened.wait(self.CONNECT_TIMEOUT) or self._error:
             self.exit()
 
     def __wait_for_symbol(self):
-        while not {'instrument'} <= set(self.data):
-            sleep(0.1)
+        if not self._instrument_loaded.wait(self.PARTIALS_TIMEOUT):
+            self.exit()
 
     def __on_message(self, message):
         """Handler for parsing WS messages."""
 
-        message = json.loads(message)
+        message = codec.loads(message)
 
         table = message['table'] if 'table' in message else None
         action = message['action'] if 'action' in message else None
@@ -176,10 +185,10 @@ class TrailingShell:
         elif action:
 
             if table not in self.data:
-                self.data[table] = []
-
-            if table not in self.keys:
-                self.keys[table] = []
+                if table == 'instrument':
+                    self.data[table] = InstrumentTable()
+                else:
+                    self.data[table] = RingTable(TrailingShell.MAX_TABLE_LEN)
 
             # There are four possible actions from the WS:
             # 'partial' - full table image
@@ -187,54 +196,51 @@ class TrailingShell:
             # 'update'  - update row
             # 'delete'  - delete row
             if action == 'partial':
-                self.data[table] += message['data']
                 # Keys are communicated on partials to let you know how to uniquely identify
                 # an item. We use it for updates.
-                self.keys[table] = message['keys']
+                self.data[table].set_keys(message['keys'])
+                self.data[table].insert(message['data'])
+                if table == 'instrument':
+                    self._instrument_loaded.set()
             elif action == 'insert':
-                self.data[table] += message['data']
-
-                # Limit the max length of the table to avoid excessive memory usage.
-                # Don't trim orders because we'll lose valuable state if we do.
-                if table not in ['order', 'orderBookL2'] and len(self.data[table]) > TrailingShell.MAX_TABLE_LEN:
-                    self.data[table] = self.data[table][(TrailingShell.MAX_TABLE_LEN // 2):]
+                self.data[table].insert(message['data'])
 
             elif action == 'update':
                 # Locate the item in the collection and update it.
                 for updateData in message['data']:
-                    item = find_item_by_keys(self.keys[table], self.data[table], updateData)
+                    item = self.data[table].find(updateData)
                     if not item:
                         continue  # No item found to update. Could happen before push
 
                     # Update this item.
-                    item.update(updateData)
-
-                    # Remove canceled / filled orders
-                    # if table == 'order' and item['leavesQty'] <= 0:
-                    #     self.data[table].remove(item)
+                    self.data[table].update(item, updateData)
 
             elif action == 'delete':
                 # Locate the item in the collection and remove it.
                 for deleteData in message['data']:
-                    item = find_item_by_keys(self.keys[table], self.data[table], deleteData)
-                    self.data[table].remove(item)
+                    self.data[table].delete(deleteData)
             else:
                 raise Exception("Unknown action: %s" % action)
 
         instrument = self.get_instrument(symbol=self.order.symbol)
         if instrument is not None:
-            self.last_price = instrument['lastPrice']
-            if self.tracking:
-                if self.last_price > self.max_price and self.order.side == 'Sell':
-                    self.max_price = self.last_price
-                elif self.last_price < self.min_price and self.order.side == 'Buy':
-                    self.min_price = self.last_price
+            self.update_price(instrument['lastPrice'])
+
+    def update_price(self, last_price):
+        """Take the new last price and move the order if it`s a new extremum."""
+
+        self.last_price = last_price
+        if self.tracking:
+            if self.last_price > self.max_price and self.order.side == 'Sell':
+                self.max_price = self.last_price
+            elif self.last_price < self.min_price and self.order.side == 'Buy':
+                self.min_price = self.last_price
 
     def __on_close(self):
         self.exit()
 
     def __on_open(self):
-        pass
+        self._opened.set()
 
     def __on_error(self, error):
         if not self.exited:
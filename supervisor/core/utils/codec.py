@@ -0,0 +1,44 @@
+"""JSON codec shared by the REST and websocket clients.
+
+Uses orjson or ujson when one of them is installed and falls back to the
+standard json module otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+if orjson is not None:
+    NAME = 'orjson'
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf8')
+
+elif ujson is not None:
+    NAME = 'ujson'
+
+    def loads(data):
+        return ujson.loads(data)
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+else:
+    NAME = 'json'
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':'))
@@ -8,3 +8,9 @@ def to_nearest(num, tickSize):
        Use this after adding/subtracting/multiplying numbers."""
     tickDec = Decimal(str(tickSize))
     return float((Decimal(round(num / tickSize, 0)) * tickDec))
+
+
+def tick_log(tickSize):
+    """Turn the 'tickSize' into 'tickLog' for use in rounding: the number of decimal places of a tick.
+       http://stackoverflow.com/a/6190291/832202"""
+    return Decimal(str(tickSize)).as_tuple().exponent * -1
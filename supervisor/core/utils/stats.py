@@ -0,0 +1,45 @@
+import threading
+from collections import deque
+
+
+class LatencyStats:
+    """Count, mean, max and percentiles of the last ``window`` measured durations, in seconds."""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+            self._total += seconds
+            if seconds > self._max:
+                self._max = seconds
+
+    def snapshot(self) -> dict:
+        """Return totals over all samples and percentiles over the window."""
+
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, maximum = self._count, self._total, self._max
+        return {
+            'count': count,
+            'mean': total / count if count else None,
+            'max': maximum if count else None,
+            'p50': percentile(samples, 50),
+            'p90': percentile(samples, 90),
+            'p99': percentile(samples, 99),
+        }
+
+
+def percentile(sorted_samples, percent):
+    """Nearest-rank percentile of sorted samples, None if there are no samples."""
+
+    if not sorted_samples:
+        return None
+    index = max(0, -(-len(sorted_samples) * percent // 100) - 1)
+    return sorted_samples[int(index)]
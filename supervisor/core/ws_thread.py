@@ -1,14 +1,17 @@
+import queue
 import sys
 import websocket
 import threading
 import traceback
 import ssl
-from time import sleep
-import json
-import decimal
+import time
 import logging
-from supervisor.core.auth import generate_expires, generate_signature
+from supervisor.core.auth import Signer, generate_expires
+from supervisor.core.price_feed import PriceFeed
+from supervisor.core.tables import InstrumentTable, KeyedTable, OrderBook, OrderTable, RingTable
+from supervisor.core.utils import codec
 from supervisor.core.utils.log import setup_api_logger
+from supervisor.core.utils.stats import LatencyStats
 from supervisor.core.utils.math import to_nearest
 from urllib.parse import urlparse, urlunparse
 from future.utils import iteritems
@@ -19,15 +22,82 @@ class BitMEXWebsocket:
     # Don't grow a table larger than this amount. Helps cap memory usage.
     MAX_TABLE_LEN = 200
 
-    def __init__(self, base_url, apiKey, apiSecret):
+    # Tables kept in ring buffers and their capacities, other tables are keyed and not trimmed.
+    TABLE_CAPACITY = {
+        'trade': MAX_TABLE_LEN,
+        'quote': MAX_TABLE_LEN,
+        'execution': 1000,
+    }
+
+    # Tables whose partials must arrive before connect() returns
+    MARKET_TABLES = ('instrument', 'trade', 'quote')
+    ACCOUNT_TABLES = ('margin', 'position', 'order')
+
+    OVERFLOW_POLICIES = ('block', 'resync')
+    # tables keeping the last state of every symbol, merging their updates loses nothing but
+    # intermediate states, unlike event tables such as trade
+    CONFLATABLE_TABLES = ('instrument', 'quote')
+
+    def __init__(self, base_url, apiKey, apiSecret, table_capacity=None, price_feed=None, signer=None,
+                 connect_timeout=5, partials_timeout=60, reconnect=True, reconnect_delay=0.1,
+                 max_reconnect_delay=10, ping_interval=5, pong_timeout=5, queue_size=10000, overflow='block',
+                 conflate=None):
+        """
+
+        :param connect_timeout: seconds to wait for the websocket to open
+        :param partials_timeout: seconds to wait for partials of the subscribed tables after it has opened
+        :param reconnect: reconnect after the connection drops, otherwise exit
+        :param reconnect_delay: seconds before the first reconnect attempt, doubled after every failed one
+            up to max_reconnect_delay
+        :param ping_interval: seconds without messages, after which a ping is sent
+        :param pong_timeout: seconds to wait for the pong, then the connection is considered dead and reopened
+        :param queue_size: max number of received frames waiting for the processor thread
+        :param overflow: what the reader does when the queue is full: 'block' waits for room, so the server is
+            slowed down by TCP flow control, 'resync' drops the frame and reconnects to get fresh table images
+        :param conflate: {table: seconds}, updates and inserts of these tables are merged by symbol and applied
+            at most once in the given seconds or when the table is read, 0 applies them only on reads,
+            e.g. {'instrument': 0.1, 'quote': 0.1}, only CONFLATABLE_TABLES are allowed. Instrument last prices
+            are published to price_feed as they come, listeners are notified when updates are applied
+        """
+
+        self.connect_timeout = connect_timeout
+        self.partials_timeout = partials_timeout
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.conflate = dict(conflate or {})
         self.apiKey = apiKey
         self.apiSecret = apiSecret
+        # may be shared with the REST client of the same key
+        if signer is None and apiSecret is not None:
+            signer = Signer(apiKey, apiSecret)
+        self.signer = signer
 
         self.base_url = base_url
 
+        # Capacity may be set per table, e.g. {'trade': 50, 'execution': 5000}
+        self.table_capacity = {**BitMEXWebsocket.TABLE_CAPACITY, **(table_capacity or {})}
+
+        # (callback, tables) pairs, called from the websocket thread when a table changes
+        self.listeners = []
+
+        # last prices of the instrument stream are published here
+        self.price_feed = price_feed if price_feed is not None else PriceFeed()
+
         self.logger = logging.getLogger('core')
+        self.ws = None
         self.__reset()
 
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s' % (self.OVERFLOW_POLICIES,))
+        unsupported = sorted(set(self.conflate) - set(self.CONFLATABLE_TABLES))
+        if unsupported:
+            raise ValueError('Only %s tables may be conflated, got %s' % (self.CONFLATABLE_TABLES, unsupported))
+
     def __del__(self):
         self.exit()
 
@@ -35,6 +105,7 @@ class BitMEXWebsocket:
         '''Connect to the websocket and initialize data stores.'''
 
         self.logger.debug("Connecting WebSocket.")
+        self._connect_started = started = time.perf_counter()
         self.symbol = symbol
         self.shouldAuth = shouldAuth
 
@@ -56,26 +127,25 @@ class BitMEXWebsocket:
         wsURL = urlunparse(urlParts)
         self.logger.info("Connecting to %s" % wsURL)
         self.__connect(wsURL)
-        self.logger.info('Connected to WS. Waiting for data images, this may take a moment...')
+        self.startup_metrics['connect_time'] = time.perf_counter() - started
+        self.logger.info('Connected to WS in %.3fs. Waiting for data images, this may take a moment...',
+                         self.startup_metrics['connect_time'])
 
         # Connected. Wait for partials
-        self.__wait_for_symbol(symbol)
-        if self.shouldAuth:
-            self.__wait_for_account()
-        self.logger.info('Got all market data. Starting.')
+        tables = self.MARKET_TABLES + (self.ACCOUNT_TABLES if self.shouldAuth else ())
+        self.__wait_for_partials(tables)
+        self.startup_metrics['startup_time'] = time.perf_counter() - started
+        self.logger.info('Got all market data in %.3fs. Starting.', self.startup_metrics['startup_time'])
 
     #
     # Data methods
     #
     def get_instrument(self, symbol):
-        instruments = self.data['instrument']
-        matchingInstruments = [i for i in instruments if i['symbol'] == symbol]
-        if len(matchingInstruments) == 0:
+        if self._pending.get('instrument'):
+            self.flush_conflated('instrument')
+        instrument = self.data['instrument'].by_symbol(symbol)
+        if instrument is None:
             raise Exception("Unable to find instrument or index with symbol: " + symbol)
-        instrument = matchingInstruments[0]
-        # Turn the 'tickSize' into 'tickLog' for use in rounding
-        # http://stackoverflow.com/a/6190291/832202
-        instrument['tickLog'] = decimal.Decimal(str(instrument['tickSize'])).as_tuple().exponent * -1
         return instrument
 
     def get_ticker(self, symbol):
@@ -113,9 +183,12 @@ class BitMEXWebsocket:
         # return self.data['orderBook25'][0]
 
     def open_orders(self):
-        orders = self.data['order']
-        # Filter to only open orders (leavesQty > 0) and those that we actually placed
-        return [o for o in orders if o['leavesQty'] > 0]
+        # Only open orders (leavesQty > 0), the order table tracks them as they change
+        return self.data['order'].open_rows()
+
+    def open_order_objects(self):
+        """Return cached Order objects of open orders, see OrderTable.open_orders()."""
+        return self.data['order'].open_orders()
 
     def position(self, symbol):
         positions = self.data['position']
@@ -128,6 +201,16 @@ class BitMEXWebsocket:
     def recent_trades(self):
         return self.data['trade']
 
+    def add_listener(self, callback, tables=None):
+        """Call callback(table) after every change of the given tables, of any table if tables is None.
+
+        Callbacks run in the frame processor thread, so they must return quickly.
+        """
+        self.listeners.append((callback, set(tables) if tables is not None else None))
+
+    def remove_listener(self, callback):
+        self.listeners = [(c, t) for c, t in self.listeners if c != callback]
+
     #
     # Custom methods
     #
@@ -135,9 +218,12 @@ class BitMEXWebsocket:
     def get_order_book(self, depth=25):
         if not (0 <= depth <= 25):
             raise ValueError('Depth must be positive integer under or equal 25')
-        order_book = self.data['orderBookL2_25']
-        filtered = list(sorted(order_book, key=lambda x: x['price']))
-        return filtered[25 - depth:25 + depth]
+        return self.data['orderBookL2_25'].levels(depth)
+
+    def get_order_book_l2(self):
+        """Return the OrderBook kept for the subscribed symbol."""
+
+        return self.data['orderBookL2_25']
 
     def get_execution(self, clordid, symbol):
         executions = self.data['execution']
@@ -153,6 +239,15 @@ class BitMEXWebsocket:
         return [o for o in executions if
                 o['symbol'] == symbol and o['execComm'] is not None and o['text'] == 'Liquidation']
 
+    def get_order_status(self, order_id=None, clordid=None):
+        return self.data['order'].status(order_id=order_id, clordid=clordid)
+
+    def get_order_statuses(self, identifiers):
+        """Return statuses for a list of (orderID, clOrdID) pairs in one pass."""
+
+        orders = self.data['order']
+        return [orders.status(order_id=order_id, clordid=clordid) for order_id, clordid in identifiers]
+
     def get_orders(self, symbol):
         orders = self.data['order']
         return [o for o in orders if o['symbol'] == symbol]
@@ -180,9 +275,84 @@ class BitMEXWebsocket:
         self.logger.error(err)
         self.exit()
 
+    def is_stale(self, table=None, max_age=None):
+        """Check if data of the table, of any table if None, may be outdated.
+
+        It is if the table keeps data of a dropped connection, which isn't resynced yet, if a ping has got
+        no pong in pong_timeout seconds, or if the table hasn't been updated for max_age seconds.
+        """
+
+        if table is not None:
+            if table in self._stale_tables:
+                return True
+        elif self._stale_tables:
+            return True
+        if self.__pong_overdue(time.monotonic()):
+            return True
+        if max_age is not None:
+            ages = self.table_ages()
+            if table is not None:
+                return ages.get(table, float('inf')) > max_age
+            return any(age > max_age for age in ages.values())
+        return False
+
+    def table_ages(self):
+        """Return seconds since the last message of every table."""
+
+        now = time.monotonic()
+        return {table: now - updated_at for table, updated_at in list(self._table_updated_at.items())}
+
+    def silence(self):
+        """Return seconds since the last message of any kind, pongs included."""
+
+        return time.monotonic() - self._last_message_at
+
+    def heartbeat_metrics(self):
+        """Return ping round trip percentiles, seconds since the last message and ages of the tables."""
+
+        return {
+            'latency': self.latency.snapshot(),
+            'pings': self._pings,
+            'missed_pongs': self._missed_pongs,
+            'silence': self.silence(),
+            'table_ages': self.table_ages(),
+        }
+
+    def reconnect_metrics(self):
+        """Return number of reconnects and seconds the last one took to reopen the transport and resync tables."""
+
+        return dict(self._reconnect_metrics, connected=self.connected, stale_tables=sorted(self._stale_tables))
+
+    def flush_conflated(self, table=None):
+        """Apply pending conflated updates of the table, of all tables if None, before reading it directly."""
+
+        with self._conflation_lock:
+            for name in [table] if table is not None else list(self._pending):
+                self.__flush(name)
+
+    def conflation_metrics(self):
+        """Return numbers of received, merged and applied updates and of pending ones for every conflated table."""
+
+        with self._conflation_lock:
+            return {table: dict(stats, pending=len(self._pending.get(table, ())))
+                    for table, stats in self._conflation_stats.items()}
+
+    def queue_metrics(self):
+        """Return depth of the frame queue, frames passed through it, dropped ones and processing lag in seconds."""
+
+        return dict(self._queue_stats, depth=self._queue.qsize(), capacity=self.queue_size, overflow=self.overflow,
+                    lag=self.processing_lag.snapshot())
+
     def exit(self):
         self.exited = True
-        self.ws.close()
+        # wake up connect() and the reconnect backoff if they are waiting
+        self._opened.set()
+        self._exit_event.set()
+        with self._partials_lock:
+            for event in self._partials.values():
+                event.set()
+        if self.ws is not None:
+            self.__shutdown(self.ws)
 
     #
     # Private methods
@@ -192,33 +362,114 @@ class BitMEXWebsocket:
         '''Connect to the websocket in a thread.'''
         self.logger.debug("Starting thread")
 
-        ssl_defaults = ssl.get_default_verify_paths()
-        sslopt_ca_certs = {'ca_certs': ssl_defaults.cafile}
-        self.ws = websocket.WebSocketApp(wsURL,
-                                         on_message=self.__on_message,
-                                         on_close=self.__on_close,
-                                         on_open=self.__on_open,
-                                         on_error=self.__on_error,
-                                         header=self.__get_auth()
-                                         )
-
         setup_api_logger('websocket', log_level=logging.INFO)
-        self.wst = threading.Thread(target=lambda: self.ws.run_forever(sslopt=sslopt_ca_certs))
+        self.wst = threading.Thread(target=self.__run, args=(wsURL,))
         self.wst.daemon = True
         self.wst.start()
         self.logger.info("Started thread")
 
-        # Wait for connect before continuing
-        conn_timeout = 5
-        while (not self.ws.sock or not self.ws.sock.connected) and conn_timeout and not self._error:
-            sleep(1)
-            conn_timeout -= 1
+        self.heartbeat_thread = threading.Thread(target=self.__heartbeat, daemon=True)
+        self.heartbeat_thread.start()
+        # frames are read in the websocket thread and applied to tables in this one
+        self.processor_thread = threading.Thread(target=self.__process_frames, daemon=True)
+        self.processor_thread.start()
 
-        if not conn_timeout or self._error:
+        # Wait for connect before continuing, __on_open or an error wakes us up
+        if not self._opened.wait(self.connect_timeout) or self._error or self.exited:
             self.logger.error("Couldn't connect to WS! Exiting.")
             self.exit()
             sys.exit(1)
 
+    def __run(self, wsURL):
+        '''Keep the transport connected, reconnect it with backoff after it drops.
+
+        Tables stay readable while reconnecting and are marked stale until their new partials replace them.
+        '''
+
+        ssl_defaults = ssl.get_default_verify_paths()
+        sslopt_ca_certs = {'ca_certs': ssl_defaults.cafile}
+        delay = self.reconnect_delay
+        while not self.exited:
+            # the auth nonce is signed anew for every connection
+            self.ws = websocket.WebSocketApp(wsURL,
+                                             on_message=lambda ws, message: self.__on_frame(message),
+                                             on_close=lambda ws, *args: self.__on_close(),
+                                             on_open=lambda ws: self.__on_open(),
+                                             on_error=lambda ws, error: self.__on_error(error),
+                                             header=self.__get_auth()
+                                             )
+            self.ws.run_forever(sslopt=sslopt_ca_certs)
+
+            if self.exited:
+                break
+            if not self.reconnect:
+                self.exit()
+                break
+
+            if self.connected:
+                # the connection has been up, so start over with the shortest delay
+                self.connected = False
+                delay = self.reconnect_delay
+                self._disconnected_at = time.perf_counter()
+                self._stale_tables = frozenset(self.data)
+                self.logger.warning('Websocket disconnected, reconnecting in %.2fs.', delay)
+            if self._exit_event.wait(delay):
+                break
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def __heartbeat(self):
+        '''Send a ping after ping_interval seconds of silence, reopen the connection if no pong comes.'''
+
+        tick = min(self.ping_interval, self.pong_timeout) / 4
+        dead_ws = None
+        while not self._exit_event.wait(tick):
+            if not self.connected or self.ws is dead_ws:
+                continue
+            now = time.monotonic()
+            if self._ping_sent_at is None:
+                if now - self._last_message_at >= self.ping_interval:
+                    self._ping_sent_at = now
+                    self._pings += 1
+                    try:
+                        self.ws.send('ping')
+                    except Exception as e:
+                        self.logger.warning('Unable to send ping: %s', e)
+            elif self.__pong_overdue(now):
+                # the connection may be half-open, closing it makes __run reconnect
+                self._missed_pongs += 1
+                self.logger.warning('No pong in %ss, reconnecting the websocket.', self.pong_timeout)
+                dead_ws = self.ws
+                self.__shutdown(dead_ws)
+
+    @staticmethod
+    def __shutdown(ws):
+        '''Close the connection from another thread than the reader.
+
+        The socket is shut down instead of closed, the reader waiting on it wakes up and closes it itself.
+        A socket closed under a waiting reader may leave it waiting forever.
+        '''
+
+        ws.keep_running = False
+        sock = ws.sock
+        if sock is not None:
+            try:
+                sock.send_close()
+            except Exception:
+                pass
+            sock.abort()
+
+    def __pong_overdue(self, now):
+        '''Check if the pong of the last ping hasn't come in pong_timeout seconds.
+
+        The reader doesn't read frames, pongs as well, while it waits for room in the full queue,
+        so the time it waited isn't counted.
+        '''
+
+        ping_sent_at = self._ping_sent_at
+        if ping_sent_at is None or self._reader_blocked:
+            return False
+        return now - max(ping_sent_at, self._reader_unblocked_at) > self.pong_timeout
+
     def __get_auth(self):
         """Return auth headers. Will use API Keys if present in settings."""
 
@@ -231,36 +482,111 @@ class BitMEXWebsocket:
         nonce = generate_expires()
         return [
             "api-expires: " + str(nonce),
-            "api-signature: " + generate_signature(self.apiSecret, 'GET', '/realtime', nonce, ''),
+            "api-signature: " + self.signer.sign('GET', '/realtime', nonce),
             "api-key:" + self.apiKey
         ]
 
-    def __wait_for_account(self):
-        '''On subscribe, this data will come down. Wait for it.'''
-        # Wait for the keys to show up from the ws
-        while not {'margin', 'position', 'order'} <= set(self.data):
-            sleep(0.1)
-
-    def __wait_for_symbol(self, symbol):
-        '''On subscribe, this data will come down. Wait for it.'''
-        while not {'instrument', 'trade', 'quote'} <= set(self.data):
-            sleep(0.1)
+    def __partial_event(self, table):
+        with self._partials_lock:
+            event = self._partials.get(table)
+            if event is None:
+                event = self._partials[table] = threading.Event()
+                if self.exited:
+                    event.set()
+            return event
+
+    def __wait_for_partials(self, tables):
+        '''On subscribe, partials of the tables will come down. Wait for them.'''
+
+        deadline = time.monotonic() + self.partials_timeout
+        for table in tables:
+            if not self.__partial_event(table).wait(max(0.0, deadline - time.monotonic())):
+                self.logger.error("Didn't get the %s table in %ss! Exiting.", table, self.partials_timeout)
+                self.exit()
+                sys.exit(1)
+            if self._error or self.exited:
+                self.logger.error("Websocket closed while waiting for the %s table! Exiting.", table)
+                sys.exit(1)
 
     def __send_command(self, command, args):
         """Send a raw command."""
-        self.ws.send(json.dumps({"op": command, "args": args or []}))
+        self.ws.send(codec.dumps({"op": command, "args": args or []}))
+
+    def __on_frame(self, message):
+        '''Reader thread handler: answer the heartbeat and queue the frame for the processor thread.'''
+
+        self._last_message_at = received_at = time.monotonic()
+        if message == 'pong':
+            if self._ping_sent_at is not None:
+                self.latency.record(received_at - self._ping_sent_at)
+                self._ping_sent_at = None
+            return
 
-    def __on_message(self, message):
+        item = (self._generation, received_at, message)
+        stats = self._queue_stats
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow == 'block':
+                stats['blocked'] += 1
+                self._reader_blocked = True
+                try:
+                    while not self.exited:
+                        try:
+                            self._queue.put(item, timeout=0.5)
+                            break
+                        except queue.Full:
+                            pass
+                finally:
+                    self._reader_unblocked_at = time.monotonic()
+                    self._reader_blocked = False
+            else:
+                stats['dropped'] += 1
+                if self._dropped_generation != self._generation:
+                    # tables miss this update now, skip the rest of the connection and get new partials
+                    self._dropped_generation = self._generation
+                    stats['resyncs'] += 1
+                    self.logger.warning('Websocket queue is full, reconnecting to resync tables.')
+                    self.ws.close(timeout=1)
+                return
+        stats['enqueued'] += 1
+        depth = self._queue.qsize()
+        if depth > stats['max_depth']:
+            stats['max_depth'] = depth
+
+    def __process_frames(self):
+        '''Processor thread: decode queued frames and apply them to tables.'''
+
+        intervals = [interval for interval in self.conflate.values() if interval > 0]
+        timeout = min([0.2] + intervals)
+        while not self._exit_event.is_set():
+            if intervals:
+                self.__flush_due()
+            try:
+                generation, received_at, message = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            # frames of a dropped connection would be applied to tables, which wait for new partials anyway
+            if generation < self._generation or generation == self._dropped_generation:
+                continue
+            self.__on_message(message, received_at)
+            self._queue_stats['processed'] += 1
+            self.processing_lag.record(time.monotonic() - received_at)
+
+    def __on_message(self, message, received_at=None):
         '''Handler for parsing WS messages.'''
-        message = json.loads(message)
-        self.logger.debug(json.dumps(message))
+        # log the raw frame, it costs nothing unless DEBUG is enabled
+        self.logger.debug(message)
+        if received_at is None:
+            received_at = time.monotonic()
+        message = codec.loads(message)
 
         table = message['table'] if 'table' in message else None
         action = message['action'] if 'action' in message else None
         try:
             if 'subscribe' in message:
                 if message['success']:
-                    self.logger.debug("Subscribed to %s." % message['subscribe'])
+                    self.logger.debug("Subscribed to %s.", message['subscribe'])
                 else:
                     self.error("Unable to subscribe to %s. Error: \"%s\" Please check and restart." %
                                (message['request']['args'][0], message['error']))
@@ -271,92 +597,240 @@ class BitMEXWebsocket:
                     self.error("API Key incorrect, please check and restart.")
             elif action:
 
-                if table not in self.data:
-                    self.data[table] = []
-
-                if table not in self.keys:
-                    self.keys[table] = []
-
-                # There are four possible actions from the WS:
-                # 'partial' - full table image
-                # 'insert'  - new row
-                # 'update'  - update row
-                # 'delete'  - delete row
-                if action == 'partial':
-                    self.logger.debug("%s: partial" % table)
-                    self.data[table] += message['data']
-                    # Keys are communicated on partials to let you know how to uniquely identify
-                    # an item. We use it for updates.
-                    self.keys[table] = message['keys']
-                elif action == 'insert':
-                    self.logger.debug('%s: inserting %s' % (table, message['data']))
-                    self.data[table] += message['data']
-
-                    # Limit the max length of the table to avoid excessive memory usage.
-                    # Don't trim orders because we'll lose valuable state if we do.
-                    if table not in ['order', 'orderBookL2'] and len(self.data[table]) > BitMEXWebsocket.MAX_TABLE_LEN:
-                        self.data[table] = self.data[table][(BitMEXWebsocket.MAX_TABLE_LEN // 2):]
-
-                elif action == 'update':
-                    self.logger.debug('%s: updating %s' % (table, message['data']))
-                    # Locate the item in the collection and update it.
-                    for updateData in message['data']:
-                        item = findItemByKeys(self.keys[table], self.data[table], updateData)
-                        if not item:
-                            continue  # No item found to update. Could happen before push
-
-                        # Log executions
-                        if table == 'order':
-                            is_canceled = 'ordStatus' in updateData and updateData['ordStatus'] == 'Canceled'
-                            if 'cumQty' in updateData and not is_canceled:
-                                contExecuted = updateData['cumQty'] - item['cumQty']
-                                if contExecuted > 0:
-                                    instrument = self.get_instrument(item['symbol'])
-                                    # self.logger.info("Execution: %s %d Contracts of %s at %.*f" %
-                                    #          (item['side'], contExecuted, item['symbol'],
-                                    #           instrument['tickLog'], item['price']))
-
-                        # Update this item.
-                        item.update(updateData)
-
-                        # Remove canceled / filled orders
-                        # if table == 'order' and item['leavesQty'] <= 0:
-                        #     self.data[table].remove(item)
-
-                elif action == 'delete':
-                    self.logger.debug('%s: deleting %s' % (table, message['data']))
-                    # Locate the item in the collection and remove it.
-                    for deleteData in message['data']:
-                        item = findItemByKeys(self.keys[table], self.data[table], deleteData)
-                        self.data[table].remove(item)
+                if table not in self.data and action != 'partial':
+                    self.data[table] = self.__new_table(table)
+
+                if table in self.conflate:
+                    if action in ('update', 'insert'):
+                        # applied later, listeners are notified then
+                        with self._conflation_lock:
+                            self.__conflate(table, action, message['data'])
+                        self._table_updated_at[table] = received_at
+                        if table == 'instrument':
+                            # trailing orders follow every price change, even if the table isn't updated yet
+                            for row in message['data']:
+                                if 'lastPrice' in row:
+                                    self.price_feed.publish(row.get('symbol'), row['lastPrice'])
+                        return
+                    with self._conflation_lock:
+                        if action == 'partial':
+                            # the new image supersedes pending updates
+                            self._pending.pop(table, None)
+                        else:
+                            self.__flush(table)
+                        self.__apply(table, action, message['data'], message.get('keys'))
                 else:
-                    raise Exception("Unknown action: %s" % action)
+                    self.__apply(table, action, message['data'], message.get('keys'))
+
+                self._table_updated_at[table] = received_at
+                self.__notify_listeners(table)
         except:
             self.logger.error(traceback.format_exc())
 
+    def __conflate(self, table, action, data):
+        '''Merge updates and inserts into the pending ones of the same rows. Called under the conflation lock.'''
+
+        pending = self._pending.setdefault(table, {})
+        stats = self._conflation_stats[table]
+        store = self.data[table]
+        for row in data:
+            stats['received'] += 1
+            # quote has no keys, instrument gets them with its partial, both keep one row per symbol
+            key = store.key_of(row) if store.keys else (row.get('symbol'),)
+            pending_row = pending.get(key)
+            if pending_row is None:
+                pending[key] = [action, row]
+                continue
+            stats['merged'] += 1
+            if action == 'insert':
+                # the whole row is replaced
+                pending_row[0] = action
+                pending_row[1] = row
+            else:
+                pending_row[1].update(row)
+
+    def __flush(self, table, notify=False):
+        '''Apply pending conflated rows of the table. Called under the conflation lock.'''
+
+        self._flushed_at[table] = time.monotonic()
+        pending = self._pending.pop(table, None)
+        if not pending:
+            return
+        for action, row in pending.values():
+            self.__apply(table, action, [row])
+        self._conflation_stats[table]['applied'] += len(pending)
+        if notify:
+            self.__notify_listeners(table)
+
+    def __flush_due(self):
+        '''Apply pending rows of tables, whose conflation interval has passed.'''
+
+        now = time.monotonic()
+        for table, interval in self.conflate.items():
+            if interval > 0 and self._pending.get(table) and now - self._flushed_at.get(table, 0) >= interval:
+                with self._conflation_lock:
+                    self.__flush(table, notify=True)
+
+    def __apply(self, table, action, data, keys=None):
+        """Apply a table action to the data stores."""
+
+        # There are four possible actions from the WS:
+        # 'partial' - full table image
+        # 'insert'  - new row
+        # 'update'  - update row
+        # 'delete'  - delete row
+        if action == 'partial':
+            self.logger.debug("%s: partial", table)
+            # Keys are communicated on partials to let you know how to uniquely identify
+            # an item. We use it for updates.
+            # the image is loaded into a new table, so readers see either the old one or the whole new one
+            new_table = self.__new_table(table)
+            new_table.set_keys(keys)
+            new_table.insert(data)
+            self.data[table] = new_table
+            if table in self._stale_tables:
+                self.__resynced(table)
+            if table == 'instrument':
+                for instrument in data:
+                    self.price_feed.publish(instrument['symbol'], instrument.get('lastPrice'))
+            if self._connect_started is not None:
+                self.startup_metrics['partials'].setdefault(table, time.perf_counter() - self._connect_started)
+            self.__partial_event(table).set()
+        elif action == 'insert':
+            self.logger.debug('%s: inserting %s', table, data)
+            # Ring buffer tables evict their oldest rows to avoid excessive memory usage.
+            self.data[table].insert(data)
+            if table == 'instrument':
+                for instrument in data:
+                    self.price_feed.publish(instrument['symbol'], instrument.get('lastPrice'))
+
+        elif action == 'update':
+            self.logger.debug('%s: updating %s', table, data)
+            # Locate the item in the collection and update it.
+            for updateData in data:
+                item = self.data[table].find(updateData)
+                if not item:
+                    continue  # No item found to update. Could happen before push
+
+                # Log executions
+                if table == 'order':
+                    is_canceled = 'ordStatus' in updateData and updateData['ordStatus'] == 'Canceled'
+                    if 'cumQty' in updateData and not is_canceled:
+                        contExecuted = updateData['cumQty'] - item['cumQty']
+                        if contExecuted > 0:
+                            instrument = self.get_instrument(item['symbol'])
+                            # self.logger.info("Execution: %s %d Contracts of %s at %.*f" %
+                            #          (item['side'], contExecuted, item['symbol'],
+                            #           instrument['tickLog'], item['price']))
+
+                # Update this item.
+                self.data[table].update(item, updateData)
+
+                if table == 'instrument' and 'lastPrice' in updateData:
+                    self.price_feed.publish(item['symbol'], updateData['lastPrice'])
+
+                # Remove canceled / filled orders
+                # if table == 'order' and item['leavesQty'] <= 0:
+                #     self.data[table].delete(item)
+
+        elif action == 'delete':
+            self.logger.debug('%s: deleting %s', table, data)
+            # Locate the item in the collection and remove it.
+            for deleteData in data:
+                self.data[table].delete(deleteData)
+        else:
+            raise Exception("Unknown action: %s" % action)
+
+    def __notify_listeners(self, table):
+        for callback, tables in self.listeners:
+            if tables is None or table in tables:
+                try:
+                    callback(table)
+                except Exception:
+                    self.logger.error(traceback.format_exc())
+
+    def __resynced(self, table):
+        self._stale_tables = self._stale_tables - {table}
+        if not self._stale_tables:
+            resync_time = time.perf_counter() - self._disconnected_at
+            self._reconnect_metrics['last_resync_time'] = resync_time
+            self.logger.info('Websocket tables resynced in %.3fs after disconnect.', resync_time)
+
     def __on_open(self):
         self.logger.debug("Websocket Opened.")
+        if self.exited:
+            # exit() came while reconnecting and couldn't close the connection, which wasn't open yet
+            self.ws.close(timeout=1)
+            return
+        if self._disconnected_at is not None and not self.connected:
+            self._reconnect_metrics['reconnects'] += 1
+            self._reconnect_metrics['last_transport_downtime'] = time.perf_counter() - self._disconnected_at
+        self._last_message_at = time.monotonic()
+        self._ping_sent_at = None
+        self._generation += 1
+        self.connected = True
+        self._opened.set()
 
     def __on_close(self):
         self.logger.info('Websocket Closed')
-        self.exit()
 
     def __on_error(self, error):
-        if not self.exited:
+        if self.exited:
+            return
+        if self.reconnect:
+            # transport errors are followed by a reconnect
+            self.logger.warning('Websocket error: %s', error)
+        else:
             self.error(error)
 
+    def __new_table(self, table):
+        if table in self.table_capacity:
+            return RingTable(self.table_capacity[table])
+        if table.startswith('orderBookL2'):
+            return OrderBook()
+        if table == 'instrument':
+            return InstrumentTable()
+        if table == 'order':
+            return OrderTable()
+        # Don't trim orders because we'll lose valuable state if we do.
+        return KeyedTable()
+
     def __reset(self):
         self.data = {}
-        self.keys = {}
         self.exited = False
         self._error = None
-
-
-def findItemByKeys(keys, table, matchData):
-    for item in table:
-        matched = True
-        for key in keys:
-            if item[key] != matchData[key]:
-                matched = False
-        if matched:
-            return item
+        self._opened = threading.Event()
+        self._exit_event = threading.Event()
+        self._connect_started = None
+        self.connected = False
+        self._disconnected_at = None
+        # tables with data of the dropped connection, replaced one by one by new partials
+        self._stale_tables = frozenset()
+        self._reconnect_metrics = {'reconnects': 0, 'last_transport_downtime': None, 'last_resync_time': None}
+        # heartbeat, times are time.monotonic()
+        self._last_message_at = time.monotonic()
+        self._ping_sent_at = None
+        self._reader_blocked = False  # the reader waits for room in the full queue
+        self._reader_unblocked_at = 0.0
+        self._table_updated_at = {}
+        self._pings = 0
+        self._missed_pongs = 0
+        self.latency = LatencyStats()  # ping round trips, seconds
+        # (connection generation, receive time, raw frame) from the reader to the processor thread
+        self._queue = queue.Queue(self.queue_size)
+        self._generation = 0
+        self._dropped_generation = None  # frames of this connection are skipped after one was dropped
+        self._queue_stats = {'enqueued': 0, 'processed': 0, 'max_depth': 0, 'blocked': 0, 'dropped': 0,
+                             'resyncs': 0}
+        self.processing_lag = LatencyStats()  # seconds from receiving a frame to applying it
+        # conflation: table -> {row key: [action, row]} waiting to be applied
+        self._pending = {}
+        self._flushed_at = {}
+        self._conflation_stats = {table: {'received': 0, 'merged': 0, 'applied': 0} for table in self.conflate}
+        # reentrant, listeners notified by a flush may read conflated tables
+        self._conflation_lock = threading.RLock()
+        # table -> Event set on its first partial
+        self._partials = {}
+        self._partials_lock = threading.Lock()
+        # seconds since connect() started
+        self.startup_metrics = {'connect_time': None, 'startup_time': None, 'partials': {}}
@@ -0,0 +1,79 @@
+import unittest
+
+from supervisor.core import settings
+from supervisor.core.interface import Exchange
+from supervisor.core.orders import Order, new_clordid
+from supervisor.core.retry import RetryPolicy
+from supervisor.core.utils.errors import DuplicateClordid, MaxRetriesReachedError
+from tests.stub_server import BitMEXStub
+
+
+class ClordidRetriesTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.stub = BitMEXStub().start()
+        self.exchange = Exchange(symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                                 api_secret=settings.TEST_API_SECRET, test=False, connect_ws=False)
+        self.exchange.conn.base_url = self.stub.url
+        self.exchange.conn.timeout = 0.2
+        self.exchange.conn.retry_policy = RetryPolicy(base_delay=0.01)
+
+    def tearDown(self) -> None:
+        self.exchange.exit()
+        self.stub.stop()
+
+    def test_timed_out_order_is_placed_once(self):
+        order = Order(order_type='Limit', qty=228, price=1000, side='Buy', clordid=new_clordid())
+        self.stub.delays = [0.5]
+
+        self.exchange.place_order(order)
+
+        # the first request timed out, the retry was rejected as duplicate and the order was recovered
+        self.assertEqual(1, len(self.stub.orders))
+        self.assertEqual(self.stub.orders[0]['orderID'], order.order_id)
+        self.assertEqual(['POST', 'POST', 'GET'], [verb for verb, _, _ in self.stub.requests])
+
+    def test_timed_out_bulk_orders_are_placed_once(self):
+        orders = [Order(order_type='Limit', qty=228, price=1000 + i, side='Buy', clordid=new_clordid())
+                  for i in range(3)]
+        self.stub.delays = [0.5]
+
+        self.exchange.bulk_place_orders(orders)
+
+        self.assertEqual(3, len(self.stub.orders))
+        self.assertEqual([o['orderID'] for o in self.stub.orders], [order.order_id for order in orders])
+
+    def test_timed_out_amend_is_applied_once(self):
+        order = Order(order_type='Limit', qty=228, price=1000, side='Buy', clordid=new_clordid())
+        self.exchange.place_order(order)
+        self.stub.delays = [0.5]
+
+        self.exchange.move_order(order, to=1001)
+
+        self.assertEqual(1001, self.stub.orders[0]['price'])
+        self.assertEqual(self.stub.orders[0]['clOrdID'], order.clordid)
+        self.assertEqual(['POST', 'PUT', 'PUT', 'GET'], [verb for verb, _, _ in self.stub.requests])
+
+    def test_market_order_retried(self):
+        self.stub.delays = [0.5]
+
+        result = self.exchange.place_market_order(-100)
+
+        self.assertEqual(1, len(self.stub.orders))
+        self.assertEqual('Sell', result['side'])
+
+    def test_duplicate_of_another_order(self):
+        clordid = new_clordid()
+        self.stub.add_order(clOrdID=clordid, ordType='Limit', orderQty=228, side='Buy', price=999)
+        order = Order(order_type='Limit', qty=228, price=1000, side='Buy', clordid=clordid)
+
+        with self.assertRaises(DuplicateClordid):
+            self.exchange.place_order(order)
+
+    def test_order_without_clordid_not_retried(self):
+        order = Order(order_type='Limit', qty=228, price=1000, side='Buy')
+        self.stub.delays = [0.5]
+
+        with self.assertRaises(MaxRetriesReachedError):
+            self.exchange.place_order(order)
+        self.assertEqual(1, len(self.stub.requests))
@@ -167,7 +167,7 @@ class OrdersCallbacksTests(unittest.TestCase):
         order._on_fill = callback
         self.supervisor.add_order(order)
 
-        self.exchange_mock.get_order_status_ws.return_value = 'Filled'
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: ['Filled'] * len(orders)
 
         self.supervisor.run_cycle()
 
@@ -184,7 +184,7 @@ class OrdersCallbacksTests(unittest.TestCase):
         order._on_reject = callback
         self.supervisor.add_order(order)
 
-        self.exchange_mock.get_order_status_ws.return_value = 'Rejected'
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: ['Rejected'] * len(orders)
 
         self.supervisor.run_cycle()
 
@@ -216,7 +216,7 @@ class OrdersCallbacksTests(unittest.TestCase):
         self.supervisor.add_order(order_3)
         self.supervisor.add_order(order_4)
 
-        self.exchange_mock.get_order_status_ws.return_value = 'Filled'
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: ['Filled'] * len(orders)
 
         self.supervisor.run_cycle()
 
@@ -65,7 +65,7 @@ class TrailingStopTests(unittest.TestCase):
 
         order.order_id = 1234
         self.exchange_mock.get_open_orders_ws.return_value = []
-        self.exchange_mock.get_order_status_ws.return_value = 'Filled'
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: ['Filled'] * len(orders)
 
         sleep(0.5)
 
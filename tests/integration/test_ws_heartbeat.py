@@ -0,0 +1,52 @@
+import time
+import unittest
+
+from supervisor.core.ws_thread import BitMEXWebsocket
+from tests.integration.test_ws_reconnect import wait_for
+from tests.ws_stub_server import WebsocketStub
+
+
+class WebsocketHeartbeatTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.stub = WebsocketStub().start()
+        self.stub.add_partial('instrument', [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10000}],
+                              keys=['symbol'])
+        self.stub.add_partial('trade', [])
+        self.stub.add_partial('quote', [])
+        self.ws = BitMEXWebsocket(self.stub.url, None, None, reconnect_delay=0.01, ping_interval=0.05,
+                                  pong_timeout=0.2)
+        self.ws.connect(shouldAuth=False)
+
+    def tearDown(self) -> None:
+        self.ws.exit()
+        self.stub.stop()
+
+    def test_ping_round_trip(self):
+        wait_for(lambda: self.ws.latency.snapshot()['count'] >= 2)
+
+        metrics = self.ws.heartbeat_metrics()
+        self.assertLess(metrics['latency']['p99'], 0.2)
+        self.assertEqual(0, metrics['missed_pongs'])
+        self.assertFalse(self.ws.is_stale())
+
+    def test_reconnect_without_pong(self):
+        self.stub.answer_pings = False
+
+        wait_for(lambda: self.ws.is_stale())
+        self.stub.answer_pings = True
+        wait_for(lambda: self.stub.connections == 2)
+        wait_for(lambda: not self.ws.is_stale())
+
+        self.assertEqual(1, self.ws.heartbeat_metrics()['missed_pongs'])
+        self.assertEqual(1, self.ws.reconnect_metrics()['reconnects'])
+
+    def test_table_ages(self):
+        time.sleep(0.1)
+        self.stub.send({'table': 'instrument', 'action': 'update', 'data': [{'symbol': 'XBTUSD', 'lastPrice': 1}]})
+        wait_for(lambda: self.ws.get_instrument('XBTUSD')['lastPrice'] == 1)
+
+        ages = self.ws.table_ages()
+        self.assertLess(ages['instrument'], ages['trade'])
+        self.assertTrue(self.ws.is_stale('trade', max_age=0.05))
+        self.assertFalse(self.ws.is_stale('instrument', max_age=0.05))
@@ -0,0 +1,71 @@
+import time
+import unittest
+
+from supervisor.core.ws_thread import BitMEXWebsocket
+from tests.integration.test_ws_reconnect import wait_for
+from tests.ws_stub_server import WebsocketStub
+
+
+class WebsocketQueueTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.stub = WebsocketStub().start()
+        self.stub.add_partial('instrument', [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10000}],
+                              keys=['symbol'])
+        self.stub.add_partial('trade', [])
+        self.stub.add_partial('quote', [])
+        self.ws = None
+
+    def tearDown(self) -> None:
+        if self.ws is not None:
+            self.ws.exit()
+        self.stub.stop()
+
+    def connect(self, **kwargs):
+        self.ws = BitMEXWebsocket(self.stub.url, None, None, reconnect_delay=0.01, queue_size=2, **kwargs)
+        self.ws.connect(shouldAuth=False)
+        # a slow consumer, the reader keeps receiving meanwhile
+        self.ws.add_listener(lambda table: time.sleep(0.02), tables=['instrument'])
+
+    def send_prices(self, number):
+        for price in range(1, number + 1):
+            self.stub.send({'table': 'instrument', 'action': 'update', 'data': [{'symbol': 'XBTUSD',
+                                                                                 'lastPrice': price}]})
+
+    def test_backpressure(self):
+        self.connect(overflow='block')
+        self.send_prices(10)
+        wait_for(lambda: self.ws.get_instrument('XBTUSD')['lastPrice'] == 10)
+
+        metrics = self.ws.queue_metrics()
+        self.assertGreater(metrics['blocked'], 0)
+        self.assertEqual(0, metrics['dropped'])
+        self.assertLessEqual(metrics['max_depth'], 2)
+        self.assertGreater(metrics['lag']['max'], 0.02)
+
+    def test_no_missed_pongs_under_backpressure(self):
+        self.connect(overflow='block', ping_interval=0.01, pong_timeout=0.05)
+        self.ws.add_listener(lambda table: time.sleep(0.05), tables=['instrument'])
+        self.send_prices(10)
+        wait_for(lambda: self.ws.get_instrument('XBTUSD')['lastPrice'] == 10)
+
+        self.assertGreater(self.ws.queue_metrics()['blocked'], 0)
+        self.assertEqual(0, self.ws.heartbeat_metrics()['missed_pongs'])
+        self.assertEqual(0, self.ws.reconnect_metrics()['reconnects'])
+
+    def test_drop_and_resync(self):
+        self.connect(overflow='resync')
+        self.send_prices(10)
+        # a client of an earlier test may reconnect to the reused port, so the stub's count of connections isn't used
+        wait_for(lambda: self.ws.reconnect_metrics()['reconnects'] >= 1)
+        wait_for(lambda: not self.ws.is_stale())
+
+        metrics = self.ws.queue_metrics()
+        self.assertGreater(metrics['dropped'], 0)
+        self.assertGreaterEqual(metrics['resyncs'], 1)
+        # the rest of the dropped connection is skipped, the table comes from the new partial
+        self.assertEqual(10000, self.ws.get_instrument('XBTUSD')['lastPrice'])
+
+    def test_bad_policy(self):
+        with self.assertRaises(ValueError):
+            BitMEXWebsocket(self.stub.url, None, None, overflow='ignore')
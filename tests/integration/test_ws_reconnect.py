@@ -0,0 +1,91 @@
+import time
+import unittest
+
+from supervisor.core.ws_thread import BitMEXWebsocket
+from tests.ws_stub_server import WebsocketStub
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Condition is not met in %ss' % timeout)
+        time.sleep(0.005)
+
+
+class WebsocketReconnectTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.stub = WebsocketStub().start()
+        self.stub.add_partial('instrument', [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10000}],
+                              keys=['symbol'])
+        self.stub.add_partial('trade', [])
+        self.stub.add_partial('quote', [])
+
+    def tearDown(self) -> None:
+        self.ws.exit()
+        self.stub.stop()
+
+    def connect(self, **kwargs):
+        self.ws = BitMEXWebsocket(self.stub.url, None, None, reconnect_delay=0.01, **kwargs)
+        self.ws.connect(shouldAuth=False)
+
+    def test_reconnect_after_drop(self):
+        self.connect()
+        old_instruments = self.ws.data['instrument']
+
+        self.stub.drop()
+        wait_for(lambda: self.ws.data['instrument'] is not old_instruments)
+
+        self.assertEqual(2, self.stub.connections)
+        self.assertFalse(self.ws.exited)
+        self.assertFalse(self.ws.is_stale())
+        self.assertEqual(10000, self.ws.get_instrument('XBTUSD')['lastPrice'])
+        metrics = self.ws.reconnect_metrics()
+        self.assertEqual(1, metrics['reconnects'])
+        # downtime is about the reconnect delay and the transport latency
+        self.assertLess(metrics['last_resync_time'], 1)
+
+    def test_stale_snapshot_readable_while_resyncing(self):
+        self.connect()
+        self.stub.partial_delay = 0.3
+
+        self.stub.drop()
+        wait_for(lambda: self.stub.connections == 2)
+
+        self.assertTrue(self.ws.is_stale('instrument'))
+        self.assertEqual(10000, self.ws.get_instrument('XBTUSD')['lastPrice'])
+
+        wait_for(lambda: not self.ws.is_stale())
+        self.assertEqual(['instrument', 'quote', 'trade'], sorted(self.ws.data))
+
+    def test_tables_resynced_one_by_one(self):
+        self.connect()
+        self.stub.add_partial('instrument', [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10001}],
+                              keys=['symbol'])
+        del self.stub.partials['quote']
+
+        self.stub.drop()
+        wait_for(lambda: self.ws.get_instrument('XBTUSD')['lastPrice'] == 10001)
+
+        self.assertFalse(self.ws.is_stale('instrument'))
+        self.assertTrue(self.ws.is_stale('quote'))
+        self.assertEqual(['quote'], self.ws.reconnect_metrics()['stale_tables'])
+
+    def test_no_reconnect(self):
+        self.connect(reconnect=False)
+
+        self.stub.drop()
+        wait_for(lambda: self.ws.exited)
+
+        time.sleep(0.05)
+        self.assertEqual(1, self.stub.connections)
+
+    def test_exit_stops_reconnecting(self):
+        self.connect()
+
+        self.ws.exit()
+        self.stub.drop()
+        time.sleep(0.05)
+
+        self.assertEqual(1, self.stub.connections)
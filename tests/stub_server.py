@@ -0,0 +1,173 @@
+"""Local HTTP server which imitates BitMEX order endpoints for tests.
+
+Orders are kept in memory and clOrdIDs are unique like on the exchange, so
+repeated requests are rejected with 'Duplicate clOrdID'. Responses may be
+delayed to make the client time out after the server has processed a request.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class BitMEXStub:
+
+    API_PATH = '/api/v1'
+
+    def __init__(self):
+        self.orders = []
+        self.requests = []  # (verb, path, body) of every request
+        self.delays = []  # seconds to hold responses of the next requests
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d%s' % (self.server.server_address[1], self.API_PATH)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_order(self, **order):
+        order.setdefault('orderID', str(uuid.uuid4()))
+        order.setdefault('symbol', 'XBTUSD')
+        order.setdefault('ordStatus', 'New')
+        self.orders.append(order)
+        return order
+
+    def find_order(self, orderID=None, clOrdID=None):
+        for order in self.orders:
+            if orderID and order['orderID'] == orderID or clOrdID and order.get('clOrdID') == clOrdID:
+                return order
+
+    #
+    # Endpoints, return (status, body)
+    #
+
+    def create_orders(self, order_dicts):
+        for order_dict in order_dicts:
+            if order_dict.get('clOrdID') and self.find_order(clOrdID=order_dict['clOrdID']):
+                return 400, self.error('Duplicate clOrdID')
+
+        created = []
+        for order_dict in order_dicts:
+            order = {key: value for key, value in order_dict.items() if value != ''}
+            qty = order.get('orderQty', 0)
+            order.setdefault('side', 'Buy' if qty > 0 else 'Sell')
+            order['orderQty'] = abs(qty)
+            created.append(self.add_order(**order))
+        return 200, created
+
+    def amend_orders(self, amend_dicts):
+        orders = []
+        for amend_dict in amend_dicts:
+            if amend_dict.get('clOrdID') and not amend_dict.get('origClOrdID'):
+                return 400, self.error('clOrdID requires origClOrdID')
+            order = self.find_order(orderID=amend_dict.get('orderID'), clOrdID=amend_dict.get('origClOrdID'))
+            if order is None:
+                return 400, self.error('Invalid orderID')
+            new_clordid = amend_dict.get('clOrdID')
+            if new_clordid and self.find_order(clOrdID=new_clordid):
+                return 400, self.error('Duplicate clOrdID')
+            orders.append(order)
+
+        for order, amend_dict in zip(orders, amend_dicts):
+            for key in ('orderQty', 'price', 'stopPx', 'clOrdID'):
+                if key in amend_dict:
+                    order[key] = amend_dict[key]
+        return 200, orders
+
+    def cancel_orders(self, cancel_dict):
+        order_ids = cancel_dict.get('orderID') or []
+        if isinstance(order_ids, str):
+            order_ids = [order_ids]
+        orders = [self.find_order(orderID=order_id) for order_id in order_ids]
+        if None in orders:
+            return 404, self.error('Not Found')
+        for order in orders:
+            order['ordStatus'] = 'Canceled'
+        return 200, orders
+
+    def get_orders(self, query):
+        orders = self.orders
+        if 'filter' in query:
+            clordids = json.loads(query['filter'][0]).get('clOrdID', [])
+            orders = [order for order in orders if order.get('clOrdID') in clordids]
+        return 200, orders
+
+    @staticmethod
+    def error(message):
+        return {'error': {'message': message, 'name': 'ValidationError'}}
+
+    def handle(self, verb, url, body):
+        parsed = urlparse(url)
+        path = parsed.path[len(self.API_PATH):]
+        data = json.loads(body) if body else {}
+
+        with self.lock:
+            self.requests.append((verb, path, data))
+            delay = self.delays.pop(0) if self.delays else 0
+
+            if verb == 'GET' and path == '/order':
+                result = self.get_orders(parse_qs(parsed.query))
+            elif verb == 'POST' and path == '/order':
+                status, orders = self.create_orders([data])
+                result = status, orders[0] if status == 200 else orders
+            elif verb == 'POST' and path == '/order/bulk':
+                result = self.create_orders(data['orders'])
+            elif verb == 'PUT' and path == '/order':
+                status, orders = self.amend_orders([data])
+                result = status, orders[0] if status == 200 else orders
+            elif verb == 'PUT' and path == '/order/bulk':
+                result = self.amend_orders(data['orders'])
+            elif verb == 'DELETE' and path == '/order':
+                result = self.cancel_orders(data)
+            else:
+                result = 404, self.error('Not found')
+
+        # the request is processed, but the client may time out waiting for the response
+        time.sleep(delay)
+        return result
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep connections alive like the exchange does
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('utf8') if length else ''
+                status, result = stub.handle(self.command, self.path, body)
+                content = json.dumps(result).encode('utf8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client has timed out
+
+            do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,79 @@
+import asyncio
+import time
+import unittest
+
+import requests
+
+from supervisor.core import settings
+from supervisor.core.async_api import AsyncBitMEX
+from supervisor.core.retry import RetryPolicy
+from tests.stub_server import BitMEXStub
+
+
+class AsyncBitMEXTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.stub = BitMEXStub().start()
+        self.bitmex = AsyncBitMEX(test=False, symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                                  api_secret=settings.TEST_API_SECRET, retry_policy=RetryPolicy(base_delay=0.01))
+        self.bitmex.conn.base_url = self.stub.url
+
+    def tearDown(self) -> None:
+        self.bitmex.close()
+        self.stub.stop()
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_requests_run_concurrently(self):
+        self.stub.delays = [0.3] * 5
+
+        async def place():
+            return await asyncio.gather(*(
+                self.bitmex.order_create(side='Buy', orderQty=100, price=1000 + i, ordType='Limit')
+                for i in range(5)
+            ))
+
+        started = time.perf_counter()
+        results = self.run_async(place())
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(5, len(self.stub.orders))
+        self.assertEqual({1000, 1001, 1002, 1003, 1004}, {order['price'] for order in results})
+        # about the slowest request instead of the sum of 1.5s
+        self.assertLess(elapsed, 0.9)
+
+    def test_mixed_order_operations(self):
+        to_cancel = self.stub.add_order(ordType='Limit', orderQty=100, side='Buy', price=900)
+        to_amend = self.stub.add_order(ordType='Limit', orderQty=100, side='Buy', price=950)
+
+        async def cycle():
+            return await asyncio.gather(
+                self.bitmex.order_cancel(orderID=to_cancel['orderID']),
+                self.bitmex.order_edit(orderID=to_amend['orderID'], price=960),
+                self.bitmex.order_bulk_create([{'symbol': settings.TEST_SYMBOL, 'orderQty': -100, 'price': 1100}]),
+            )
+
+        cancelled, amended, created = self.run_async(cycle())
+
+        self.assertEqual('Canceled', cancelled[0]['ordStatus'])
+        self.assertEqual(960, amended['price'])
+        self.assertEqual('Sell', created[0]['side'])
+        self.assertEqual(3, len(self.stub.orders))
+
+    def test_errors_are_raised_per_request(self):
+        async def cycle():
+            return await self.bitmex.gather(
+                self.bitmex.order_edit(orderID='unknown', price=1000),
+                (self.bitmex.conn.order,),
+                return_exceptions=True,
+            )
+
+        error, orders = self.run_async(cycle())
+
+        self.assertIsInstance(error, requests.HTTPError)
+        self.assertEqual([], orders)
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            self.bitmex.not_an_endpoint
@@ -0,0 +1,65 @@
+import unittest
+
+import requests
+
+from supervisor.core import settings
+from supervisor.core.api import BitMEX
+from supervisor.core.auth import APIKeyAuthWithExpires, Signer, generate_signature, url_path
+
+
+class SignerTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.signer = Signer(settings.TEST_API_KEY, settings.TEST_API_SECRET)
+
+    def test_signature_as_generate_signature(self):
+        url = 'https://bitmex.com/api/v1/order?symbol=XBTUSD&count=10'
+        body = '{"symbol":"XBTUSD","orderQty":1,"price":395.01}'
+        expected = generate_signature(settings.TEST_API_SECRET, 'POST', url, 1416993995705, body)
+
+        self.assertEqual(expected, self.signer.sign_url('POST', url, 1416993995705, body))
+        self.assertEqual(expected, self.signer.sign_url('POST', url, 1416993995705, body.encode('utf8')))
+
+    def test_signature_without_body(self):
+        expected = generate_signature(settings.TEST_API_SECRET, 'GET', '/realtime', 1416993995705, '')
+        self.assertEqual(expected, self.signer.sign('GET', '/realtime', 1416993995705))
+
+    def test_signer_is_reusable(self):
+        first = self.signer.sign('GET', b'/api/v1/position', 1)
+        self.signer.sign('GET', b'/api/v1/order', 2)
+        self.assertEqual(first, self.signer.sign('GET', b'/api/v1/position', 1))
+
+    def test_url_path(self):
+        self.assertEqual('/api/v1/order?filter=%7B%7D', url_path('https://bitmex.com/api/v1/order?filter=%7B%7D'))
+        self.assertEqual('/', url_path('https://bitmex.com'))
+
+    def test_auth_headers(self):
+        auth = APIKeyAuthWithExpires(settings.TEST_API_KEY, settings.TEST_API_SECRET, signer=self.signer)
+        request = requests.Request('PUT', 'https://bitmex.com/api/v1/order', data='{"orderID":"1"}', auth=auth)
+        prepared = request.prepare()
+
+        expires = int(prepared.headers['api-expires'])
+        expected = generate_signature(settings.TEST_API_SECRET, 'PUT', prepared.url, expires, '{"orderID":"1"}')
+        self.assertEqual(expected, prepared.headers['api-signature'])
+        self.assertEqual(settings.TEST_API_KEY, prepared.headers['api-key'])
+
+    def test_rest_client_creates_signer_once(self):
+        bitmex = BitMEX(test=False, symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                        api_secret=settings.TEST_API_SECRET, init_ws=False)
+        self.assertIsInstance(bitmex.signer, Signer)
+        self.assertIs(bitmex.signer, bitmex.auth.signer)
+
+    def test_prepared_request_signature(self):
+        bitmex = BitMEX(test=False, symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                        api_secret=settings.TEST_API_SECRET, init_ws=False)
+        body = b'{"orderID":"1"}'
+        prepared = bitmex._prepare_request('PUT', bitmex.base_url + '/order',
+                                           {'filter': '{"clOrdID":["a"]}', 'count': 10, 'start': None}, body)
+
+        self.assertEqual(bitmex.base_url + '/order?filter=%7B%22clOrdID%22%3A%5B%22a%22%5D%7D&count=10', prepared.url)
+        self.assertEqual(body, prepared.body)
+        self.assertEqual(str(len(body)), prepared.headers['Content-Length'])
+        expires = int(prepared.headers['api-expires'])
+        expected = generate_signature(settings.TEST_API_SECRET, 'PUT', prepared.url, expires, body)
+        self.assertEqual(expected, prepared.headers['api-signature'])
+        self.assertEqual('application/json', prepared.headers['content-type'])
@@ -0,0 +1,18 @@
+import json
+import unittest
+
+from supervisor.core.utils import codec
+
+
+class CodecTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        message = {'table': 'order', 'action': 'insert', 'data': [{'price': 1000.5, 'text': 'Привет'}]}
+        self.assertEqual(message, codec.loads(codec.dumps(message)))
+
+    def test_loads_bytes(self):
+        self.assertEqual({'orderID': '1'}, codec.loads(b'{"orderID": "1"}'))
+
+    def test_dumps_is_compact_json(self):
+        self.assertEqual({'op': 'ping', 'args': []}, json.loads(codec.dumps({'op': 'ping', 'args': []})))
+        self.assertNotIn(' ', codec.dumps({'op': 'ping', 'args': []}))
@@ -0,0 +1,81 @@
+import unittest
+
+from supervisor.core import settings
+from supervisor.core.api import BitMEX
+from supervisor.core.utils.stats import LatencyStats, percentile
+from tests.stub_server import BitMEXStub
+
+
+class LatencyStatsTests(unittest.TestCase):
+
+    def test_percentiles(self):
+        stats = LatencyStats()
+        for ms in range(1, 101):
+            stats.record(ms / 1000)
+
+        snapshot = stats.snapshot()
+        self.assertEqual(100, snapshot['count'])
+        self.assertAlmostEqual(0.05, snapshot['p50'])
+        self.assertAlmostEqual(0.09, snapshot['p90'])
+        self.assertAlmostEqual(0.099, snapshot['p99'])
+        self.assertAlmostEqual(0.1, snapshot['max'])
+
+    def test_window(self):
+        stats = LatencyStats(window=2)
+        for seconds in (5, 1, 2):
+            stats.record(seconds)
+        self.assertEqual(2, stats.snapshot()['p99'])
+        self.assertEqual(3, stats.snapshot()['count'])
+
+    def test_empty(self):
+        self.assertEqual(0, LatencyStats().snapshot()['count'])
+        self.assertIsNone(percentile([], 50))
+
+
+class ConnectionPoolTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.stub = BitMEXStub().start()
+
+    def tearDown(self) -> None:
+        self.bitmex.exit()
+        self.stub.stop()
+
+    def make_bitmex(self, **kwargs):
+        self.bitmex = BitMEX(test=False, symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                             api_secret=settings.TEST_API_SECRET, init_ws=False, **kwargs)
+        self.bitmex.base_url = self.stub.url
+
+    def pool_stats(self):
+        (stats,) = self.bitmex.http_stats()['pools'].values()
+        return stats
+
+    def test_connection_reused(self):
+        self.make_bitmex()
+        for _ in range(5):
+            self.bitmex.call_api('/order')
+
+        self.assertEqual({'connections': 1, 'requests': 5, 'reused': 4}, self.pool_stats())
+        self.assertEqual(5, self.bitmex.http_stats()['response_time']['count'])
+
+    def test_warm_up_opens_connection(self):
+        self.make_bitmex()
+        self.bitmex.warm_up()
+        self.bitmex.call_api('/order')
+
+        self.assertEqual(1, self.pool_stats()['connections'])
+        self.assertEqual(1, self.pool_stats()['reused'])
+
+    def test_warm_up_counted_by_rate_limiter(self):
+        self.make_bitmex()
+        self.bitmex.warm_up()
+
+        self.assertEqual(1, sum(self.bitmex.rate_limit_metrics()['acquired'].values()))
+
+    def test_pool_options(self):
+        self.make_bitmex(pool_maxsize=2, pool_block=True)
+        self.bitmex.call_api('/order')
+
+        pool_key = next(iter(self.bitmex.adapter.poolmanager.pools.keys()))
+        self.assertEqual(2, pool_key.key_maxsize)
+        self.assertTrue(pool_key.key_block)
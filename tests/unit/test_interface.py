@@ -1,10 +1,12 @@
-import json
 import unittest
+from unittest.mock import Mock
+
 import responses
 
 from supervisor.core import settings
 from supervisor.core.orders import Order
 from supervisor.core.interface import Exchange
+from supervisor.core.utils import codec
 
 
 class InterfaceHttpMethodsTests(unittest.TestCase):
@@ -28,6 +30,35 @@ class InterfaceHttpMethodsTests(unittest.TestCase):
         pos_size = self.exchange.get_position_size()
         self.assertEqual(pos_size, 228)
 
+    def test_rate_limit_headers_update_budget(self):
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.GET,
+                settings.BASE_URL + '/position',
+                json=[{'currentQty': 228}],
+                headers={'X-RateLimit-Limit': '60', 'X-RateLimit-Remaining': '42'}
+            )
+            self.exchange.get_position_size()
+            metrics = self.exchange.get_rate_limit_metrics()
+            self.assertEqual(42, metrics['server_remaining'])
+            self.assertLess(metrics['tokens'], 43)
+
+    def test_ws_options_forwarded(self):
+        exchange = Exchange(symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                            api_secret=settings.TEST_API_SECRET, test=False, connect_ws=False,
+                            ws_queue_size=100, ws_overflow='resync')
+        self.addCleanup(exchange.exit)
+
+        self.assertEqual(100, exchange.conn.ws_options['queue_size'])
+        self.assertEqual('resync', exchange.conn.ws_options['overflow'])
+
+    def test_remove_update_listener(self):
+        callback = Mock()
+        self.exchange.add_update_listener(callback, tables=['order'])
+        self.exchange.remove_update_listener(callback)
+
+        self.assertEqual([], self.exchange.conn.ws_listeners)
+
     def test_get_average_position_entry_price(self):
         with responses.RequestsMock() as rsps:
             rsps.add(
@@ -83,7 +114,42 @@ class InterfaceHttpMethodsTests(unittest.TestCase):
                 json=[{'orderID': 123}, {'orderID': 124}]
             )
             self.exchange.bulk_place_orders(orders=[order1, order2])
-            self.assertEqual(json.dumps({'orders': expected_orders}), rsps.calls[0].request.body)
+            self.assertEqual(codec.dumps({'orders': expected_orders}).encode('utf8'), rsps.calls[0].request.body)
+
+    def test_bulk_move_orders(self):
+        order1 = Order(order_type='Limit', price=1000, qty=228, side='Sell')
+        order1.order_id = '1234'
+        order2 = Order(order_type='Stop', stop_px=900, qty=229, side='Sell')
+        order2.order_id = '1235'
+
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.PUT,
+                settings.BASE_URL + '/order/bulk',
+                json=[{'orderID': '1235'}, {'orderID': '1234'}]
+            )
+            expected_orders = [
+                {'orderID': '1234', 'orderQty': 228, 'price': 1000.0},
+                {'orderID': '1235', 'orderQty': 229, 'stopPx': 900.0},
+            ]
+
+            moved_orders = self.exchange.bulk_move_orders([order1, order2])
+            self.assertEqual(codec.dumps({'orders': expected_orders}).encode('utf8'), rsps.calls[0].request.body)
+            self.assertEqual([order2, order1], moved_orders)
+
+    def test_move_order_renames_clordid(self):
+        order = Order(order_type='Limit', price=1000, qty=228, side='Sell', clordid='old_id')
+        order.order_id = '1234'
+
+        with responses.RequestsMock() as rsps:
+            rsps.add(responses.PUT, settings.BASE_URL + '/order', json={})
+            self.exchange.move_order(order, to=1001)
+
+            body = codec.loads(rsps.calls[0].request.body)
+            self.assertEqual('1234', body['orderID'])
+            self.assertEqual('old_id', body['origClOrdID'])
+            self.assertEqual(order.clordid, body['clOrdID'])
+            self.assertNotEqual('old_id', order.clordid)
 
     def test_move_order(self):
         order1 = Order(order_type='Limit', price=1000, qty=228, side='Sell')
@@ -103,4 +169,4 @@ class InterfaceHttpMethodsTests(unittest.TestCase):
 
             self.exchange.move_order(order1, to=1001)
             self.assertEqual(1, len(rsps.calls))
-            self.assertEqual(json.dumps(expected_order), rsps.calls[0].request.body)
+            self.assertEqual(codec.dumps(expected_order).encode('utf8'), rsps.calls[0].request.body)
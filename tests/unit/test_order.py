@@ -181,6 +181,46 @@ class OrdersComparisonTests(unittest.TestCase):
         )
         self.assertEqual(order1, order2)
 
+    def test_comparison_key_reset_on_move(self):
+        order1 = Order(order_type='Limit', qty=228, side='Buy', price=1000)
+        order2 = Order(order_type='Limit', qty=228, side='Buy', price=1001)
+        self.assertNotEqual(order1, order2)
+
+        order1.move(to=1001)
+        self.assertEqual(order1, order2)
+        order1.qty = 229
+        self.assertNotEqual(order1, order2)
+        self.assertFalse(order1.almost_equal(order2))
+
+    def test_orders_hashable(self):
+        order = Order(order_type='Limit', qty=228, side='Buy', price=1000)
+        orders = {order, Order(order_type='Limit', qty=228, side='Buy', price=1000)}
+        self.assertEqual(1, len(orders))
+
+        # hash doesn't depend on price, so a moved order is still found
+        order.move(to=1001)
+        self.assertIn(order, orders)
+        self.assertIn(Order(order_type='Limit', qty=228, side='Buy', price=1001), orders)
+        self.assertNotIn(Order(order_type='Limit', qty=228, side='Buy', price=1000), orders)
+
+    def test_changed_order_readded_to_set(self):
+        order = Order(order_type='Limit', qty=228, side='Buy', price=1000)
+        orders = {order}
+
+        # qty is hashed, the order has to be removed before the change and added back after it
+        orders.remove(order)
+        order.qty = 229
+        orders.add(order)
+
+        self.assertIn(order, orders)
+        self.assertIn(Order(order_type='Limit', qty=229, side='Buy', price=1000), orders)
+        orders.remove(order)
+        self.assertEqual(set(), orders)
+
+    def test_compare_with_other_types(self):
+        self.assertNotEqual(Order(), None)
+        self.assertFalse(Order() in [None, 'order'])
+
 
 class ExportImportOrdersTests(unittest.TestCase):
 
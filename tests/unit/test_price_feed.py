@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import Mock
+
+from supervisor.core.price_feed import PriceFeed
+
+
+class PriceFeedTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.feed = PriceFeed()
+
+    def test_publish_to_symbol_subscribers(self):
+        xbt_callback = Mock()
+        eth_callback = Mock()
+        self.feed.subscribe('XBTUSD', xbt_callback)
+        self.feed.subscribe('ETHUSD', eth_callback)
+
+        self.feed.publish('XBTUSD', 10000)
+
+        xbt_callback.assert_called_once_with(10000)
+        eth_callback.assert_not_called()
+        self.assertEqual(10000, self.feed.last_price('XBTUSD'))
+
+    def test_publish_only_changes(self):
+        callback = Mock()
+        self.feed.subscribe('XBTUSD', callback)
+
+        self.feed.publish('XBTUSD', 10000)
+        self.feed.publish('XBTUSD', 10000)
+        self.feed.publish('XBTUSD', None)
+
+        callback.assert_called_once_with(10000)
+
+    def test_unsubscribe(self):
+        callback = Mock()
+        self.feed.subscribe('XBTUSD', callback)
+        self.feed.unsubscribe('XBTUSD', callback)
+        self.feed.publish('XBTUSD', 10000)
+
+        callback.assert_not_called()
+        self.assertEqual(0, self.feed.subscribers('XBTUSD'))
+
+    def test_failing_subscriber(self):
+        callback = Mock()
+        self.feed.subscribe('XBTUSD', Mock(side_effect=RuntimeError))
+        self.feed.subscribe('XBTUSD', callback)
+        self.feed.publish('XBTUSD', 10000)
+
+        callback.assert_called_once_with(10000)
@@ -0,0 +1,106 @@
+import threading
+import time
+import unittest
+
+from supervisor.core.rate_limit import RateLimiter
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(limit=10, window=10, clock=self.clock)
+
+    def test_lane_for_verb(self):
+        self.assertEqual('cancel', RateLimiter.lane_for('DELETE'))
+        self.assertEqual('amend', RateLimiter.lane_for('PUT'))
+        self.assertEqual('place', RateLimiter.lane_for('POST'))
+        self.assertEqual('read', RateLimiter.lane_for('GET'))
+
+    def test_reserves_keep_tokens_for_higher_lanes(self):
+        # 10 tokens, reads keep 6 of them
+        for _ in range(4):
+            self.assertTrue(self.limiter.try_acquire('read'))
+        self.assertFalse(self.limiter.try_acquire('read'))
+        # placements keep 3
+        for _ in range(3):
+            self.assertTrue(self.limiter.try_acquire('place'))
+        self.assertFalse(self.limiter.try_acquire('place'))
+        # cancels take everything
+        for _ in range(3):
+            self.assertTrue(self.limiter.try_acquire('cancel'))
+        self.assertFalse(self.limiter.try_acquire('cancel'))
+
+    def test_refill(self):
+        for _ in range(10):
+            self.limiter.try_acquire('cancel')
+        self.assertFalse(self.limiter.try_acquire('cancel'))
+        self.clock.now += 1
+        self.assertTrue(self.limiter.try_acquire('cancel'))
+
+    def test_update_from_headers(self):
+        self.limiter.update({'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '1'})
+        metrics = self.limiter.metrics()
+        self.assertEqual(120, metrics['limit'])
+        self.assertEqual(1, metrics['server_remaining'])
+        self.assertEqual(1, metrics['tokens'])
+        self.assertFalse(self.limiter.try_acquire('amend'))
+        self.assertTrue(self.limiter.try_acquire('cancel'))
+
+    def test_throttle_until_reset(self):
+        self.limiter.throttle(time.time() + 5)
+        self.clock.now += 4
+        self.assertFalse(self.limiter.try_acquire('cancel'))
+        self.clock.now += 2
+        self.assertTrue(self.limiter.try_acquire('cancel'))
+        self.assertEqual(1, self.limiter.metrics()['throttled'])
+
+    def test_metrics(self):
+        self.limiter.try_acquire('read')
+        self.limiter.try_acquire('cancel')
+        metrics = self.limiter.metrics()
+        self.assertEqual({'cancel': 1, 'amend': 0, 'place': 0, 'read': 1}, metrics['acquired'])
+        self.assertEqual(8, metrics['tokens'])
+
+
+class RateLimiterWaitingTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.limiter = RateLimiter(limit=20, window=1)
+
+    def test_acquire_timeout(self):
+        self.limiter.throttle(time.time() + 10)
+        self.assertFalse(self.limiter.acquire('cancel', timeout=0.05))
+        self.assertEqual(1, self.limiter.metrics()['delayed']['cancel'])
+
+    def test_acquire_waits_for_refill(self):
+        for _ in range(20):
+            self.limiter.try_acquire('cancel')
+        self.assertTrue(self.limiter.acquire('cancel', timeout=1))
+
+    def test_cancel_goes_before_waiting_read(self):
+        self.limiter.throttle(time.time() + 0.2)
+        acquired = []
+
+        def acquire(lane):
+            self.limiter.acquire(lane)
+            acquired.append(lane)
+
+        reader = threading.Thread(target=acquire, args=('read',))
+        reader.start()
+        time.sleep(0.05)
+        canceller = threading.Thread(target=acquire, args=('cancel',))
+        canceller.start()
+        reader.join(2)
+        canceller.join(2)
+
+        self.assertEqual(['cancel', 'read'], acquired)
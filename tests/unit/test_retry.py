@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import Mock
+
+import responses
+
+from supervisor.core import settings
+from supervisor.core.api import BitMEX
+from supervisor.core.retry import Retry, RetryPolicy
+from supervisor.core.utils.errors import MaxRetriesReachedError
+
+
+class FlakyAttempt:
+
+    def __init__(self, failures, processed=True):
+        self.failures = failures
+        self.processed = processed
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise Retry('503', processed=self.processed)
+        return 'result'
+
+
+class RetryPolicyTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.sleep = Mock()
+        self.on_attempt = Mock()
+        self.policy = RetryPolicy(base_delay=1, max_delay=4, jitter=0, sleep=self.sleep, on_attempt=self.on_attempt)
+
+    def test_retry_until_success(self):
+        attempt = FlakyAttempt(failures=2)
+        self.assertEqual('result', self.policy.call(attempt, 'GET'))
+        self.assertEqual(3, attempt.calls)
+        self.assertEqual(3, self.on_attempt.call_count)
+        self.assertEqual('ok', self.on_attempt.call_args[0][3])
+
+    def test_capped_exponential_backoff(self):
+        self.policy.retries['GET'] = 5
+        self.policy.call(FlakyAttempt(failures=4), 'GET')
+        self.assertEqual([1, 2, 4, 4], [c[0][0] for c in self.sleep.call_args_list])
+
+    def test_jitter_keeps_delay_within_cap(self):
+        policy = RetryPolicy(base_delay=1, max_delay=4, jitter=0.5)
+        for retry_number in range(5):
+            delay = policy.backoff(retry_number)
+            self.assertLessEqual(delay, min(4, 2 ** retry_number))
+            self.assertGreaterEqual(delay, min(4, 2 ** retry_number) / 2)
+
+    def test_max_retries_enforced(self):
+        attempt = FlakyAttempt(failures=10)
+        with self.assertRaises(MaxRetriesReachedError):
+            self.policy.call(attempt, 'GET')
+        self.assertEqual(4, attempt.calls)
+        self.assertEqual(1, self.policy.metrics()['exhausted'])
+        self.assertEqual({'503': 4}, self.policy.metrics()['failures'])
+
+    def test_post_not_retried_if_processed(self):
+        attempt = FlakyAttempt(failures=1)
+        with self.assertRaises(MaxRetriesReachedError):
+            self.policy.call(attempt, 'POST')
+        self.assertEqual(1, attempt.calls)
+
+    def test_post_retried_if_not_processed(self):
+        attempt = FlakyAttempt(failures=1, processed=False)
+        self.assertEqual('result', self.policy.call(attempt, 'POST'))
+
+    def test_deadline(self):
+        now = [0.0]
+
+        def sleep(delay):
+            now[0] += delay
+
+        policy = RetryPolicy(retries={'GET': 10}, base_delay=1, max_delay=1, jitter=0, deadline=2.5,
+                             sleep=sleep, clock=lambda: now[0])
+        attempt = FlakyAttempt(failures=10)
+        with self.assertRaises(MaxRetriesReachedError):
+            policy.call(attempt, 'GET')
+        # attempts at 0, 1 and 2 seconds, the next one would start after the deadline
+        self.assertEqual(3, attempt.calls)
+
+
+class CallApiRetryTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.sleep = Mock()
+        self.bitmex = BitMEX(test=False, symbol=settings.TEST_SYMBOL, api_key=settings.TEST_API_KEY,
+                             api_secret=settings.TEST_API_SECRET, init_ws=False,
+                             retry_policy=RetryPolicy(sleep=self.sleep))
+
+    @responses.activate
+    def test_retry_on_503(self):
+        responses.add(responses.GET, settings.BASE_URL + '/position', status=503)
+        responses.add(responses.GET, settings.BASE_URL + '/position', json=[{'currentQty': 228}])
+
+        self.assertEqual([{'currentQty': 228}], self.bitmex.call_api('/position'))
+        self.assertEqual(1, self.sleep.call_count)
+
+    @responses.activate
+    def test_retries_are_limited(self):
+        responses.add(responses.GET, settings.BASE_URL + '/position', status=503)
+
+        with self.assertRaises(MaxRetriesReachedError):
+            self.bitmex.call_api('/position')
+        self.assertEqual(4, len(responses.calls))
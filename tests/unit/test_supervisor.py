@@ -1,10 +1,12 @@
 import unittest
+from time import sleep
 from unittest.mock import Mock, call
 
 import requests
 
 from supervisor import Supervisor
 from supervisor.core.orders import Order
+from supervisor.core.utils.errors import MaxRetriesReachedError
 
 
 class SupervisorCycleTests(unittest.TestCase):
@@ -59,6 +61,64 @@ class SupervisorCycleTests(unittest.TestCase):
         self.supervisor.exit_cycle()  # must not raise anything
         self.assertFalse(self.supervisor.sync_thread.is_alive())
 
+    def test_exit_cycle_removes_update_listener(self):
+        self.supervisor.exit_cycle()
+
+        callback = self.exchange_mock.add_update_listener.call_args[0][0]
+        self.exchange_mock.remove_update_listener.assert_called_with(callback)
+
+    def test_cycle_woken_by_exchange_update(self):
+        self.supervisor.max_idle_interval = 60
+        self.supervisor.run_cycle()
+        sleep(0.1)
+        self.exchange_mock.get_position_size_ws.reset_mock()
+
+        callback = self.exchange_mock.add_update_listener.call_args[0][0]
+        callback('position')
+        sleep(0.1)
+
+        self.exchange_mock.get_position_size_ws.assert_called_once()
+
+    def test_cycle_sleeps_without_updates(self):
+        self.supervisor.max_idle_interval = 60
+        self.supervisor.run_cycle()
+        sleep(0.1)
+        self.exchange_mock.get_position_size_ws.reset_mock()
+        sleep(0.2)
+
+        self.exchange_mock.get_position_size_ws.assert_not_called()
+
+    def test_no_sync_while_resyncing(self):
+        self.exchange_mock.is_synced.return_value = False
+        self.supervisor.run_cycle()
+        sleep(0.1)
+
+        self.exchange_mock.get_position_size_ws.assert_not_called()
+        self.exchange_mock.get_open_orders_ws.assert_not_called()
+
+    def test_cycle_survives_failed_requests(self):
+        self.exchange_mock.get_position_size_ws.return_value = 100
+        self.exchange_mock.place_market_order.side_effect = MaxRetriesReachedError('POST /order')
+        self.exchange_mock.bulk_cancel_orders.side_effect = requests.ConnectionError()
+        self.exchange_mock.get_open_orders_ws.return_value = [Order(order_type='Limit', qty=1, price=1, side='Buy')]
+        self.supervisor.max_idle_interval = 0.01
+        self.supervisor.run_cycle()
+        sleep(0.1)
+
+        # the thread keeps synchronizing while requests fail
+        self.assertTrue(self.supervisor.sync_thread.is_alive())
+        self.assertGreater(self.exchange_mock.place_market_order.call_count, 1)
+        self.assertGreater(self.exchange_mock.bulk_cancel_orders.call_count, 1)
+
+    def test_restart_closed_websocket(self):
+        # closed once, open after the restart
+        self.exchange_mock.is_open.side_effect = lambda: self.exchange_mock.restart_ws.called
+        self.supervisor.max_idle_interval = 60
+        self.supervisor.run_cycle()
+        sleep(0.1)
+
+        self.exchange_mock.restart_ws.assert_called_once()
+
     def test_reset(self):
         self.supervisor.run_cycle()
         self.supervisor.reset()
@@ -131,6 +191,75 @@ class SyncOrdersTests(unittest.TestCase):
         self.exchange_mock.bulk_cancel_orders.assert_not_called()
         self.exchange_mock.move_order.assert_called_once_with(order=order1)
 
+    def test_move_several_changed_orders(self):
+        order1 = Order(order_type='Limit', qty=228, price=1000, side='Buy')
+        order2 = Order(order_type='Limit', qty=228, price=1001, side='Buy')
+        real_orders = [Order(order_type='Limit', qty=228, price=999, side='Buy'),
+                       Order(order_type='Limit', qty=228, price=998, side='Buy'),
+                       Order(order_type='Limit', qty=300, price=998, side='Buy')]
+        self.supervisor.add_order(order1)
+        self.supervisor.add_order(order2)
+        self.exchange_mock.get_open_orders_ws.return_value = real_orders
+        self.exchange_mock.bulk_move_orders.side_effect = lambda orders: orders
+
+        self.supervisor.cancel_needless_orders()
+
+        self.exchange_mock.bulk_move_orders.assert_called_once_with([order1, order2])
+        self.exchange_mock.move_order.assert_not_called()
+        self.exchange_mock.bulk_cancel_orders.assert_called_once_with([real_orders[2]])
+
+    def test_move_orders_in_chunks(self):
+        self.supervisor.bulk_chunk_size = 2
+        orders = [Order(order_type='Limit', qty=228 + i, price=1000, side='Buy') for i in range(3)]
+        real_orders = [Order(order_type='Limit', qty=228 + i, price=999, side='Buy') for i in range(3)]
+        for i, real_order in enumerate(real_orders):
+            real_order.order_id = str(i)
+        for order in orders:
+            self.supervisor.add_order(order)
+        self.exchange_mock.get_open_orders_ws.return_value = real_orders
+        self.exchange_mock.bulk_move_orders.side_effect = lambda orders: orders
+
+        self.supervisor.cancel_needless_orders()
+
+        self.assertEqual([call(orders[0:2]), call(orders[2:3])], self.exchange_mock.bulk_move_orders.call_args_list)
+        # needed orders amend the real ones
+        self.assertEqual(['0', '1', '2'], [order.order_id for order in orders])
+
+    def test_placed_orders_keep_their_real_orders(self):
+        real_a = Order(order_type='Limit', qty=228, price=100, side='Buy')
+        real_a.order_id = 'A'
+        real_b = Order(order_type='Limit', qty=228, price=90, side='Buy')
+        real_b.order_id = 'B'
+        # both needed orders are moved, Y to the price of real order A
+        order_x = Order(order_type='Limit', qty=228, price=95, side='Buy')
+        order_x.order_id = 'A'
+        order_y = Order(order_type='Limit', qty=228, price=100, side='Buy')
+        order_y.order_id = 'B'
+        self.supervisor.add_order(order_x)
+        self.supervisor.add_order(order_y)
+        self.exchange_mock.get_open_orders_ws.return_value = [real_a, real_b]
+        self.exchange_mock.bulk_move_orders.side_effect = lambda orders: orders
+
+        self.supervisor.cancel_needless_orders()
+
+        self.exchange_mock.bulk_move_orders.assert_called_once_with([order_x, order_y])
+        self.assertEqual(['A', 'B'], [order_x.order_id, order_y.order_id])
+        self.exchange_mock.bulk_cancel_orders.assert_not_called()
+
+    def test_move_only_unmatched_orders(self):
+        order1 = Order(order_type='Limit', qty=228, price=1000, side='Buy')
+        order2 = Order(order_type='Limit', qty=228, price=1001, side='Buy')
+        real_orders = [Order(order_type='Limit', qty=228, price=999, side='Buy'),
+                       Order(order_type='Limit', qty=228, price=1000, side='Buy')]
+        self.supervisor.add_order(order1)
+        self.supervisor.add_order(order2)
+        self.exchange_mock.get_open_orders_ws.return_value = real_orders
+
+        self.supervisor.cancel_needless_orders()
+
+        self.exchange_mock.move_order.assert_called_once_with(order=order2)
+        self.exchange_mock.bulk_cancel_orders.assert_not_called()
+
     def test_cancel_several_needless_orders(self):
         order1 = Order()
         order2 = Order()
@@ -190,7 +319,7 @@ class SyncOrdersTests(unittest.TestCase):
 
         on_reject_mock = Mock()
 
-        self.exchange_mock.get_order_status_ws.side_effect = order_status_mock
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: [order_status_mock(o) for o in orders]
 
         order = Order(order_type='Limit', qty=228, price=1000, side='Buy')
         order.order_id = '1234'
@@ -212,7 +341,7 @@ class SyncOrdersTests(unittest.TestCase):
 
         on_filled_mock = Mock()
 
-        self.exchange_mock.get_order_status_ws.side_effect = order_status_mock
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: [order_status_mock(o) for o in orders]
 
         order = Order(order_type='Limit', qty=228, price=1000, side='Buy')
         order.order_id = '1234'
@@ -234,7 +363,7 @@ class SyncOrdersTests(unittest.TestCase):
 
         on_filled_mock = Mock()
 
-        self.exchange_mock.get_order_status_ws.side_effect = order_status_mock
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: [order_status_mock(o) for o in orders]
 
         order = Order(order_type='Stop', qty=228, stop_px=1000, side='Buy')
         order.order_id = '1234'
@@ -249,6 +378,25 @@ class SyncOrdersTests(unittest.TestCase):
         # assert that Supervisor call matching callback
         on_filled_mock.assert_called_once()
 
+    def test_statuses_paired_with_orders_added_concurrently(self):
+        order1 = Order(order_type='Limit', qty=228, price=1000, side='Buy')
+        order1.order_id = '1'
+        order2 = Order(order_type='Limit', qty=229, price=1001, side='Buy')
+        order2.order_id = '2'
+        self.supervisor.add_order(order2)
+
+        def get_statuses_mock(orders):
+            # another thread adds a placed order in front while statuses are looked up
+            self.supervisor.orders.insert(0, order1)
+            return ['Filled' if o is order2 else 'New' for o in orders]
+
+        self.exchange_mock.get_order_statuses_ws.side_effect = get_statuses_mock
+        self.supervisor.check_needed_orders()
+
+        # the fill belongs to order2, order1 is checked in the next cycle
+        self.assertEqual([order1], self.supervisor.orders)
+        self.assertEqual(229, self.supervisor.position_size)
+
     def test_validation_error_while_placing_order(self):
         validation_error = requests.HTTPError()
         validation_error.response = Mock()
@@ -264,6 +412,87 @@ class SyncOrdersTests(unittest.TestCase):
         # assert that we catch the exception and forget the order
         self.assertNotIn(order, self.supervisor.orders)
 
+    def test_failed_requests_while_placing_orders(self):
+        self.exchange_mock.bulk_place_orders.side_effect = requests.HTTPError(response=Mock(text='Bad Gateway'))
+        self.exchange_mock.place_order.side_effect = [MaxRetriesReachedError('POST /order'), requests.Timeout(), None]
+
+        orders = [Order(order_type='Limit', qty=228, price=1000 + i, side='Buy') for i in range(3)]
+        for order in orders:
+            self.supervisor.add_order(order)
+        self.supervisor.check_needed_orders()
+
+        # every order is tried, failed ones are kept to be placed in the next cycle
+        self.assertEqual([call(order) for order in orders], self.exchange_mock.place_order.call_args_list)
+        self.assertEqual(orders, self.supervisor.orders)
+
+    def test_failed_bulk_request_doesnt_stop_next_chunks(self):
+        self.supervisor.bulk_chunk_size = 2
+        self.exchange_mock.bulk_place_orders.side_effect = [MaxRetriesReachedError('POST /order/bulk'), None]
+        self.exchange_mock.bulk_move_orders.side_effect = [requests.Timeout(), []]
+        orders = [Order(order_type='Limit', qty=228, price=1000 + i, side='Buy') for i in range(4)]
+
+        self.supervisor.place_needed_orders(orders)
+        self.supervisor.move_orders(orders)
+
+        self.assertEqual([call(orders[0:2]), call(orders[2:4])], self.exchange_mock.bulk_place_orders.call_args_list)
+        self.assertEqual([call(orders[0:2]), call(orders[2:4])], self.exchange_mock.bulk_move_orders.call_args_list)
+        self.exchange_mock.place_order.assert_not_called()
+
+    def test_placed_orders_get_clordids(self):
+        order1 = Order(order_type='Limit', qty=228, price=1000, side='Buy')
+        order2 = Order(order_type='Limit', qty=229, price=1001, side='Buy', clordid='my_id')
+        self.supervisor.add_order(order1)
+        self.supervisor.add_order(order2)
+        self.supervisor.check_needed_orders()
+
+        self.assertIsNotNone(order1.clordid)
+        self.assertEqual('my_id', order2.clordid)
+
+    def test_cancelled_order_placed_with_new_clordid(self):
+        self.exchange_mock.get_order_statuses_ws.side_effect = lambda orders: ['Canceled'] * len(orders)
+        order = Order(order_type='Limit', qty=228, price=1000, side='Buy', clordid='old_id')
+        order.order_id = '1234'
+        self.supervisor.add_order(order)
+        self.supervisor.check_needed_orders()
+
+        self.exchange_mock.place_order.assert_called_once_with(order)
+        self.assertNotEqual('old_id', order.clordid)
+
+    def test_several_unplaced_orders_placed_in_chunks(self):
+        self.supervisor.bulk_chunk_size = 2
+        orders = [Order(order_type='Limit', qty=228, price=1000 + i, side='Buy') for i in range(5)]
+        for order in orders:
+            self.supervisor.add_order(order)
+        self.supervisor.check_needed_orders()
+
+        self.assertEqual(
+            [call(orders[0:2]), call(orders[2:4]), call(orders[4:5])],
+            self.exchange_mock.bulk_place_orders.call_args_list
+        )
+
+    def test_validation_error_in_bulk_drops_only_invalid_order(self):
+        validation_error = requests.HTTPError()
+        validation_error.response = Mock()
+        validation_error.response.text = 'Order price is above the liquidation price of current'
+        self.exchange_mock.bulk_place_orders.side_effect = validation_error
+
+        order1 = Order(order_type='Limit', qty=228, price=1000, side='Buy')
+        order2 = Order(order_type='Limit', qty=229, price=1001, side='Buy')
+        order3 = Order(order_type='Limit', qty=230, price=1002, side='Buy')
+
+        def place_order_mock(_order):
+            if _order is order2:
+                raise validation_error
+
+        self.exchange_mock.place_order.side_effect = place_order_mock
+        self.supervisor.add_order(order1)
+        self.supervisor.add_order(order2)
+        self.supervisor.add_order(order3)
+        self.supervisor.check_needed_orders()
+
+        self.assertEqual([call(order1), call(order2), call(order3)], self.exchange_mock.place_order.call_args_list)
+        self.assertEqual([order1, order3], self.supervisor.orders)
+
 
 class SyncPositionTests(unittest.TestCase):
 
@@ -0,0 +1,244 @@
+import unittest
+
+from supervisor.core.tables import InstrumentTable, KeyedTable, OrderBook, OrderTable, RingTable
+
+
+class KeyedTableTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.table = KeyedTable()
+        self.table.set_keys(['orderID'])
+        self.table.insert([
+            {'orderID': '1', 'price': 1000},
+            {'orderID': '2', 'price': 1001},
+        ])
+
+    def test_reads_as_list(self):
+        self.assertEqual(2, len(self.table))
+        self.assertEqual({'orderID': '1', 'price': 1000}, self.table[0])
+        self.assertEqual({'orderID': '2', 'price': 1001}, self.table[-1])
+        self.assertEqual([1000, 1001], [row['price'] for row in self.table])
+        self.assertEqual([{'orderID': '1', 'price': 1000}, {'orderID': '2', 'price': 1001}], self.table)
+
+    def test_find(self):
+        self.assertEqual(1001, self.table.find({'orderID': '2', 'ordStatus': 'New'})['price'])
+        self.assertIsNone(self.table.find({'orderID': '3'}))
+
+    def test_get(self):
+        self.assertEqual(1000, self.table.get('1')['price'])
+
+    def test_update(self):
+        item = self.table.find({'orderID': '1'})
+        self.table.update(item, {'orderID': '1', 'price': 999})
+        self.assertEqual(999, self.table.get('1')['price'])
+
+    def test_delete(self):
+        self.table.delete({'orderID': '1'})
+        self.assertEqual([{'orderID': '2', 'price': 1001}], self.table)
+        # deleting unknown row must not raise
+        self.assertIsNone(self.table.delete({'orderID': '1'}))
+
+    def test_insert_keeps_order(self):
+        self.table.insert([{'orderID': '0', 'price': 1}])
+        self.assertEqual(['1', '2', '0'], [row['orderID'] for row in self.table])
+
+    def test_trim(self):
+        self.table.trim(1)
+        self.assertEqual([{'orderID': '2', 'price': 1001}], self.table)
+
+    def test_reindex_on_keys(self):
+        table = KeyedTable()
+        table.insert([{'symbol': 'XBTUSD', 'lastPrice': 1000}])
+        table.set_keys(['symbol'])
+        self.assertEqual(1000, table.get('XBTUSD')['lastPrice'])
+
+    def test_keyless_table(self):
+        table = KeyedTable()
+        table.insert([{'price': 1}, {'price': 1}])
+        self.assertEqual(2, len(table))
+        self.assertIsNone(table.find({'price': 1}))
+
+
+class RingTableTests(unittest.TestCase):
+
+    def test_evicts_oldest_rows(self):
+        table = RingTable(capacity=3)
+        table.insert([{'price': i} for i in range(5)])
+        self.assertEqual([2, 3, 4], [row['price'] for row in table])
+        self.assertEqual(2, table[0]['price'])
+        self.assertEqual(4, table[-1]['price'])
+        self.assertEqual([3, 4], [row['price'] for row in table[1:]])
+
+    def test_keyed_ring(self):
+        table = RingTable(capacity=2)
+        table.set_keys(['execID'])
+        table.insert([{'execID': 'a'}, {'execID': 'b'}, {'execID': 'c'}])
+        self.assertIsNone(table.find({'execID': 'a'}))
+        self.assertEqual({'execID': 'c'}, table.find({'execID': 'c'}))
+
+        table.delete({'execID': 'b'})
+        self.assertEqual([{'execID': 'c'}], table)
+
+    def test_delete_removes_indexed_row(self):
+        table = RingTable(capacity=3)
+        table.set_keys(['execID'])
+        old, new = {'execID': 'a'}, {'execID': 'a'}
+        table.insert([old, new])
+
+        table.delete({'execID': 'a'})
+
+        # the indexed row is removed, not the first equal one
+        self.assertEqual(1, len(table))
+        self.assertIs(old, table[0])
+
+    def test_trim(self):
+        table = RingTable(capacity=5)
+        table.insert([{'price': i} for i in range(5)])
+        table.trim(2)
+        self.assertEqual([2, 3, 4], [row['price'] for row in table])
+
+
+class InstrumentTableTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.table = InstrumentTable()
+        self.table.set_keys(['symbol'])
+        self.table.insert([
+            {'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10000},
+            {'symbol': 'ETHUSD', 'tickSize': 0.05, 'lastPrice': 200},
+        ])
+
+    def test_by_symbol(self):
+        self.assertEqual(200, self.table.by_symbol('ETHUSD')['lastPrice'])
+        self.assertIsNone(self.table.by_symbol('LTCUSD'))
+
+    def test_tick_log(self):
+        self.assertEqual(1, self.table.by_symbol('XBTUSD')['tickLog'])
+        self.assertEqual(2, self.table.by_symbol('ETHUSD')['tickLog'])
+
+    def test_tick_size_update(self):
+        instrument = self.table.by_symbol('XBTUSD')
+        self.table.update(instrument, {'symbol': 'XBTUSD', 'tickSize': 0.01})
+        self.assertEqual(2, instrument['tickLog'])
+
+
+class OrderTableTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.table = OrderTable()
+        self.table.set_keys(['orderID'])
+        self.table.insert([
+            {'orderID': '1', 'clOrdID': 'a', 'ordStatus': 'New'},
+            {'orderID': '2', 'clOrdID': '', 'ordStatus': 'Filled'},
+        ])
+
+    def test_status_by_order_id(self):
+        self.assertEqual('New', self.table.status(order_id='1'))
+        self.assertEqual('Filled', self.table.status(order_id='2'))
+        self.assertIsNone(self.table.status(order_id='3'))
+
+    def test_status_by_clordid(self):
+        self.assertEqual('New', self.table.status(order_id='3', clordid='a'))
+        self.assertIsNone(self.table.status(clordid='b'))
+
+    def test_update_keeps_clordid_index(self):
+        item = self.table.find({'orderID': '1'})
+        self.table.update(item, {'orderID': '1', 'clOrdID': 'b', 'ordStatus': 'Canceled'})
+        self.assertIsNone(self.table.by_clordid('a'))
+        self.assertEqual('Canceled', self.table.status(clordid='b'))
+
+    def test_delete(self):
+        self.table.delete({'orderID': '1'})
+        self.assertIsNone(self.table.status(order_id='1', clordid='a'))
+
+
+class OpenOrdersTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.table = OrderTable()
+        self.table.set_keys(['orderID'])
+        self.table.insert([
+            {'orderID': '1', 'ordType': 'Limit', 'side': 'Buy', 'orderQty': 10, 'leavesQty': 10, 'price': 1000,
+             'execInst': 'ParticipateDoNotInitiate'},
+            {'orderID': '2', 'ordType': 'Limit', 'side': 'Sell', 'orderQty': 20, 'leavesQty': 0, 'price': 1100,
+             'execInst': None},
+        ])
+
+    def test_only_open_orders(self):
+        orders = self.table.open_orders()
+        self.assertEqual(['1'], [o.order_id for o in orders])
+        self.assertTrue(orders[0].passive)
+
+    def test_orders_are_reused(self):
+        self.assertIs(self.table.open_orders()[0], self.table.open_orders()[0])
+
+    def test_update_refreshes_order(self):
+        first = self.table.open_orders()[0]
+        self.table.update(self.table.find({'orderID': '1'}), {'orderID': '1', 'price': 1001})
+
+        second = self.table.open_orders()[0]
+        self.assertIsNot(first, second)
+        self.assertEqual(1001, second.price)
+
+    def test_order_opened_and_closed(self):
+        self.table.update(self.table.find({'orderID': '2'}), {'orderID': '2', 'leavesQty': 20})
+        self.assertEqual(['1', '2'], [o.order_id for o in self.table.open_orders()])
+
+        self.table.update(self.table.find({'orderID': '1'}), {'orderID': '1', 'leavesQty': 0})
+        self.table.delete({'orderID': '2'})
+        self.assertEqual([], self.table.open_orders())
+
+
+class OrderBookTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.book = OrderBook()
+        self.book.set_keys(['symbol', 'id', 'side'])
+        self.book.insert([
+            {'symbol': 'XBTUSD', 'id': 1, 'side': 'Sell', 'size': 10, 'price': 1002},
+            {'symbol': 'XBTUSD', 'id': 2, 'side': 'Sell', 'size': 20, 'price': 1001},
+            {'symbol': 'XBTUSD', 'id': 3, 'side': 'Buy', 'size': 30, 'price': 999},
+            {'symbol': 'XBTUSD', 'id': 4, 'side': 'Buy', 'size': 40, 'price': 1000},
+            {'symbol': 'XBTUSD', 'id': 5, 'side': 'Buy', 'size': 50, 'price': 998},
+        ])
+
+    def test_best_prices(self):
+        self.assertEqual(1000, self.book.best_bid()['price'])
+        self.assertEqual(1001, self.book.best_ask()['price'])
+        self.assertEqual(1000.5, self.book.mid_price())
+        self.assertEqual(1, self.book.spread())
+
+    def test_top_levels(self):
+        self.assertEqual([1000, 999], [level['price'] for level in self.book.bids(2)])
+        self.assertEqual([1001, 1002], [level['price'] for level in self.book.asks(5)])
+        self.assertEqual([], self.book.bids(0))
+
+    def test_levels_with_uneven_sides(self):
+        levels = self.book.levels(3)
+        self.assertEqual([998, 999, 1000, 1001, 1002], [level['price'] for level in levels])
+
+    def test_cumulative_depth(self):
+        self.assertEqual([(1000, 40), (999, 70)], self.book.cumulative_depth('Buy', 2))
+        self.assertEqual([(1001, 20), (1002, 30)], self.book.cumulative_depth('Sell'))
+
+    def test_update_size(self):
+        item = self.book.find({'symbol': 'XBTUSD', 'id': 4, 'side': 'Buy'})
+        self.book.update(item, {'symbol': 'XBTUSD', 'id': 4, 'side': 'Buy', 'size': 1})
+        self.assertEqual(1, self.book.best_bid()['size'])
+
+    def test_update_price(self):
+        item = self.book.find({'symbol': 'XBTUSD', 'id': 5, 'side': 'Buy'})
+        self.book.update(item, {'symbol': 'XBTUSD', 'id': 5, 'side': 'Buy', 'price': 1000.5})
+        self.assertEqual([1000.5, 1000, 999], [level['price'] for level in self.book.bids()])
+
+    def test_delete(self):
+        self.book.delete({'symbol': 'XBTUSD', 'id': 4, 'side': 'Buy'})
+        self.assertEqual(999, self.book.best_bid()['price'])
+        self.assertEqual(4, len(self.book))
+
+    def test_empty_side(self):
+        self.book.delete({'symbol': 'XBTUSD', 'id': 1, 'side': 'Sell'})
+        self.book.delete({'symbol': 'XBTUSD', 'id': 2, 'side': 'Sell'})
+        self.assertIsNone(self.book.best_ask())
+        self.assertIsNone(self.book.mid_price())
+        self.assertIsNone(self.book.spread())
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import Mock, patch
 
 from supervisor.core.orders import Order
+from supervisor.core.price_feed import PriceFeed
 from supervisor.core.trailing_orders import TrailingShell
 from supervisor.core.utils.math import to_nearest
 
@@ -63,3 +64,31 @@ class TrailingShellMethodsTests(unittest.TestCase):
         # assert order was moved
         expected_price = to_nearest(999 * 1.1, 0.5)
         self.assertEqual(expected_price, self.order.stop_px)
+
+
+class TrailingShellPriceFeedTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.feed = PriceFeed()
+        self.on_move = Mock()
+        self.order = Order(order_type='Stop', qty=228, stop_px=900, side='Sell')
+        self.trailing_order = TrailingShell(order=self.order, offset=10, tick_size=0.5,
+                                            price_feed=self.feed, on_move=self.on_move)
+
+    def tearDown(self):
+        self.trailing_order.exit()
+
+    def test_no_own_websocket(self):
+        self.assertIsNone(self.trailing_order.ws)
+        self.assertEqual(1, self.feed.subscribers('XBTUSD'))
+
+    def test_follow_feed_prices(self):
+        self.trailing_order.start_trailing(initial_price=1000)
+        self.feed.publish('XBTUSD', 1100)
+
+        self.assertEqual(1100, self.trailing_order.last_price)
+        self.assertEqual(to_nearest(1100 * 0.9, 0.5), self.order.stop_px)
+        self.on_move.assert_called_once()
+
+    def test_unsubscribe_on_exit(self):
+        self.trailing_order.exit()
+        self.assertEqual(0, self.feed.subscribers('XBTUSD'))
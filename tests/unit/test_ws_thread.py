@@ -0,0 +1,399 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import Mock, call
+
+from supervisor.core.orders import Order
+from supervisor.core.trailing_orders import TrailingShell
+from supervisor.core.utils.math import to_nearest
+from supervisor.core.ws_thread import BitMEXWebsocket
+
+
+class WebsocketTablesTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None)
+        self.send({
+            'table': 'order',
+            'action': 'partial',
+            'keys': ['orderID'],
+            'data': [
+                {'orderID': '1', 'symbol': 'XBTUSD', 'leavesQty': 10, 'cumQty': 0, 'ordStatus': 'New'},
+                {'orderID': '2', 'symbol': 'XBTUSD', 'leavesQty': 20, 'cumQty': 0, 'ordStatus': 'New'},
+            ]
+        })
+
+    def send(self, message):
+        self.ws._BitMEXWebsocket__on_message(json.dumps(message))
+
+    def test_partial(self):
+        self.assertEqual(2, len(self.ws.open_orders()))
+
+    def test_order_statuses(self):
+        self.send({
+            'table': 'order',
+            'action': 'update',
+            'data': [{'orderID': '2', 'ordStatus': 'Filled', 'leavesQty': 0}]
+        })
+        self.assertEqual('Filled', self.ws.get_order_status(order_id='2'))
+        self.assertEqual(['New', None, 'Filled'], self.ws.get_order_statuses([('1', None), ('3', None), ('2', None)]))
+
+    def test_insert(self):
+        self.send({
+            'table': 'order',
+            'action': 'insert',
+            'data': [{'orderID': '3', 'symbol': 'XBTUSD', 'leavesQty': 30, 'cumQty': 0, 'ordStatus': 'New'}]
+        })
+        self.assertEqual(['1', '2', '3'], [o['orderID'] for o in self.ws.open_orders()])
+
+    def test_update(self):
+        self.send({
+            'table': 'order',
+            'action': 'update',
+            'data': [{'orderID': '2', 'leavesQty': 0, 'ordStatus': 'Canceled'}]
+        })
+        self.assertEqual(['1'], [o['orderID'] for o in self.ws.open_orders()])
+        self.assertEqual(['2'], [o['orderID'] for o in self.ws.canceled_orders()])
+
+    def test_update_unknown_row(self):
+        self.send({
+            'table': 'order',
+            'action': 'update',
+            'data': [{'orderID': '5', 'leavesQty': 0}]
+        })
+        self.assertEqual(2, len(self.ws.open_orders()))
+
+    def test_delete(self):
+        self.send({
+            'table': 'order',
+            'action': 'delete',
+            'data': [{'orderID': '1'}]
+        })
+        self.assertEqual(['2'], [o['orderID'] for o in self.ws.get_orders('XBTUSD')])
+
+
+class WebsocketOrderBookTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None)
+        asks = [{'symbol': 'XBTUSD', 'id': i, 'side': 'Sell', 'size': 10, 'price': 1000 + i} for i in range(1, 26)]
+        bids = [{'symbol': 'XBTUSD', 'id': 100 + i, 'side': 'Buy', 'size': 10, 'price': 1000 - i} for i in range(3)]
+        self.ws._BitMEXWebsocket__on_message(json.dumps({
+            'table': 'orderBookL2_25',
+            'action': 'partial',
+            'keys': ['symbol', 'id', 'side'],
+            'data': asks + bids
+        }))
+
+    def test_get_order_book_with_short_side(self):
+        levels = self.ws.get_order_book(depth=1)
+        self.assertEqual([1000, 1001], [level['price'] for level in levels])
+
+    def test_get_order_book_depth(self):
+        levels = self.ws.get_order_book(depth=5)
+        self.assertEqual([998, 999, 1000, 1001, 1002, 1003, 1004, 1005], [level['price'] for level in levels])
+
+    def test_book_follows_deltas(self):
+        self.ws._BitMEXWebsocket__on_message(json.dumps({
+            'table': 'orderBookL2_25',
+            'action': 'delete',
+            'data': [{'symbol': 'XBTUSD', 'id': 100, 'side': 'Buy'}]
+        }))
+        self.assertEqual(999, self.ws.get_order_book_l2().best_bid()['price'])
+
+
+class WebsocketInstrumentTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None)
+        self.ws._BitMEXWebsocket__on_message(json.dumps({
+            'table': 'instrument',
+            'action': 'partial',
+            'keys': ['symbol'],
+            'data': [
+                {'symbol': '.BXBT', 'tickSize': 0.01, 'markPrice': 9999.99, 'lastPrice': None,
+                 'bidPrice': None, 'askPrice': None},
+                {'symbol': 'XBTUSD', 'tickSize': 0.5, 'markPrice': 10000, 'lastPrice': 10000,
+                 'bidPrice': 9999.5, 'askPrice': 10000.5},
+            ]
+        }))
+
+    def test_get_instrument(self):
+        instrument = self.ws.get_instrument('XBTUSD')
+        self.assertEqual(1, instrument['tickLog'])
+        with self.assertRaises(Exception):
+            self.ws.get_instrument('ETHUSD')
+
+    def test_get_ticker(self):
+        self.ws._BitMEXWebsocket__on_message(json.dumps({
+            'table': 'instrument',
+            'action': 'update',
+            'data': [{'symbol': 'XBTUSD', 'lastPrice': 10001, 'bidPrice': 10000.5, 'askPrice': 10001.5}]
+        }))
+        ticker = self.ws.get_ticker('XBTUSD')
+        self.assertEqual({'last': 10001, 'buy': 10000.5, 'sell': 10001.5, 'mid': 10001}, ticker)
+
+    def test_get_index_ticker(self):
+        ticker = self.ws.get_ticker('.BXBT')
+        self.assertEqual(9999.99, ticker['last'])
+
+    def test_get_tick_size(self):
+        self.assertEqual(0.5, self.ws.get_tick_size('XBTUSD'))
+
+
+class WebsocketRingTablesTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None,
+                                  table_capacity={'trade': 3})
+        self.send({'table': 'trade', 'action': 'partial', 'keys': [], 'data': []})
+        self.send({'table': 'execution', 'action': 'partial', 'keys': ['execID'], 'data': []})
+
+    def send(self, message):
+        self.ws._BitMEXWebsocket__on_message(json.dumps(message))
+
+    def test_trade_capacity(self):
+        for i in range(10):
+            self.send({'table': 'trade', 'action': 'insert', 'data': [{'symbol': 'XBTUSD', 'price': i}]})
+        self.assertEqual([7, 8, 9], [trade['price'] for trade in self.ws.recent_trades()])
+
+    def test_executions_kept_separately(self):
+        self.send({'table': 'execution', 'action': 'insert', 'data': [
+            {'execID': '1', 'symbol': 'XBTUSD', 'clOrdID': 'cl1', 'execComm': 1, 'text': ''}]})
+        for i in range(10):
+            self.send({'table': 'trade', 'action': 'insert', 'data': [{'symbol': 'XBTUSD', 'price': i}]})
+        self.assertEqual(1, len(self.ws.get_execution('cl1', 'XBTUSD')))
+        self.assertEqual(1000, self.ws.data['execution'].capacity)
+
+
+class WebsocketListenersTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None)
+
+    def send(self, message):
+        self.ws._BitMEXWebsocket__on_message(json.dumps(message))
+
+    def test_listener_called_on_table_change(self):
+        callback = Mock()
+        self.ws.add_listener(callback, tables=['order'])
+        self.send({'table': 'order', 'action': 'partial', 'keys': ['orderID'], 'data': []})
+        self.send({'table': 'trade', 'action': 'partial', 'keys': [], 'data': []})
+
+        callback.assert_called_once_with('order')
+
+    def test_remove_listener(self):
+        callback = Mock()
+        self.ws.add_listener(callback)
+        self.ws.remove_listener(callback)
+        self.send({'table': 'order', 'action': 'partial', 'keys': ['orderID'], 'data': []})
+
+        callback.assert_not_called()
+
+    def test_failing_listener_does_not_break_handler(self):
+        self.ws.add_listener(Mock(side_effect=RuntimeError))
+        self.send({'table': 'order', 'action': 'partial', 'keys': ['orderID'], 'data': [{'orderID': '1'}]})
+
+        self.assertEqual(1, len(self.ws.data['order']))
+
+
+class WebsocketPriceFeedTests(unittest.TestCase):
+
+    def test_instrument_prices_published(self):
+        ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None)
+        callback = Mock()
+        ws.price_feed.subscribe('XBTUSD', callback)
+
+        ws._BitMEXWebsocket__on_message(json.dumps({
+            'table': 'instrument', 'action': 'partial', 'keys': ['symbol'],
+            'data': [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10000}]
+        }))
+        ws._BitMEXWebsocket__on_message(json.dumps({
+            'table': 'instrument', 'action': 'update',
+            'data': [{'symbol': 'XBTUSD', 'lastPrice': 10001}]
+        }))
+        ws._BitMEXWebsocket__on_message(json.dumps({
+            'table': 'instrument', 'action': 'update',
+            'data': [{'symbol': 'XBTUSD', 'markPrice': 10002}]
+        }))
+
+        self.assertEqual([call(10000), call(10001)], callback.call_args_list)
+
+
+class WebsocketStartupTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None, partials_timeout=5)
+        self.ws._connect_started = time.perf_counter()
+
+    def wait_for_partials(self, tables):
+        self.ws._BitMEXWebsocket__wait_for_partials(tables)
+
+    def send_later(self, message, delay=0.05):
+        timer = threading.Timer(delay, self.ws._BitMEXWebsocket__on_message, [json.dumps(message)])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_returns_as_soon_as_partials_arrive(self):
+        self.send_later({'table': 'trade', 'action': 'partial', 'keys': [], 'data': []})
+        self.send_later({'table': 'instrument', 'action': 'partial', 'keys': ['symbol'], 'data': []}, delay=0.1)
+
+        started = time.perf_counter()
+        self.wait_for_partials(('instrument', 'trade'))
+
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual({'instrument', 'trade'}, set(self.ws.startup_metrics['partials']))
+
+    def test_partials_timeout(self):
+        self.ws.partials_timeout = 0.05
+        with self.assertRaises(SystemExit):
+            self.wait_for_partials(('instrument',))
+
+    def test_exit_wakes_up_waiting(self):
+        timer = threading.Timer(0.05, self.ws.exit)
+        timer.start()
+
+        started = time.perf_counter()
+        with self.assertRaises(SystemExit):
+            self.wait_for_partials(('instrument',))
+        self.assertLess(time.perf_counter() - started, 1)
+
+
+class WebsocketHeartbeatTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None, pong_timeout=0.05)
+
+    def test_pong_latency(self):
+        self.ws._ping_sent_at = time.monotonic() - 0.01
+        self.ws._BitMEXWebsocket__on_frame('pong')
+
+        self.assertIsNone(self.ws._ping_sent_at)
+        self.assertEqual(1, self.ws.latency.snapshot()['count'])
+        self.assertGreaterEqual(self.ws.latency.snapshot()['max'], 0.01)
+
+    def test_stale_without_pong(self):
+        self.assertFalse(self.ws.is_stale())
+        self.ws._ping_sent_at = time.monotonic() - 0.1
+        self.assertTrue(self.ws.is_stale())
+
+    def test_no_pong_timeout_while_reader_blocked(self):
+        # the reader waits for room in the full queue and can't read the pong
+        self.ws._ping_sent_at = time.monotonic() - 0.1
+        self.ws._reader_blocked = True
+        self.assertFalse(self.ws.is_stale())
+
+        # the pong timeout counts from the moment the reader is unblocked
+        self.ws._reader_blocked = False
+        self.ws._reader_unblocked_at = time.monotonic()
+        self.assertFalse(self.ws.is_stale())
+        time.sleep(0.1)
+        self.assertTrue(self.ws.is_stale())
+
+
+class WebsocketConflationTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.ws = BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None,
+                                  conflate={'instrument': 0, 'quote': 60})
+        self.send({
+            'table': 'instrument', 'action': 'partial', 'keys': ['symbol'],
+            'data': [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 10000, 'markPrice': 10000},
+                     {'symbol': 'ETHUSD', 'tickSize': 0.05, 'lastPrice': 200, 'markPrice': 200}]
+        })
+        self.send({'table': 'quote', 'action': 'partial', 'keys': [], 'data': []})
+
+    def send(self, message):
+        self.ws._BitMEXWebsocket__on_message(json.dumps(message))
+
+    def update_instrument(self, **data):
+        self.send({'table': 'instrument', 'action': 'update', 'data': [dict(data)]})
+
+    def test_updates_merged_until_read(self):
+        for price in range(10001, 10011):
+            self.update_instrument(symbol='XBTUSD', lastPrice=price)
+        self.update_instrument(symbol='XBTUSD', markPrice=10005)
+        self.update_instrument(symbol='ETHUSD', lastPrice=201)
+
+        # nothing applied yet
+        self.assertEqual(10000, self.ws.data['instrument'].by_symbol('XBTUSD')['lastPrice'])
+
+        instrument = self.ws.get_instrument('XBTUSD')
+        self.assertEqual(10010, instrument['lastPrice'])
+        self.assertEqual(10005, instrument['markPrice'])
+        self.assertEqual(201, self.ws.get_instrument('ETHUSD')['lastPrice'])
+        self.assertEqual({'received': 12, 'merged': 10, 'applied': 2, 'pending': 0},
+                         self.ws.conflation_metrics()['instrument'])
+
+    def test_last_price_published_on_merge(self):
+        callback = Mock()
+        self.ws.price_feed.subscribe('XBTUSD', callback)
+        self.update_instrument(symbol='XBTUSD', lastPrice=10001)
+        self.update_instrument(symbol='XBTUSD', lastPrice=10002)
+        self.assertEqual([call(10001), call(10002)], callback.call_args_list)
+
+        # applying the merged update doesn't publish the price again
+        self.ws.get_tick_size('XBTUSD')
+        self.assertEqual(2, callback.call_count)
+
+    def test_trailing_order_follows_conflated_prices(self):
+        order = Order(order_type='Stop', qty=228, stop_px=9000, side='Sell')
+        tracker = TrailingShell(order=order, offset=10, tick_size=0.5, price_feed=self.ws.price_feed)
+        self.addCleanup(tracker.exit)
+        tracker.start_trailing(initial_price=10000)
+
+        self.update_instrument(symbol='XBTUSD', lastPrice=11000)
+
+        self.assertEqual(to_nearest(11000 * 0.9, 0.5), order.stop_px)
+        self.assertEqual(1, self.ws.conflation_metrics()['instrument']['pending'])
+
+    def test_quotes_conflated_by_symbol(self):
+        for bid in range(10):
+            self.send({'table': 'quote', 'action': 'insert', 'data': [{'symbol': 'XBTUSD', 'bidPrice': bid}]})
+        self.assertEqual(0, len(self.ws.data['quote']))
+
+        self.ws.flush_conflated()
+        self.assertEqual([{'symbol': 'XBTUSD', 'bidPrice': 9}], list(self.ws.data['quote']))
+
+    def test_flush_on_interval(self):
+        listener = Mock()
+        self.ws.add_listener(listener, tables=['quote'])
+        self.ws.conflate['quote'] = 0.01
+        self.send({'table': 'quote', 'action': 'insert', 'data': [{'symbol': 'XBTUSD', 'bidPrice': 1}]})
+        listener.assert_not_called()
+
+        time.sleep(0.02)
+        self.ws._BitMEXWebsocket__flush_due()
+        listener.assert_called_once_with('quote')
+        self.assertEqual(1, len(self.ws.data['quote']))
+
+    def test_other_actions_keep_order(self):
+        self.update_instrument(symbol='ETHUSD', lastPrice=201)
+        self.send({'table': 'instrument', 'action': 'delete', 'data': [{'symbol': 'ETHUSD'}]})
+        self.send({'table': 'instrument', 'action': 'partial', 'keys': ['symbol'],
+                   'data': [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 9000}]})
+        self.update_instrument(symbol='XBTUSD', lastPrice=9001)
+        self.send({'table': 'instrument', 'action': 'partial', 'keys': ['symbol'],
+                   'data': [{'symbol': 'XBTUSD', 'tickSize': 0.5, 'lastPrice': 9002}]})
+
+        # the update before the delete was applied, the one before the new image was dropped
+        self.assertEqual(1, self.ws.conflation_metrics()['instrument']['applied'])
+        self.assertEqual(9002, self.ws.get_instrument('XBTUSD')['lastPrice'])
+
+    def test_listener_reads_table_on_flush(self):
+        self.ws.conflate['quote'] = 0.01
+        prices = []
+        self.ws.add_listener(lambda table: prices.append(self.ws.get_instrument('XBTUSD')['lastPrice']),
+                             tables=['quote'])
+        self.update_instrument(symbol='XBTUSD', lastPrice=10001)
+        self.send({'table': 'quote', 'action': 'insert', 'data': [{'symbol': 'XBTUSD', 'bidPrice': 1}]})
+
+        # the listener flushes pending instrument updates while quotes are being flushed
+        time.sleep(0.02)
+        self.ws._BitMEXWebsocket__flush_due()
+        self.assertEqual([10001], prices)
+
+    def test_event_tables_not_conflated(self):
+        with self.assertRaises(ValueError):
+            BitMEXWebsocket('https://testnet.bitmex.com/api/v1', None, None, conflate={'trade': 0.1})
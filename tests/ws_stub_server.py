@@ -0,0 +1,177 @@
+"""Local websocket server which imitates the BitMEX realtime API for tests.
+
+Every new connection gets the configured table partials, like a subscription
+in the connection querystring does on the exchange, and 'ping' messages are
+answered with 'pong'. Connections may be dropped without a close frame to
+imitate network failures.
+"""
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class WebsocketStub:
+
+    API_PATH = '/api/v1'
+
+    def __init__(self):
+        self.partials = {}  # table -> (keys, rows), sent on every connection
+        self.partial_delay = 0  # seconds before the partials are sent
+        self.answer_pings = True  # set to False to imitate a half-open connection
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.clients = []
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.stopped = False
+
+    @property
+    def url(self):
+        """Base URL of the REST API, the client turns it into the realtime URL."""
+        return 'http://127.0.0.1:%d%s' % (self.server.getsockname()[1], self.API_PATH)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self.drop()
+        # close() doesn't wake up a blocked accept(), which would then take connections of a socket reusing the fd
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def add_partial(self, table, rows, keys=None):
+        self.partials[table] = (keys or [], rows)
+
+    def send(self, message):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            self._send_frame(client, json.dumps(message).encode('utf8'))
+
+    def drop(self):
+        """Close all connections without a close frame."""
+
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+    def _accept(self):
+        while not self.stopped:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        try:
+            self._handshake(client)
+        except OSError:
+            client.close()
+            return
+        with self.lock:
+            if self.stopped:
+                client.close()
+                return
+            self.connections += 1
+            self.clients.append(client)
+
+        time.sleep(self.partial_delay)
+        for table, (keys, rows) in list(self.partials.items()):
+            self._send_frame(client, json.dumps({'table': table, 'action': 'partial', 'keys': keys,
+                                                 'data': rows}).encode('utf8'))
+        self._read_frames(client)
+
+    @staticmethod
+    def _handshake(client):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = client.recv(4096)
+            if not chunk:
+                raise OSError('Connection closed during handshake')
+            request += chunk
+
+        key = ''
+        for line in request.decode('latin1').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sec-websocket-key':
+                key = value.strip()
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        client.sendall(('HTTP/1.1 101 Switching Protocols\r\n'
+                        'Upgrade: websocket\r\n'
+                        'Connection: Upgrade\r\n'
+                        'Sec-WebSocket-Accept: %s\r\n\r\n' % accept).encode('ascii'))
+
+    def _read_frames(self, client):
+        """Read client frames, answer pings and close frames."""
+
+        try:
+            while True:
+                header = self._recv_exact(client, 2)
+                opcode = header[0] & 0x0f
+                length = header[1] & 0x7f
+                if length == 126:
+                    length = struct.unpack('!H', self._recv_exact(client, 2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', self._recv_exact(client, 8))[0]
+                mask = self._recv_exact(client, 4) if header[1] & 0x80 else b'\0\0\0\0'
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv_exact(client, length)))
+
+                if opcode == 0x8:
+                    self._send_frame(client, payload, opcode=0x8)
+                    break
+                if opcode == 0x9:
+                    self._send_frame(client, payload, opcode=0xA)
+                if opcode == 0x1 and payload == b'ping' and self.answer_pings:
+                    self._send_frame(client, b'pong')
+        except OSError:
+            pass
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        client.close()
+
+    @staticmethod
+    def _recv_exact(client, size):
+        data = b''
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                raise OSError('Connection closed')
+            data += chunk
+        return data
+
+    @staticmethod
+    def _send_frame(client, payload, opcode=0x1):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        try:
+            client.sendall(header + payload)
+        except OSError:
+            pass